@@ -1,4 +1,5 @@
 from starlette.config import Config
+from starlette.datastructures import CommaSeparatedStrings, Secret
 
 config = Config(".env")
 
@@ -7,5 +8,215 @@ DEBUG: bool = config("DEBUG", default=False)
 
 DATABASE_URI = config("DATABASE_URI")
 CONNECTION_POOL_SIZE = config("CONNECTION_POOL_SIZE", default=20)
+# Comma separated shard URIs, pool of `CONNECTION_POOL_SIZE` is opened per shard.
+# Empty value keeps all data in `DATABASE_URI`. Shards order must never change.
+SHARD_URIS: CommaSeparatedStrings = config(
+    "SHARD_URIS", cast=CommaSeparatedStrings, default=""
+)
+SHARD_OUTBOX_RELAY_INTERVAL_SECONDS: float = config(
+    "SHARD_OUTBOX_RELAY_INTERVAL_SECONDS", cast=float, default=1
+)
+SHARD_OUTBOX_RELAY_BATCH_SIZE: int = config(
+    "SHARD_OUTBOX_RELAY_BATCH_SIZE", cast=int, default=100
+)
 TOKEN_TTL_SECONDS = config("TOKEN_TTL", default=60 * 60 * 24)
 TOKEN_BYTES_LENGTH = config("TOKEN_BYTES_LENGTH", default=32)
+
+# "opaque" tokens are random strings validated against `users.token`,
+# "signed" tokens are HMAC-signed and validated without database lookups.
+TOKEN_FORMAT: str = config("TOKEN_FORMAT", default="opaque")
+TOKEN_SECRET_KEY: Secret = config("TOKEN_SECRET_KEY", cast=Secret, default="")
+TOKEN_REVOCATIONS_REFRESH_SECONDS: float = config(
+    "TOKEN_REVOCATIONS_REFRESH_SECONDS", cast=float, default=30
+)
+# Sliding expiration extends opaque tokens to `TOKEN_TTL` since last use. Token is
+# refreshed at most once per interval, refreshes are written in batches per flush.
+TOKEN_SLIDING_EXPIRATION: bool = config(
+    "TOKEN_SLIDING_EXPIRATION", cast=bool, default=False
+)
+TOKEN_REFRESH_INTERVAL_SECONDS: int = config(
+    "TOKEN_REFRESH_INTERVAL_SECONDS", cast=int, default=5 * 60
+)
+TOKEN_REFRESH_FLUSH_INTERVAL_SECONDS: float = config(
+    "TOKEN_REFRESH_FLUSH_INTERVAL_SECONDS", cast=float, default=1
+)
+
+# "stored" confirmation URLs are random strings looked up in `sendings`,
+# "signed" ones are HMAC-signed with `TOKEN_SECRET_KEY` and stored nowhere.
+SENDING_CONFIRMATION_FORMAT: str = config(
+    "SENDING_CONFIRMATION_FORMAT", default="stored"
+)
+SENDING_CONFIRMATION_TTL_SECONDS: int = config(
+    "SENDING_CONFIRMATION_TTL_SECONDS", cast=int, default=60 * 60 * 24 * 7
+)
+
+# Operations accepted by one POST /batch request.
+BATCH_MAX_OPERATIONS: int = config("BATCH_MAX_OPERATIONS", cast=int, default=50)
+
+# Recipients' user ids are cached by login, unknown logins only briefly.
+LOGIN_ID_CACHE_SIZE: int = config("LOGIN_ID_CACHE_SIZE", cast=int, default=100000)
+LOGIN_ID_CACHE_NEGATIVE_TTL_SECONDS: float = config(
+    "LOGIN_ID_CACHE_NEGATIVE_TTL_SECONDS", cast=float, default=5
+)
+
+# Key derivation runs in "process" or "thread" pool out of the event loop.
+PASSWORD_HASHING_EXECUTOR: str = config("PASSWORD_HASHING_EXECUTOR", default="process")
+PASSWORD_HASHING_WORKERS: int = config("PASSWORD_HASHING_WORKERS", cast=int, default=2)
+PASSWORD_HASHING_MAX_CONCURRENCY: int = config(
+    "PASSWORD_HASHING_MAX_CONCURRENCY", cast=int, default=4
+)
+
+IDEMPOTENCY_KEY_TTL_SECONDS: int = config(
+    "IDEMPOTENCY_KEY_TTL_SECONDS", cast=int, default=60 * 60 * 24
+)
+# Reserved key is taken over by a retry once its lease expires unanswered.
+IDEMPOTENCY_LEASE_SECONDS: int = config(
+    "IDEMPOTENCY_LEASE_SECONDS", cast=int, default=60
+)
+IDEMPOTENCY_CACHE_SIZE: int = config("IDEMPOTENCY_CACHE_SIZE", cast=int, default=10000)
+IDEMPOTENCY_WAIT_TIMEOUT_SECONDS: float = config(
+    "IDEMPOTENCY_WAIT_TIMEOUT_SECONDS", cast=float, default=10
+)
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS: float = config(
+    "IDEMPOTENCY_PURGE_INTERVAL_SECONDS", cast=float, default=60 * 60
+)
+
+# Per-token limits "[METHOD ]<path>=<tokens per second>:<burst>" separated by ";",
+# e.g. "POST /items/new=5:10;*=50:100". Empty value disables rate limiting.
+RATE_LIMITS: str = config("RATE_LIMITS", default="")
+RATE_LIMITER_MAX_BUCKETS: int = config(
+    "RATE_LIMITER_MAX_BUCKETS", cast=int, default=100000
+)
+
+# Event loop lag sampling, and threshold to report stack of callback blocking
+# the loop at, zero disables reporting.
+LOOP_LAG_INTERVAL_SECONDS: float = config(
+    "LOOP_LAG_INTERVAL_SECONDS", cast=float, default=0.1
+)
+LOOP_SLOW_CALLBACK_SECONDS: float = config(
+    "LOOP_SLOW_CALLBACK_SECONDS", cast=float, default=0.25
+)
+
+# Shards are pinged in background, readiness fails on checks older than max age
+# and, unless zero, on replicas lagging more than max replication lag.
+HEALTH_CHECK_INTERVAL_SECONDS: float = config(
+    "HEALTH_CHECK_INTERVAL_SECONDS", cast=float, default=2
+)
+HEALTH_CHECK_TIMEOUT_SECONDS: float = config(
+    "HEALTH_CHECK_TIMEOUT_SECONDS", cast=float, default=1
+)
+HEALTH_CHECK_MAX_AGE_SECONDS: float = config(
+    "HEALTH_CHECK_MAX_AGE_SECONDS", cast=float, default=10
+)
+HEALTH_MAX_REPLICATION_LAG_SECONDS: float = config(
+    "HEALTH_MAX_REPLICATION_LAG_SECONDS", cast=float, default=0
+)
+# On shutdown readiness fails this long before pools are closed.
+SHUTDOWN_DRAIN_SECONDS: float = config("SHUTDOWN_DRAIN_SECONDS", cast=float, default=5)
+
+# Statement timeouts "[METHOD ]<route path template>=<seconds>" separated by ";",
+# e.g. "GET /items=2;POST /send=5;*=10", the first matching one applies.
+# Deadline of request is shared by all its statements. Empty value disables them.
+ROUTE_STATEMENT_TIMEOUTS: str = config("ROUTE_STATEMENT_TIMEOUTS", default="")
+# Cancel handling of requests, with their running queries, once client is gone.
+CANCEL_ON_DISCONNECT: bool = config("CANCEL_ON_DISCONNECT", cast=bool, default=True)
+
+# Admission control thresholds, zero disables the check.
+LOAD_SHEDDING_MAX_POOL_WAITERS: int = config(
+    "LOAD_SHEDDING_MAX_POOL_WAITERS", cast=int, default=40
+)
+LOAD_SHEDDING_MAX_LOOP_LAG_SECONDS: float = config(
+    "LOAD_SHEDDING_MAX_LOOP_LAG_SECONDS", cast=float, default=0.5
+)
+LOAD_SHEDDING_RETRY_AFTER_SECONDS: int = config(
+    "LOAD_SHEDDING_RETRY_AFTER_SECONDS", cast=int, default=1
+)
+
+# Responses of at least this many bytes are compressed with brotli, if installed,
+# or gzip, as accepted by client. Zero size disables compression.
+COMPRESSION_MINIMUM_SIZE: int = config(
+    "COMPRESSION_MINIMUM_SIZE", cast=int, default=1024
+)
+COMPRESSION_GZIP_LEVEL: int = config("COMPRESSION_GZIP_LEVEL", cast=int, default=5)
+COMPRESSION_BROTLI_QUALITY: int = config(
+    "COMPRESSION_BROTLI_QUALITY", cast=int, default=4
+)
+
+# Coalesce concurrent item inserts into multi-row statements, opt-in.
+ITEM_CREATE_BATCHING: bool = config("ITEM_CREATE_BATCHING", cast=bool, default=False)
+ITEM_CREATE_BATCH_WINDOW_SECONDS: float = config(
+    "ITEM_CREATE_BATCH_WINDOW_SECONDS", cast=float, default=0.002
+)
+ITEM_CREATE_BATCH_MAX_SIZE: int = config(
+    "ITEM_CREATE_BATCH_MAX_SIZE", cast=int, default=100
+)
+
+# Deleted items are marked with `deleted_at` and purged in background, opt-in.
+ITEM_SOFT_DELETE: bool = config("ITEM_SOFT_DELETE", cast=bool, default=False)
+ITEM_PURGE_INTERVAL_SECONDS: float = config(
+    "ITEM_PURGE_INTERVAL_SECONDS", cast=float, default=10
+)
+ITEM_PURGE_BATCH_SIZE: int = config("ITEM_PURGE_BATCH_SIZE", cast=int, default=1000)
+ITEM_PURGE_BATCH_PAUSE_SECONDS: float = config(
+    "ITEM_PURGE_BATCH_PAUSE_SECONDS", cast=float, default=0.1
+)
+
+ITEM_CHANGES_RETENTION_SECONDS: int = config(
+    "ITEM_CHANGES_RETENTION_SECONDS", cast=int, default=60 * 60 * 24 * 7
+)
+ITEM_CHANGES_COMPACTION_BATCH_SIZE: int = config(
+    "ITEM_CHANGES_COMPACTION_BATCH_SIZE", cast=int, default=5000
+)
+ITEM_CHANGES_COMPACTION_INTERVAL_SECONDS: float = config(
+    "ITEM_CHANGES_COMPACTION_INTERVAL_SECONDS", cast=float, default=60 * 10
+)
+
+# Token for /admin routes passed in `X-Admin-Token` header, empty disables them.
+ADMIN_TOKEN: Secret = config("ADMIN_TOKEN", cast=Secret, default="")
+BULK_IMPORT_BATCH_SIZE: int = config("BULK_IMPORT_BATCH_SIZE", cast=int, default=50000)
+# Imported plain text passwords are hashed by their own pool, so an import
+# doesn't queue ahead of logins and registrations in the same worker.
+BULK_IMPORT_HASHING_WORKERS: int = config(
+    "BULK_IMPORT_HASHING_WORKERS", cast=int, default=1
+)
+
+# Tracing is enabled by exporter: "jsonl" or "<module>:<factory>" returning one.
+# Sampled `traceparent` of callers is always continued.
+TRACING_EXPORTER: str = config("TRACING_EXPORTER", default="")
+TRACING_SAMPLE_RATE: float = config("TRACING_SAMPLE_RATE", cast=float, default=0.01)
+TRACING_JSONL_PATH: str = config("TRACING_JSONL_PATH", default="traces.jsonl")
+TRACING_MAX_PENDING_SPANS: int = config(
+    "TRACING_MAX_PENDING_SPANS", cast=int, default=10000
+)
+TRACING_EXPORT_INTERVAL_SECONDS: float = config(
+    "TRACING_EXPORT_INTERVAL_SECONDS", cast=float, default=1
+)
+
+# Sampling profiler of requests, also toggled by `PROFILING_TOGGLE_SIGNAL` to a
+# worker. Profiles of sampled requests slower than threshold are kept.
+PROFILING_ENABLED: bool = config("PROFILING_ENABLED", cast=bool, default=False)
+PROFILING_TOGGLE_SIGNAL: str = config("PROFILING_TOGGLE_SIGNAL", default="SIGUSR2")
+PROFILING_SAMPLE_RATE: float = config("PROFILING_SAMPLE_RATE", cast=float, default=0.1)
+PROFILING_LATENCY_THRESHOLD_SECONDS: float = config(
+    "PROFILING_LATENCY_THRESHOLD_SECONDS", cast=float, default=0
+)
+PROFILING_INTERVAL_SECONDS: float = config(
+    "PROFILING_INTERVAL_SECONDS", cast=float, default=0.005
+)
+PROFILING_DIR: str = config("PROFILING_DIR", default="profiles")
+PROFILING_MAX_BYTES: int = config(
+    "PROFILING_MAX_BYTES", cast=int, default=100 * 1024 * 1024
+)
+PROFILING_FLUSH_INTERVAL_SECONDS: float = config(
+    "PROFILING_FLUSH_INTERVAL_SECONDS", cast=float, default=60
+)
+
+SENDING_EVENTS_QUEUE_SIZE: int = config(
+    "SENDING_EVENTS_QUEUE_SIZE", cast=int, default=100
+)
+SENDING_EVENTS_HEARTBEAT_SECONDS: float = config(
+    "SENDING_EVENTS_HEARTBEAT_SECONDS", cast=float, default=15
+)
+SENDING_EVENTS_RECONNECT_SECONDS: float = config(
+    "SENDING_EVENTS_RECONNECT_SECONDS", cast=float, default=5
+)
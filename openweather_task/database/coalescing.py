@@ -0,0 +1,87 @@
+import asyncio
+import contextvars
+from typing import (
+    Awaitable,
+    Callable,
+    Generic,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from openweather_task import metrics
+
+__all__ = ["WriteCoalescer"]
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+coalesced_batch_size = metrics.histogram(
+    "coalesced_write_batch_size",
+    "Number of writes flushed in one statement",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500),
+)
+
+
+class WriteCoalescer(Generic[T, R]):
+    """
+    Collects concurrent writes and flushes them with one `flush` call.
+
+    Batch is flushed after `window` seconds since its first write or as soon
+    as it reaches `max_size`. `flush` returns result per submitted value in
+    the same order, exception instances fail only corresponding callers.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flush: Callable[[List[T]], Awaitable[Sequence[R]]],
+        window: float,
+        max_size: int,
+    ) -> None:
+        self.name = name
+        self.flush = flush
+        self.window = window
+        self.max_size = max_size
+        self._pending: List[Tuple[T, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def submit(self, value: T) -> R:
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._pending.append((value, future))
+
+        if len(self._pending) >= self.max_size:
+            self._flush_pending()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush_pending)
+
+        return await future
+
+    def _flush_pending(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            # Empty context keeps flush off connection bound to the caller's
+            # context, which may be inside caller's transaction.
+            contextvars.Context().run(asyncio.ensure_future, self._flush(batch))
+
+    async def _flush(self, batch: List[Tuple[T, asyncio.Future]]) -> None:
+        coalesced_batch_size.observe(len(batch), writer=self.name)
+        try:
+            results = await self.flush([value for value, _ in batch])
+        except Exception as exc:
+            results = [exc] * len(batch)  # type: ignore
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
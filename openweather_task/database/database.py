@@ -1,9 +1,42 @@
+from typing import Dict
+
 import sqlalchemy
 from databases import Database
 
-from openweather_task.config import CONNECTION_POOL_SIZE, DATABASE_URI
+from openweather_task.config import CONNECTION_POOL_SIZE, DATABASE_URI, SHARD_URIS
+from openweather_task.database.sharding import ShardRouter
+from openweather_task.database.timeouts import DeadlineDatabase
 
-__all__ = ["database", "metadata"]
+__all__ = ["database", "in_transaction", "metadata", "pool_stats", "shards"]
 
-database = Database(DATABASE_URI, max_size=CONNECTION_POOL_SIZE)
+shards = ShardRouter(
+    [
+        DeadlineDatabase(uri, max_size=CONNECTION_POOL_SIZE)
+        for uri in list(SHARD_URIS) or [DATABASE_URI]
+    ]
+)
+# First shard, holds all data in unsharded deployments.
+database = shards.databases[0]
 metadata = sqlalchemy.MetaData()
+
+
+def pool_stats() -> Dict[str, int]:
+    """Returns connection pool stats summed over shards."""
+    stats = {"size": 0, "idle": 0, "max_size": 0, "waiters": 0}
+    for db in shards.databases:
+        pool = getattr(db._backend, "_pool", None)
+        if pool is None:
+            continue
+
+        stats["size"] += pool.get_size()
+        stats["idle"] += pool.get_idle_size()
+        stats["max_size"] += pool.get_max_size()
+        # asyncpg keeps free connections in asyncio.Queue, its getters are
+        # coroutines waiting for connection.
+        stats["waiters"] += len(getattr(pool._queue, "_getters", ()))
+    return stats
+
+
+def in_transaction(db: Database) -> bool:
+    """Returns whether current context runs inside transaction on `db`."""
+    return bool(db.connection()._transaction_stack)
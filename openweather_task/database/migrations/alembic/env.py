@@ -5,7 +5,7 @@ from sqlalchemy import pool
 
 from alembic import context
 
-from openweather_task.config import DATABASE_URI
+from openweather_task.config import DATABASE_URI, SHARD_URIS
 from openweather_task.database import models
 
 
@@ -62,19 +62,22 @@ def run_migrations_online():
 
     In this scenario we need to create an Engine
     and associate a connection with the context.
+    Every shard is migrated in turn.
 
     """
-    connectable = engine_from_config(
-        config.get_section(config.config_ini_section),
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
-    )
-
-    with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
-
-        with context.begin_transaction():
-            context.run_migrations()
+    for url in list(SHARD_URIS) or [DATABASE_URI]:
+        connectable = engine_from_config(
+            config.get_section(config.config_ini_section),
+            prefix="sqlalchemy.",
+            poolclass=pool.NullPool,
+            url=url,
+        )
+
+        with connectable.connect() as connection:
+            context.configure(connection=connection, target_metadata=target_metadata)
+
+            with context.begin_transaction():
+                context.run_migrations()
 
 
 if context.is_offline_mode():
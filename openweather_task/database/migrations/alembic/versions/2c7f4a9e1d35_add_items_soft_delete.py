@@ -0,0 +1,46 @@
+"""Add items soft delete
+
+Revision ID: 2c7f4a9e1d35
+Revises: 6e1b9d3c4a72
+Create Date: 2026-10-19 07:02:17.408125
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c7f4a9e1d35'
+down_revision = '6e1b9d3c4a72'
+branch_labels = None
+depends_on = None
+
+PARTITIONS = 16
+INDEXES = {
+    'ix_items_user_id_id_live': ('(user_id, id)', 'deleted_at IS NULL'),
+    'ix_items_deleted_at': ('(deleted_at)', 'deleted_at IS NOT NULL'),
+}
+
+
+def upgrade():
+    # Nullable column without default doesn't rewrite the table.
+    op.add_column('items', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+    # Partitioned index can't be built concurrently: it's created invalid on
+    # the parent only, partition indexes are built concurrently and attached.
+    for name, (columns, where) in INDEXES.items():
+        op.execute(f'CREATE INDEX {name} ON ONLY items {columns} WHERE {where}')
+    with op.get_context().autocommit_block():
+        for name, (columns, where) in INDEXES.items():
+            for remainder in range(PARTITIONS):
+                op.execute(
+                    f'CREATE INDEX CONCURRENTLY {name}_p{remainder} '
+                    f'ON items_p{remainder} {columns} WHERE {where}'
+                )
+                op.execute(f'ALTER INDEX {name} ATTACH PARTITION {name}_p{remainder}')
+
+
+def downgrade():
+    for name in INDEXES:
+        op.drop_index(name, table_name='items')
+    op.drop_column('items', 'deleted_at')
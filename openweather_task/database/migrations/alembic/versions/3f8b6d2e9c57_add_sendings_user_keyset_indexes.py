@@ -0,0 +1,34 @@
+"""Add sendings user keyset indexes
+
+Revision ID: 3f8b6d2e9c57
+Revises: 7d2a4f6e8b13
+Create Date: 2026-10-19 03:21:49.275310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8b6d2e9c57'
+down_revision = '7d2a4f6e8b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Composite indexes serve both user lookups and keyset pagination,
+    # so single column ones are dropped.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_sendings_from_user_id_id', 'sendings', ['from_user_id', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_sendings_to_user_id_id', 'sendings', ['to_user_id', 'id'], unique=False, postgresql_concurrently=True)
+        op.drop_index('ix_sendings_from_user_id', table_name='sendings', postgresql_concurrently=True)
+        op.drop_index('ix_sendings_to_user_id', table_name='sendings', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_sendings_to_user_id', 'sendings', ['to_user_id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_sendings_from_user_id', 'sendings', ['from_user_id'], unique=False, postgresql_concurrently=True)
+        op.drop_index('ix_sendings_to_user_id_id', table_name='sendings', postgresql_concurrently=True)
+        op.drop_index('ix_sendings_from_user_id_id', table_name='sendings', postgresql_concurrently=True)
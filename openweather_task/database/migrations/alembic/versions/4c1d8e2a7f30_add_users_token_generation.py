@@ -0,0 +1,24 @@
+"""Add users token generation
+
+Revision ID: 4c1d8e2a7f30
+Revises: b36f4b466a79
+Create Date: 2026-10-19 01:40:12.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c1d8e2a7f30'
+down_revision = 'b36f4b466a79'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('token_generation', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('users', 'token_generation')
@@ -0,0 +1,32 @@
+"""Add items name trigram index
+
+Revision ID: 5b7e2c9d1a48
+Revises: 9e3f5a1b6c24
+Create Date: 2026-10-19 02:31:07.114583
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e2c9d1a48'
+down_revision = '9e3f5a1b6c24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # Allows plain integer user_id column in the same GIN index.
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gin')
+    with op.get_context().autocommit_block():
+        op.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_items_user_id_name_trgm '
+            'ON items USING gin (user_id, name gin_trgm_ops)'
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_items_user_id_name_trgm')
@@ -0,0 +1,37 @@
+"""Add item changes table
+
+Revision ID: 7d2a4f6e8b13
+Revises: 5b7e2c9d1a48
+Create Date: 2026-10-19 02:58:33.640192
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2a4f6e8b13'
+down_revision = '5b7e2c9d1a48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('change_seq', sa.BigInteger(), server_default='0', nullable=False))
+    op.create_table('item_changes',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('seq', sa.BigInteger(), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('operation', sa.String(), nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'seq')
+    )
+    op.create_index(op.f('ix_item_changes_created_at'), 'item_changes', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_item_changes_created_at'), table_name='item_changes')
+    op.drop_table('item_changes')
+    op.drop_column('users', 'change_seq')
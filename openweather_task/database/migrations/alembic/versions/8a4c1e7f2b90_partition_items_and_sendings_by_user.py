@@ -0,0 +1,228 @@
+"""Partition items and sendings by user
+
+Revision ID: 8a4c1e7f2b90
+Revises: 3f8b6d2e9c57
+Create Date: 2026-10-19 03:52:16.508841
+
+Converts `items` and `sendings` to hash partitioning on the owning user id
+(`items.user_id`, `sendings.from_user_id`) without long locks:
+
+1. Partitioned copies are created next to the live tables, triggers mirror
+   every write of the live tables into the copies.
+2. Existing rows are copied in batches of `BATCH_SIZE` ids, each batch in its
+   own transaction. Copied rows are locked FOR SHARE, so concurrent deletes
+   wait for the batch and are mirrored afterwards.
+3. Tables are swapped in one short transaction under exclusive locks.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4c1e7f2b90'
+down_revision = '3f8b6d2e9c57'
+branch_labels = None
+depends_on = None
+
+PARTITIONS = 16
+BATCH_SIZE = 50000
+
+TRIGRAM_INDEX = 'ix_items_user_id_name_trgm'
+
+
+def create_partitions(table):
+    for remainder in range(PARTITIONS):
+        op.execute(
+            f'CREATE TABLE {table}_p{remainder} PARTITION OF {table} '
+            f'FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})'
+        )
+
+
+def copy_in_batches(source, target, columns, lock):
+    connection = op.get_bind()
+    max_id = connection.execute(sa.text(f'SELECT max(id) FROM {source}')).scalar()
+    with op.get_context().autocommit_block():
+        for first_id in range(0, (max_id or 0) + 1, BATCH_SIZE):
+            op.execute(
+                f'INSERT INTO {target} ({columns}) '
+                f'SELECT {columns} FROM {source} '
+                f'WHERE id >= {first_id} AND id < {first_id + BATCH_SIZE} '
+                f'{lock} ON CONFLICT DO NOTHING'
+            )
+
+
+def mirror_writes(source, target, key, columns, update):
+    new_values = ', '.join(f'NEW.{column}' for column in columns.split(', '))
+    op.execute(f'''
+        CREATE FUNCTION {source}_mirror_writes() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM {target} WHERE {key} = OLD.{key} AND id = OLD.id;
+            END IF;
+            IF TG_OP = 'DELETE' THEN
+                RETURN OLD;
+            END IF;
+            INSERT INTO {target} ({columns}) VALUES ({new_values})
+            ON CONFLICT ({key}, id) DO UPDATE SET {update};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    op.execute(
+        f'CREATE TRIGGER {source}_mirror_writes '
+        f'AFTER INSERT OR UPDATE OR DELETE ON {source} '
+        f'FOR EACH ROW EXECUTE FUNCTION {source}_mirror_writes()'
+    )
+
+
+def drop_mirror(source):
+    op.execute(f'DROP TRIGGER {source}_mirror_writes ON {source}')
+    op.execute(f'DROP FUNCTION {source}_mirror_writes()')
+
+
+def upgrade():
+    connection = op.get_bind()
+    has_trigram_index = connection.execute(
+        sa.text('SELECT 1 FROM pg_indexes WHERE indexname = :name'),
+        name=TRIGRAM_INDEX,
+    ).scalar()
+
+    op.execute('''
+        CREATE TABLE items_partitioned (
+            id integer NOT NULL DEFAULT nextval('items_id_seq'),
+            user_id integer NOT NULL
+                CONSTRAINT items_user_id_fkey REFERENCES users (id),
+            name varchar NOT NULL,
+            PRIMARY KEY (user_id, id)
+        ) PARTITION BY HASH (user_id)
+    ''')
+    create_partitions('items_partitioned')
+    if has_trigram_index:
+        op.execute(
+            'CREATE INDEX items_partitioned_user_id_name_trgm '
+            'ON items_partitioned USING gin (user_id, name gin_trgm_ops)'
+        )
+
+    op.execute('''
+        CREATE TABLE sendings_partitioned (
+            id integer NOT NULL DEFAULT nextval('sendings_id_seq'),
+            item_id integer NOT NULL,
+            from_user_id integer NOT NULL
+                CONSTRAINT sendings_from_user_id_fkey REFERENCES users (id),
+            to_user_id integer NOT NULL
+                CONSTRAINT sendings_to_user_id_fkey REFERENCES users (id),
+            confirmation_url varchar NOT NULL,
+            PRIMARY KEY (from_user_id, id)
+        ) PARTITION BY HASH (from_user_id)
+    ''')
+    create_partitions('sendings_partitioned')
+    op.execute(
+        'CREATE INDEX sendings_partitioned_from_user_id_item_id '
+        'ON sendings_partitioned (from_user_id, item_id)'
+    )
+    op.execute(
+        'CREATE INDEX sendings_partitioned_to_user_id_id '
+        'ON sendings_partitioned (to_user_id, id)'
+    )
+
+    mirror_writes(
+        'items', 'items_partitioned', 'user_id', 'id, user_id, name',
+        update='name = EXCLUDED.name',
+    )
+    mirror_writes(
+        'sendings', 'sendings_partitioned', 'from_user_id',
+        'id, item_id, from_user_id, to_user_id, confirmation_url',
+        update='confirmation_url = EXCLUDED.confirmation_url',
+    )
+
+    copy_in_batches(
+        'items', 'items_partitioned', 'id, user_id, name', lock='FOR SHARE'
+    )
+    copy_in_batches(
+        'sendings', 'sendings_partitioned',
+        'id, item_id, from_user_id, to_user_id, confirmation_url',
+        lock='FOR SHARE',
+    )
+
+    op.execute('LOCK TABLE items, sendings IN ACCESS EXCLUSIVE MODE')
+    drop_mirror('items')
+    drop_mirror('sendings')
+
+    op.execute('ALTER SEQUENCE items_id_seq OWNED BY items_partitioned.id')
+    op.execute('ALTER SEQUENCE sendings_id_seq OWNED BY sendings_partitioned.id')
+    op.execute('DROP TABLE sendings')
+    op.execute('DROP TABLE items')
+
+    op.execute('ALTER TABLE items_partitioned RENAME TO items')
+    op.execute('ALTER TABLE sendings_partitioned RENAME TO sendings')
+    for table in ('items', 'sendings'):
+        for remainder in range(PARTITIONS):
+            op.execute(
+                f'ALTER TABLE {table}_partitioned_p{remainder} '
+                f'RENAME TO {table}_p{remainder}'
+            )
+            op.execute(
+                f'ALTER INDEX {table}_partitioned_p{remainder}_pkey '
+                f'RENAME TO {table}_p{remainder}_pkey'
+            )
+    op.execute('ALTER INDEX items_partitioned_pkey RENAME TO items_pkey')
+    op.execute('ALTER INDEX sendings_partitioned_pkey RENAME TO sendings_pkey')
+    if has_trigram_index:
+        op.execute(f'ALTER INDEX items_partitioned_user_id_name_trgm RENAME TO {TRIGRAM_INDEX}')
+    op.execute('ALTER INDEX sendings_partitioned_from_user_id_item_id RENAME TO ix_sendings_from_user_id_item_id')
+    op.execute('ALTER INDEX sendings_partitioned_to_user_id_id RENAME TO ix_sendings_to_user_id_id')
+
+    # Checked on commit: item transfer changes items.user_id and deletes
+    # its sendings in the same transaction.
+    op.execute('''
+        ALTER TABLE sendings ADD CONSTRAINT sendings_from_user_id_item_id_fkey
+        FOREIGN KEY (from_user_id, item_id) REFERENCES items (user_id, id)
+        DEFERRABLE INITIALLY DEFERRED
+    ''')
+
+
+def downgrade():
+    op.execute('LOCK TABLE items, sendings IN ACCESS EXCLUSIVE MODE')
+    op.execute('ALTER TABLE sendings DROP CONSTRAINT sendings_from_user_id_item_id_fkey')
+    op.execute('ALTER TABLE items RENAME TO items_partitioned')
+    op.execute('ALTER TABLE sendings RENAME TO sendings_partitioned')
+
+    op.create_table('items',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('items_id_seq')"), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id', name='items_unpartitioned_pkey')
+    )
+    op.execute('INSERT INTO items SELECT id, user_id, name FROM items_partitioned')
+    op.create_table('sendings',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('sendings_id_seq')"), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('from_user_id', sa.Integer(), nullable=False),
+    sa.Column('to_user_id', sa.Integer(), nullable=False),
+    sa.Column('confirmation_url', sa.String(), nullable=False),
+    sa.ForeignKeyConstraint(['from_user_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['item_id'], ['items.id'], ),
+    sa.ForeignKeyConstraint(['to_user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id', name='sendings_unpartitioned_pkey')
+    )
+    op.execute(
+        'INSERT INTO sendings '
+        'SELECT id, item_id, from_user_id, to_user_id, confirmation_url '
+        'FROM sendings_partitioned'
+    )
+
+    op.execute('ALTER SEQUENCE items_id_seq OWNED BY items.id')
+    op.execute('ALTER SEQUENCE sendings_id_seq OWNED BY sendings.id')
+    op.execute('DROP TABLE sendings_partitioned')
+    op.execute('DROP TABLE items_partitioned')
+    op.execute('ALTER INDEX items_unpartitioned_pkey RENAME TO items_pkey')
+    op.execute('ALTER INDEX sendings_unpartitioned_pkey RENAME TO sendings_pkey')
+
+    op.create_index(op.f('ix_items_id'), 'items', ['id'], unique=False)
+    op.create_index(op.f('ix_items_user_id'), 'items', ['user_id'], unique=False)
+    op.create_index(op.f('ix_sendings_id'), 'sendings', ['id'], unique=False)
+    op.create_index(op.f('ix_sendings_item_id'), 'sendings', ['item_id'], unique=False)
+    op.create_index('ix_sendings_from_user_id_id', 'sendings', ['from_user_id', 'id'], unique=False)
+    op.create_index('ix_sendings_to_user_id_id', 'sendings', ['to_user_id', 'id'], unique=False)
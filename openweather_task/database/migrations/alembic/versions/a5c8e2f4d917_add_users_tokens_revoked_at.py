@@ -0,0 +1,29 @@
+"""Add users tokens revoked at
+
+Revision ID: a5c8e2f4d917
+Revises: d41f7b2e8c06
+Create Date: 2026-10-19 14:02:37.418526
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5c8e2f4d917'
+down_revision = 'd41f7b2e8c06'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('tokens_revoked_at', sa.DateTime(), nullable=True))
+    # Recent revocations are range scanned, never revoked users aren't indexed.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_users_tokens_revoked_at', 'users', ['tokens_revoked_at'], unique=False, postgresql_where=sa.text('tokens_revoked_at IS NOT NULL'), postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_tokens_revoked_at', table_name='users', postgresql_concurrently=True)
+    op.drop_column('users', 'tokens_revoked_at')
@@ -0,0 +1,25 @@
+"""Add items version
+
+Revision ID: d41f7b2e8c06
+Revises: 2c7f4a9e1d35
+Create Date: 2026-10-19 08:11:46.530284
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41f7b2e8c06'
+down_revision = '2c7f4a9e1d35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Constant default is stored in catalog, existing rows aren't rewritten.
+    op.add_column('items', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('items', 'version')
@@ -1,2 +1,5 @@
+from .changes import *  # noqa
+from .idempotency import *  # noqa
 from .items import *  # noqa
+from .outbox import *  # noqa
 from .users import *  # noqa
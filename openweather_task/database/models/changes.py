@@ -0,0 +1,156 @@
+import asyncio
+from datetime import datetime, timedelta
+from enum import Enum
+from itertools import groupby
+from typing import Any, Dict, List, Mapping, Optional
+
+import sqlalchemy
+from databases import Database
+from sqlalchemy import ForeignKey, and_, select
+from sqlalchemy.ext.declarative import declarative_base
+
+from openweather_task.config import (
+    ITEM_CHANGES_COMPACTION_BATCH_SIZE,
+    ITEM_CHANGES_RETENTION_SECONDS,
+)
+from openweather_task.database import metadata, shards
+from openweather_task.tracing import traced_methods
+
+from .users import users
+
+Base = declarative_base()
+
+__all__ = ["item_changes", "ItemChangeModel", "ItemChangeOperation"]
+
+
+class ItemChangeOperation(str, Enum):
+    UPSERT = "upsert"
+    DELETE = "delete"
+
+
+class ItemChange(Base):  # type: ignore
+    __tablename__ = "item_changes"
+    user_id = sqlalchemy.Column(
+        "user_id", sqlalchemy.Integer, ForeignKey("users.id"), primary_key=True
+    )
+    seq = sqlalchemy.Column("seq", sqlalchemy.BigInteger, primary_key=True)
+    item_id = sqlalchemy.Column("item_id", sqlalchemy.Integer, nullable=False)
+    operation = sqlalchemy.Column("operation", sqlalchemy.String, nullable=False)
+    name = sqlalchemy.Column("name", sqlalchemy.String)
+    created_at = sqlalchemy.Column(
+        "created_at", sqlalchemy.DateTime, nullable=False, index=True
+    )
+
+
+item_changes = sqlalchemy.Table(
+    "item_changes",
+    metadata,
+    sqlalchemy.Column(
+        "user_id", sqlalchemy.Integer, ForeignKey("users.id"), primary_key=True
+    ),
+    sqlalchemy.Column("seq", sqlalchemy.BigInteger, primary_key=True),
+    sqlalchemy.Column("item_id", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("operation", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("name", sqlalchemy.String),
+    sqlalchemy.Column("created_at", sqlalchemy.DateTime, nullable=False, index=True),
+)
+
+
+@traced_methods
+class ItemChangeModel:
+    @classmethod
+    async def record(cls, changes: List[Dict[str, Any]]) -> None:
+        """
+        Appends changes to owners' logs, must run inside writer's transaction.
+
+        Sequence is per user counter in `users.change_seq`, bumping it locks
+        user row until commit, so sequence numbers are dense and become
+        visible in order. Users are locked in id order to avoid deadlocks.
+        """
+        created_at = datetime.now()
+        changes = sorted(changes, key=lambda change: change["user_id"])
+        by_user = groupby(changes, key=lambda change: change["user_id"])
+        for user_id, user_changes_ in by_user:
+            user_changes = list(user_changes_)
+            shard = shards.for_user(user_id)
+            bump_seq_query = (
+                users.update()
+                .where(users.c.id == user_id)
+                .values(change_seq=users.c.change_seq + len(user_changes))
+                .returning(users.c.change_seq)
+            )
+            last_seq = await shard.execute(bump_seq_query)
+
+            first_seq = last_seq - len(user_changes) + 1
+            insert_changes_query = item_changes.insert().values(
+                [
+                    dict(
+                        user_id=user_id,
+                        seq=first_seq + offset,
+                        item_id=change["item_id"],
+                        operation=change["operation"].value,
+                        name=change.get("name"),
+                        created_at=created_at,
+                    )
+                    for offset, change in enumerate(user_changes)
+                ]
+            )
+            await shard.execute(insert_changes_query)
+
+    @classmethod
+    async def last_seq(cls, user_id: int) -> Optional[int]:
+        select_seq_query = select([users.c.change_seq]).where(users.c.id == user_id)
+        seq = await shards.for_user(user_id).fetch_val(select_seq_query)
+        return seq
+
+    @classmethod
+    async def list_since(
+        cls, user_id: int, since: int, limit: int
+    ) -> List[Mapping[str, Any]]:
+        list_changes_query = (
+            select(
+                [
+                    item_changes.c.seq,
+                    item_changes.c.operation,
+                    item_changes.c.item_id,
+                    item_changes.c.name,
+                ]
+            )
+            .where(and_(item_changes.c.user_id == user_id, item_changes.c.seq > since))
+            .order_by(item_changes.c.seq)
+            .limit(limit)
+        )
+        changes = await shards.for_user(user_id).fetch_all(list_changes_query)
+        return changes
+
+    @classmethod
+    async def compact(
+        cls, shard: Database, older_than: datetime, batch_size: int
+    ) -> int:
+        oldest_changes = (
+            select([item_changes.c.user_id, item_changes.c.seq])
+            .where(item_changes.c.created_at < older_than)
+            .limit(batch_size)
+            .alias("oldest_changes")
+        )
+        compact_changes_query = (
+            item_changes.delete()
+            .where(
+                and_(
+                    item_changes.c.user_id == oldest_changes.c.user_id,
+                    item_changes.c.seq == oldest_changes.c.seq,
+                )
+            )
+            .returning(item_changes.c.seq)
+        )
+        deleted = await shard.fetch_all(compact_changes_query)
+        return len(deleted)
+
+    @classmethod
+    async def compact_expired(cls) -> None:
+        older_than = datetime.now() - timedelta(seconds=ITEM_CHANGES_RETENTION_SECONDS)
+        batch_size = ITEM_CHANGES_COMPACTION_BATCH_SIZE
+        for shard in shards.databases:
+            while await cls.compact(shard, older_than, batch_size) == batch_size:
+                # Yield to request handlers between batches.
+                await asyncio.sleep(0)
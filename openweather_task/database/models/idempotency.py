@@ -0,0 +1,128 @@
+from datetime import datetime
+from typing import Any, Mapping, Optional
+
+import sqlalchemy
+from sqlalchemy import ForeignKey, and_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.declarative import declarative_base
+
+from openweather_task.database import metadata, shards
+from openweather_task.tracing import traced_methods
+
+Base = declarative_base()
+
+__all__ = ["idempotency_keys", "IdempotencyModel"]
+
+
+class IdempotencyKey(Base):  # type: ignore
+    __tablename__ = "idempotency_keys"
+    user_id = sqlalchemy.Column(
+        "user_id", sqlalchemy.Integer, ForeignKey("users.id"), primary_key=True
+    )
+    key = sqlalchemy.Column("key", sqlalchemy.String, primary_key=True)
+    fingerprint = sqlalchemy.Column("fingerprint", sqlalchemy.String, nullable=False)
+    status_code = sqlalchemy.Column("status_code", sqlalchemy.Integer)
+    response = sqlalchemy.Column("response", sqlalchemy.Text)
+    expires_at = sqlalchemy.Column(
+        "expires_at", sqlalchemy.DateTime, nullable=False, index=True
+    )
+
+
+idempotency_keys = sqlalchemy.Table(
+    "idempotency_keys",
+    metadata,
+    sqlalchemy.Column(
+        "user_id", sqlalchemy.Integer, ForeignKey("users.id"), primary_key=True
+    ),
+    sqlalchemy.Column("key", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("fingerprint", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("status_code", sqlalchemy.Integer),
+    sqlalchemy.Column("response", sqlalchemy.Text),
+    sqlalchemy.Column("expires_at", sqlalchemy.DateTime, nullable=False, index=True),
+)
+
+
+@traced_methods
+class IdempotencyModel:
+    @classmethod
+    async def reserve(
+        cls, user_id: int, key: str, fingerprint: str, expires_at: datetime
+    ) -> bool:
+        # Expired keys are taken over in place, so purging is not required
+        # for correctness.
+        insert_key_query = insert(idempotency_keys).values(
+            user_id=user_id, key=key, fingerprint=fingerprint, expires_at=expires_at
+        )
+        reserve_key_query = insert_key_query.on_conflict_do_update(
+            index_elements=[idempotency_keys.c.user_id, idempotency_keys.c.key],
+            set_=dict(
+                fingerprint=insert_key_query.excluded.fingerprint,
+                status_code=None,
+                response=None,
+                expires_at=insert_key_query.excluded.expires_at,
+            ),
+            where=idempotency_keys.c.expires_at < datetime.now(),
+        ).returning(idempotency_keys.c.key)
+        reserved_key = await shards.for_user(user_id).execute(reserve_key_query)
+        return reserved_key is not None
+
+    @classmethod
+    async def get(cls, user_id: int, key: str) -> Optional[Mapping[str, Any]]:
+        select_key_query = idempotency_keys.select().where(
+            and_(
+                idempotency_keys.c.user_id == user_id,
+                idempotency_keys.c.key == key,
+            )
+        )
+        idempotency_key = await shards.for_user(user_id).fetch_one(select_key_query)
+        return idempotency_key
+
+    @classmethod
+    async def complete(
+        cls,
+        user_id: int,
+        key: str,
+        lease_expires_at: datetime,
+        status_code: int,
+        response: str,
+        expires_at: datetime,
+    ) -> bool:
+        """
+        Stores response of reservation leased until `lease_expires_at`.
+
+        Returns False if the lease expired and was taken over meanwhile.
+        """
+        complete_key_query = (
+            idempotency_keys.update()
+            .where(
+                and_(
+                    idempotency_keys.c.user_id == user_id,
+                    idempotency_keys.c.key == key,
+                    idempotency_keys.c.status_code.is_(None),
+                    idempotency_keys.c.expires_at == lease_expires_at,
+                )
+            )
+            .values(status_code=status_code, response=response, expires_at=expires_at)
+            .returning(idempotency_keys.c.key)
+        )
+        completed_key = await shards.for_user(user_id).execute(complete_key_query)
+        return completed_key is not None
+
+    @classmethod
+    async def release(cls, user_id: int, key: str, lease_expires_at: datetime) -> None:
+        release_key_query = idempotency_keys.delete().where(
+            and_(
+                idempotency_keys.c.user_id == user_id,
+                idempotency_keys.c.key == key,
+                idempotency_keys.c.status_code.is_(None),
+                idempotency_keys.c.expires_at == lease_expires_at,
+            )
+        )
+        await shards.for_user(user_id).execute(release_key_query)
+
+    @classmethod
+    async def purge_expired(cls) -> None:
+        purge_keys_query = idempotency_keys.delete().where(
+            idempotency_keys.c.expires_at < datetime.now()
+        )
+        await shards.fan_out(lambda shard: shard.execute(purge_keys_query))
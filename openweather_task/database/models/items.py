@@ -1,173 +1,562 @@
+import asyncio
+import json
+import logging
 import secrets
+from datetime import datetime
 from enum import Enum
-from typing import Any, List, Mapping, Optional
+from itertools import chain
+from typing import Any, Dict, List, Mapping, Optional, Union
 
 import sqlalchemy
-from sqlalchemy import ForeignKey, and_, select
+from asyncpg.exceptions import LockNotAvailableError, SerializationError
+from databases import Database
+from sqlalchemy import ForeignKey, and_, func, select
 from sqlalchemy.ext.declarative import declarative_base
 
-from openweather_task.database import database, metadata
-from openweather_task.schemas import ItemSchema
+from openweather_task import metrics
+from openweather_task.config import (
+    ITEM_CREATE_BATCH_MAX_SIZE,
+    ITEM_CREATE_BATCH_WINDOW_SECONDS,
+    ITEM_CREATE_BATCHING,
+    ITEM_PURGE_BATCH_PAUSE_SECONDS,
+    ITEM_PURGE_BATCH_SIZE,
+    ITEM_SOFT_DELETE,
+    SENDING_CONFIRMATION_FORMAT,
+    SENDING_CONFIRMATION_TTL_SECONDS,
+)
+from openweather_task.database import in_transaction, metadata, shards
+from openweather_task.database.coalescing import WriteCoalescer
+from openweather_task.database.models.changes import (
+    ItemChangeModel,
+    ItemChangeOperation,
+)
+from openweather_task.database.models.outbox import OutboxModel
+from openweather_task.events import SENDING_EVENTS_CHANNEL
+from openweather_task.security import (
+    is_signed_token,
+    sign_confirmation_url,
+    verify_confirmation_url,
+)
+from openweather_task.tracing import traced_methods
 
 Base = declarative_base()
 
-__all__ = ["items", "ItemModel", "sendings", "SendingModel", "SendingStatus"]
+__all__ = [
+    "items",
+    "ItemDeleteStatus",
+    "ItemModel",
+    "sendings",
+    "SendingModel",
+    "SendingStatus",
+]
+
+ITEM_TRANSFER = "item_transfer"
+
+logger = logging.getLogger(__name__)
+
+item_version_conflicts = metrics.counter(
+    "item_version_conflicts_total", "Item writes rejected by version check"
+)
 
 
 class Item(Base):  # type: ignore
     __tablename__ = "items"
-    id = sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True, index=True)
+    # Hash partitioned by owner, so owner leads the primary key.
     user_id = sqlalchemy.Column(
         "user_id",
         sqlalchemy.Integer,
         ForeignKey("users.id"),
-        nullable=False,
-        index=True,
+        primary_key=True,
+    )
+    id = sqlalchemy.Column(
+        "id", sqlalchemy.Integer, primary_key=True, autoincrement=True
     )
     name = sqlalchemy.Column("name", sqlalchemy.String, nullable=False)
+    # Bumped by every item write, compared by conditional writes.
+    version = sqlalchemy.Column(
+        "version", sqlalchemy.Integer, nullable=False, server_default="1"
+    )
+    # Set by soft delete, such rows are hidden and purged in background.
+    deleted_at = sqlalchemy.Column("deleted_at", sqlalchemy.DateTime, nullable=True)
+    __table_args__ = (
+        sqlalchemy.Index(
+            "ix_items_user_id_id_live",
+            "user_id",
+            "id",
+            postgresql_where=sqlalchemy.text("deleted_at IS NULL"),
+        ),
+        sqlalchemy.Index(
+            "ix_items_deleted_at",
+            "deleted_at",
+            postgresql_where=sqlalchemy.text("deleted_at IS NOT NULL"),
+        ),
+        {"postgresql_partition_by": "HASH (user_id)"},
+    )
 
 
 items = sqlalchemy.Table(
     "items",
     metadata,
-    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True, index=True),
     sqlalchemy.Column(
         "user_id",
         sqlalchemy.Integer,
         ForeignKey("users.id"),
-        nullable=False,
-        index=True,
+        primary_key=True,
     ),
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
     sqlalchemy.Column("name", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column(
+        "version", sqlalchemy.Integer, nullable=False, server_default="1"
+    ),
+    sqlalchemy.Column("deleted_at", sqlalchemy.DateTime, nullable=True),
+    sqlalchemy.Index(
+        "ix_items_user_id_id_live",
+        "user_id",
+        "id",
+        postgresql_where=sqlalchemy.text("deleted_at IS NULL"),
+    ),
+    sqlalchemy.Index(
+        "ix_items_deleted_at",
+        "deleted_at",
+        postgresql_where=sqlalchemy.text("deleted_at IS NOT NULL"),
+    ),
+    postgresql_partition_by="HASH (user_id)",
 )
 
+live_items = items.c.deleted_at.is_(None)
+
+# Item locked by concurrent writer, or moved to another partition by transfer.
+ITEM_WRITE_CONFLICTS = (LockNotAvailableError, SerializationError)
+
+
+def _locked_nowait(condition: Any) -> Any:
+    """Matches items of `condition`, locked without waiting for other writers."""
+    locked = (
+        select([items.c.user_id, items.c.id])
+        .where(condition)
+        .with_for_update(nowait=True)
+        .cte("locked_items")
+    )
+    return and_(items.c.user_id == locked.c.user_id, items.c.id == locked.c.id)
+
 
 class Sending(Base):  # type: ignore
     __tablename__ = "sendings"
-    id = sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True, index=True)
-    item_id = sqlalchemy.Column(
-        "item_id",
-        sqlalchemy.Integer,
-        ForeignKey("items.id"),
-        nullable=False,
-        index=True,
-    )
+    # Hash partitioned by sender, who owns the item until sending completes.
     from_user_id = sqlalchemy.Column(
         "from_user_id",
         sqlalchemy.Integer,
         ForeignKey("users.id"),
-        nullable=False,
-        index=True,
+        primary_key=True,
     )
-    to_user_id = sqlalchemy.Column(
-        "to_user_id",
-        sqlalchemy.Integer,
-        ForeignKey("users.id"),
-        nullable=False,
-        index=True,
+    id = sqlalchemy.Column(
+        "id", sqlalchemy.Integer, primary_key=True, autoincrement=True
     )
+    item_id = sqlalchemy.Column("item_id", sqlalchemy.Integer, nullable=False)
+    # Not a foreign key, recipient may live on another shard.
+    to_user_id = sqlalchemy.Column("to_user_id", sqlalchemy.Integer, nullable=False)
     confirmation_url = sqlalchemy.Column(
         "confirmation_url", sqlalchemy.String, nullable=False
     )
+    __table_args__ = (
+        sqlalchemy.ForeignKeyConstraint(
+            ["from_user_id", "item_id"],
+            ["items.user_id", "items.id"],
+            deferrable=True,
+            initially="DEFERRED",
+        ),
+        sqlalchemy.Index("ix_sendings_from_user_id_item_id", "from_user_id", "item_id"),
+        sqlalchemy.Index("ix_sendings_to_user_id_id", "to_user_id", "id"),
+        {"postgresql_partition_by": "HASH (from_user_id)"},
+    )
 
 
 sendings = sqlalchemy.Table(
     "sendings",
     metadata,
-    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True, index=True),
-    sqlalchemy.Column(
-        "item_id",
-        sqlalchemy.Integer,
-        ForeignKey("items.id"),
-        nullable=False,
-        index=True,
-    ),
     sqlalchemy.Column(
         "from_user_id",
         sqlalchemy.Integer,
         ForeignKey("users.id"),
-        nullable=False,
-        index=True,
-    ),
-    sqlalchemy.Column(
-        "to_user_id",
-        sqlalchemy.Integer,
-        ForeignKey("users.id"),
-        nullable=False,
-        index=True,
+        primary_key=True,
     ),
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
+    sqlalchemy.Column("item_id", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("to_user_id", sqlalchemy.Integer, nullable=False),
     sqlalchemy.Column("confirmation_url", sqlalchemy.String, nullable=False),
+    sqlalchemy.ForeignKeyConstraint(
+        ["from_user_id", "item_id"],
+        ["items.user_id", "items.id"],
+        deferrable=True,
+        initially="DEFERRED",
+    ),
+    sqlalchemy.Index("ix_sendings_from_user_id_item_id", "from_user_id", "item_id"),
+    sqlalchemy.Index("ix_sendings_to_user_id_id", "to_user_id", "id"),
+    postgresql_partition_by="HASH (from_user_id)",
 )
 
 
+class ItemDeleteStatus(Enum):
+    NO_ITEM = 0
+    DELETED = 1
+    CONFLICT = 2
+
+
+@traced_methods
 class ItemModel:
     @classmethod
     async def create(cls, name: str, user_id: int) -> int:
-        insert_item_query = items.insert().values(name=name, user_id=user_id)
-        item_id = await database.execute(insert_item_query)
+        shard_index = shards.index_for_user(user_id)
+        shard = shards.databases[shard_index]
+        # Coalesced inserts commit on their own, outside caller's transaction.
+        if ITEM_CREATE_BATCHING and not in_transaction(shard):
+            return await item_create_coalescer.submit(dict(name=name, user_id=user_id))
+
+        async with shard.transaction():
+            insert_item_query = (
+                items.insert()
+                .values(
+                    id=shards.next_id("items_id_seq", shard_index),
+                    name=name,
+                    user_id=user_id,
+                )
+                .returning(items.c.id)
+            )
+            item_id = await shard.execute(insert_item_query)
+            await ItemChangeModel.record(
+                [
+                    dict(
+                        user_id=user_id,
+                        item_id=item_id,
+                        operation=ItemChangeOperation.UPSERT,
+                        name=name,
+                    )
+                ]
+            )
         return item_id
 
     @classmethod
-    async def get(cls, item_id: int) -> Optional[Mapping[str, Any]]:
-        select_item_query = items.select().where(items.c.id == item_id)
-        item = await database.fetch_one(select_item_query)
-        return item
+    async def create_many(
+        cls, values: List[Dict[str, Any]]
+    ) -> List[Union[int, Exception]]:
+        shard_indexes = {shards.index_for_user(value["user_id"]) for value in values}
+        if len(shard_indexes) > 1:
+            return await cls._create_many_sharded(values)
+
+        shard_index = shard_indexes.pop()
+        shard = shards.databases[shard_index]
+        # Postgres returns rows of multi-row INSERT in VALUES order.
+        insert_items_query = (
+            items.insert()
+            .values(
+                [
+                    dict(value, id=shards.next_id("items_id_seq", shard_index))
+                    for value in values
+                ]
+            )
+            .returning(items.c.id)
+        )
+        try:
+            async with shard.transaction():
+                rows = await shard.fetch_all(insert_items_query)
+                await ItemChangeModel.record(
+                    [
+                        dict(
+                            user_id=value["user_id"],
+                            item_id=row["id"],
+                            operation=ItemChangeOperation.UPSERT,
+                            name=value["name"],
+                        )
+                        for value, row in zip(values, rows)
+                    ]
+                )
+        except Exception as exc:
+            if len(values) == 1:
+                return [exc]
+
+            # Isolate invalid rows, so they fail only their own callers.
+            results: List[Union[int, Exception]] = []
+            for value in values:
+                results.extend(await cls.create_many([value]))
+            return results
+
+        return [row["id"] for row in rows]
 
     @classmethod
-    @database.transaction()
-    async def delete(cls, item_id: int) -> Optional[int]:
-        delete_item_query = (
-            items.delete().where(items.c.id == item_id).returning(items.c.id)
-        )
-        deleted_item_id = await database.execute(delete_item_query)
+    async def _create_many_sharded(
+        cls, values: List[Dict[str, Any]]
+    ) -> List[Union[int, Exception]]:
+        results: List[Union[int, Exception]] = [None] * len(values)  # type: ignore
+        by_shard: Dict[int, List[int]] = {}
+        for position, value in enumerate(values):
+            shard_index = shards.index_for_user(value["user_id"])
+            by_shard.setdefault(shard_index, []).append(position)
+
+        for positions in by_shard.values():
+            shard_results = await cls.create_many(
+                [values[position] for position in positions]
+            )
+            for position, result in zip(positions, shard_results):
+                results[position] = result
+        return results
 
-        delete_item_sending_query = (
-            sendings.delete().where(items.c.id == item_id).returning(items.c.id)
+    @classmethod
+    async def receive(
+        cls, item_id: int, user_id: int, name: str, version: int = 1
+    ) -> None:
+        """Inserts item moved from another shard, in caller's transaction."""
+        insert_item_query = items.insert().values(
+            id=item_id, user_id=user_id, name=name, version=version
         )
-        await database.execute(delete_item_sending_query)
+        await shards.for_user(user_id).execute(insert_item_query)
+        await ItemChangeModel.record(
+            [
+                dict(
+                    user_id=user_id,
+                    item_id=item_id,
+                    operation=ItemChangeOperation.UPSERT,
+                    name=name,
+                )
+            ]
+        )
+
+    @classmethod
+    async def get(cls, item_id: int, user_id: int) -> Optional[Mapping[str, Any]]:
+        select_item_query = select(
+            [items.c.user_id, items.c.id, items.c.name, items.c.version]
+        ).where(and_(items.c.user_id == user_id, items.c.id == item_id, live_items))
+        item = await shards.for_user(user_id).fetch_one(select_item_query)
+        return item
+
+    @classmethod
+    async def delete(
+        cls, item_id: int, user_id: int, version: Optional[int] = None
+    ) -> ItemDeleteStatus:
+        """
+        Deletes item, only of given `version` if it's passed.
+
+        Item is locked without waiting, so writer conflicting by version, or
+        with a concurrent write of item, gets `ItemDeleteStatus.CONFLICT`
+        instead of blocking pooled connection.
+        """
+        user_item = and_(items.c.user_id == user_id, items.c.id == item_id, live_items)
+        if version is not None:
+            user_item = and_(user_item, items.c.version == version)
+        if ITEM_SOFT_DELETE:
+            # Item and its sendings are removed later by `purge_deleted`.
+            delete_item_query = (
+                items.update()
+                .where(_locked_nowait(user_item))
+                .values(deleted_at=datetime.now(), version=items.c.version + 1)
+                .returning(items.c.id)
+            )
+        else:
+            delete_item_query = (
+                items.delete().where(_locked_nowait(user_item)).returning(items.c.id)
+            )
 
-        return deleted_item_id
+        shard = shards.for_user(user_id)
+        try:
+            async with shard.transaction():
+                deleted_item_id = await shard.execute(delete_item_query)
+                if deleted_item_id:
+                    if not ITEM_SOFT_DELETE:
+                        await SendingModel.delete(item_id, from_user_id=user_id)
+                    await ItemChangeModel.record(
+                        [
+                            dict(
+                                user_id=user_id,
+                                item_id=item_id,
+                                operation=ItemChangeOperation.DELETE,
+                            )
+                        ]
+                    )
+        except ITEM_WRITE_CONFLICTS:
+            item_version_conflicts.inc(operation="delete")
+            return ItemDeleteStatus.CONFLICT
+
+        if deleted_item_id:
+            return ItemDeleteStatus.DELETED
+        if version is not None and await cls.get(item_id, user_id=user_id):
+            item_version_conflicts.inc(operation="delete")
+            return ItemDeleteStatus.CONFLICT
+        return ItemDeleteStatus.NO_ITEM
 
     @classmethod
-    async def list(cls, user_id: int) -> List[ItemSchema]:
+    async def list(cls, user_id: int) -> List[Mapping[str, Any]]:
         list_items_query = (
             select([items.c.id, items.c.name])
-            .where(items.c.user_id == user_id)
+            .where(and_(items.c.user_id == user_id, live_items))
             .order_by("id")
         )
-        items_ = await database.fetch_all(list_items_query)
-        return list(Item(**item) for item in items_)
+        return await shards.for_user(user_id).fetch_all(list_items_query)
+
+    @classmethod
+    async def search(
+        cls, user_id: int, query: str, limit: int, offset: int
+    ) -> List[Mapping[str, Any]]:
+        escaped_query = (
+            query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        )
+        # Substring match is served by trigram index on (user_id, name),
+        # prefix matches are ranked first, then earlier and shorter matches.
+        search_items_query = (
+            select([items.c.id, items.c.name])
+            .where(
+                and_(
+                    items.c.user_id == user_id,
+                    live_items,
+                    items.c.name.ilike(f"%{escaped_query}%", escape="\\"),
+                )
+            )
+            .order_by(
+                items.c.name.ilike(f"{escaped_query}%", escape="\\").desc(),
+                func.strpos(func.lower(items.c.name), query.lower()),
+                func.length(items.c.name),
+                items.c.id,
+            )
+            .limit(limit)
+            .offset(offset)
+        )
+        items_ = await shards.for_user(user_id).fetch_all(search_items_query)
+        return items_
 
     @classmethod
     async def transfer(
-        cls, from_user_id: int, to_user_id: int, item_id: int
-    ) -> Optional[int]:
-        update_items_query = (
-            items.update()
+        cls,
+        from_user_id: int,
+        to_user_id: int,
+        item_id: int,
+        version: Optional[int] = None,
+    ) -> Optional[Mapping[str, Any]]:
+        """
+        Moves item to recipient, must run inside transaction on sender's shard.
+
+        Item moving to another shard is deleted here and inserted on
+        recipient's shard by outbox relay, see `SendingModel.receive_transfer`.
+        Item is locked without waiting, concurrent write of it raises one of
+        `ITEM_WRITE_CONFLICTS`.
+        """
+        shard = shards.for_user(from_user_id)
+        from_item = and_(
+            items.c.user_id == from_user_id, items.c.id == item_id, live_items
+        )
+        if version is not None:
+            from_item = and_(from_item, items.c.version == version)
+        if shard is shards.for_user(to_user_id):
+            update_items_query = (
+                items.update()
+                .returning(items.c.id, items.c.name, items.c.version)
+                .where(_locked_nowait(from_item))
+                .values(user_id=to_user_id, version=items.c.version + 1)
+            )
+            transferred_item = await shard.fetch_one(update_items_query)
+            return transferred_item
+
+        delete_item_query = (
+            items.delete()
+            .returning(items.c.id, items.c.name, items.c.version)
+            .where(_locked_nowait(from_item))
+        )
+        transferred_item = await shard.fetch_one(delete_item_query)
+        if transferred_item:
+            await OutboxModel.enqueue(
+                shard,
+                target_shard=shards.index_for_user(to_user_id),
+                kind=ITEM_TRANSFER,
+                payload=dict(
+                    item_id=item_id,
+                    name=transferred_item["name"],
+                    version=transferred_item["version"] + 1,
+                    from_user_id=from_user_id,
+                    to_user_id=to_user_id,
+                ),
+            )
+        return transferred_item
+
+    @classmethod
+    async def purge(cls, shard: Database, batch_size: int) -> int:
+        """Hard-deletes batch of soft deleted items and their sendings."""
+        # One statement, so no transaction is left open if purge is cancelled.
+        deleted_items = (
+            select([items.c.user_id, items.c.id])
+            .where(items.c.deleted_at.isnot(None))
+            .order_by(items.c.deleted_at)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .cte("deleted_items")
+        )
+        purged_items = (
+            items.delete()
+            .where(
+                and_(
+                    items.c.user_id == deleted_items.c.user_id,
+                    items.c.id == deleted_items.c.id,
+                )
+            )
             .returning(items.c.id)
+            .cte("purged_items")
+        )
+        # Served by (from_user_id, item_id) index.
+        purged_sendings = (
+            sendings.delete()
             .where(
                 and_(
-                    items.c.id == item_id,
-                    items.c.user_id == from_user_id,
+                    sendings.c.from_user_id == deleted_items.c.user_id,
+                    sendings.c.item_id == deleted_items.c.id,
                 )
             )
-            .values(user_id=to_user_id)
+            .returning(sendings.c.id)
+            .cte("purged_sendings")
+        )
+        purge_query = select(
+            [
+                select([func.count()]).select_from(purged_items).label("items"),
+                select([func.count()]).select_from(purged_sendings).label("sendings"),
+            ]
         )
-        transferred_item_id = await database.execute(update_items_query)
-        return transferred_item_id
+        purged = await shard.fetch_one(purge_query)
+        return purged["items"]
+
+    @classmethod
+    async def purge_deleted(cls) -> None:
+        batch_size = ITEM_PURGE_BATCH_SIZE
+        for shard in shards.databases:
+            while await cls.purge(shard, batch_size) == batch_size:
+                # Throttled to keep purge off request handlers' way.
+                await asyncio.sleep(ITEM_PURGE_BATCH_PAUSE_SECONDS)
+
+
+item_create_coalescer: WriteCoalescer[Dict[str, Any], int] = WriteCoalescer(
+    name="items",
+    flush=ItemModel.create_many,
+    window=ITEM_CREATE_BATCH_WINDOW_SECONDS,
+    max_size=ITEM_CREATE_BATCH_MAX_SIZE,
+)
 
 
 class SendingStatus(Enum):
     NO_SENDING = 0
     COMPLETED = 1
     FAILED = 2
+    CONFLICT = 3
 
 
+@traced_methods
 class SendingModel:
     @classmethod
     async def initiate_sending(
-        cls, from_user_id: int, to_user_id: int, item_id: int
+        cls,
+        from_user_id: int,
+        to_user_id: int,
+        item_id: int,
+        item_version: Optional[int] = None,
     ) -> str:
+        if SENDING_CONFIRMATION_FORMAT == "signed":
+            return await cls.initiate_signed_sending(
+                from_user_id, to_user_id, item_id, item_version
+            )
+
         confirmation_url = await cls.get_confirmation_url(
             from_user_id, to_user_id, item_id
         )
@@ -179,31 +568,247 @@ class SendingModel:
 
         return confirmation_url
 
+    @classmethod
+    async def initiate_signed_sending(
+        cls,
+        from_user_id: int,
+        to_user_id: int,
+        item_id: int,
+        item_version: Optional[int] = None,
+    ) -> str:
+        """Issues signed confirmation URL, nothing is stored until completion."""
+        if item_version is None:
+            item = await ItemModel.get(item_id, user_id=from_user_id)
+            item_version = item["version"] if item else 0
+
+        confirmation_url = sign_confirmation_url(
+            item_id=item_id,
+            version=item_version,
+            from_user_id=from_user_id,
+            to_user_id=to_user_id,
+            ttl_seconds=SENDING_CONFIRMATION_TTL_SECONDS,
+        )
+        await cls.notify(
+            shards.for_user(from_user_id),
+            "sending_created",
+            user_ids=[to_user_id],
+            item_id=item_id,
+            from_user_id=from_user_id,
+            to_user_id=to_user_id,
+            confirmation_url=confirmation_url,
+        )
+        return confirmation_url
+
     @classmethod
     async def complete_sending(
         cls, to_user_id: int, item_id: int, confirmation_url: str
     ) -> SendingStatus:
-        transaction = await database.transaction()
+        if is_signed_token(confirmation_url):
+            return await cls.complete_signed_sending(
+                to_user_id, item_id, confirmation_url
+            )
 
         sending = await cls.get(to_user_id, item_id, confirmation_url)
         if not sending:
-            await transaction.rollback()
             return SendingStatus.NO_SENDING
 
-        transferred_item_id = await ItemModel.transfer(
-            from_user_id=sending["from_user_id"],
-            to_user_id=sending["to_user_id"],
-            item_id=sending["item_id"],
-        )
-        deleted_sending_id = await cls.delete(sending["item_id"])
+        from_user_id = sending["from_user_id"]
+        shard = shards.for_user(from_user_id)
+        transaction = await shard.transaction()
+        try:
+            transferred_item = await ItemModel.transfer(
+                from_user_id=from_user_id, to_user_id=to_user_id, item_id=item_id
+            )
+            deleted_sending_id = await cls.delete(item_id, from_user_id=from_user_id)
+
+            transferred = transferred_item and transferred_item["id"] == item_id
+            if transferred and deleted_sending_id:
+                await cls._record_completion(
+                    from_user_id, to_user_id, item_id, transferred_item["name"]
+                )
+        except ITEM_WRITE_CONFLICTS:
+            await transaction.rollback()
+            item_version_conflicts.inc(operation="transfer")
+            return SendingStatus.CONFLICT
+        except BaseException:
+            # Statement timeouts and cancelled requests must release locks.
+            await transaction.rollback()
+            raise
 
-        if transferred_item_id == item_id and deleted_sending_id:
+        if transferred and deleted_sending_id:
             await transaction.commit()
+            await cls._relay_completion(from_user_id, to_user_id, item_id)
             return SendingStatus.COMPLETED
 
         await transaction.rollback()
         return SendingStatus.FAILED
 
+    @classmethod
+    async def complete_signed_sending(
+        cls, to_user_id: int, item_id: int, confirmation_url: str
+    ) -> SendingStatus:
+        """
+        Completes sending by verified confirmation URL without sendings lookup.
+
+        Transfer is a single conditional update of the signed item version,
+        so URL of a transferred or modified item is no longer valid.
+        """
+        sending = verify_confirmation_url(confirmation_url)
+        if (
+            not sending
+            or sending["to_user_id"] != to_user_id
+            or sending["item_id"] != item_id
+        ):
+            return SendingStatus.NO_SENDING
+
+        from_user_id = sending["from_user_id"]
+        shard = shards.for_user(from_user_id)
+        try:
+            async with shard.transaction():
+                transferred_item = await ItemModel.transfer(
+                    from_user_id=from_user_id,
+                    to_user_id=to_user_id,
+                    item_id=item_id,
+                    version=sending["version"],
+                )
+                if not transferred_item:
+                    return SendingStatus.NO_SENDING
+
+                await cls._record_completion(
+                    from_user_id, to_user_id, item_id, transferred_item["name"]
+                )
+        except ITEM_WRITE_CONFLICTS:
+            item_version_conflicts.inc(operation="transfer")
+            return SendingStatus.CONFLICT
+        await cls._relay_completion(from_user_id, to_user_id, item_id)
+        return SendingStatus.COMPLETED
+
+    @classmethod
+    async def _record_completion(
+        cls, from_user_id: int, to_user_id: int, item_id: int, name: str
+    ) -> None:
+        # Recipient on another shard is recorded and notified by outbox relay.
+        shard = shards.for_user(from_user_id)
+        same_shard = shard is shards.for_user(to_user_id)
+        changes = [
+            dict(
+                user_id=from_user_id,
+                item_id=item_id,
+                operation=ItemChangeOperation.DELETE,
+            )
+        ]
+        if same_shard:
+            changes.append(
+                dict(
+                    user_id=to_user_id,
+                    item_id=item_id,
+                    operation=ItemChangeOperation.UPSERT,
+                    name=name,
+                )
+            )
+        await ItemChangeModel.record(changes)
+        if same_shard:
+            await cls.notify(
+                shard,
+                "sending_completed",
+                user_ids=[from_user_id, to_user_id],
+                item_id=item_id,
+                from_user_id=from_user_id,
+                to_user_id=to_user_id,
+            )
+
+    @classmethod
+    async def _relay_completion(
+        cls, from_user_id: int, to_user_id: int, item_id: int
+    ) -> None:
+        if shards.for_user(from_user_id) is shards.for_user(to_user_id):
+            return
+
+        # Transfer is committed to outbox, periodic relay retries on failure.
+        try:
+            await OutboxModel.relay(shards.index_for_user(from_user_id))
+        except Exception:
+            logger.exception("Failed to relay item %s transfer", item_id)
+
+    @classmethod
+    async def receive_transfer(cls, transfer: Dict[str, Any]) -> None:
+        """Completes cross-shard transfer on recipient's shard."""
+        await ItemModel.receive(
+            item_id=transfer["item_id"],
+            user_id=transfer["to_user_id"],
+            name=transfer["name"],
+            version=transfer.get("version", 1),
+        )
+        await cls.notify(
+            shards.for_user(transfer["to_user_id"]),
+            "sending_completed",
+            user_ids=[transfer["from_user_id"], transfer["to_user_id"]],
+            item_id=transfer["item_id"],
+            from_user_id=transfer["from_user_id"],
+            to_user_id=transfer["to_user_id"],
+        )
+
+    @classmethod
+    async def list_incoming(
+        cls, user_id: int, after_id: int, limit: int
+    ) -> List[Mapping[str, Any]]:
+        # Sendings are stored on senders' shards.
+        shards_sendings = await shards.fan_out(
+            lambda shard: cls._list(
+                shard, sendings.c.to_user_id, user_id, after_id, limit
+            )
+        )
+        sendings_ = sorted(
+            chain.from_iterable(shards_sendings), key=lambda sending: sending["id"]
+        )
+        return sendings_[:limit]
+
+    @classmethod
+    async def list_outgoing(
+        cls, user_id: int, after_id: int, limit: int
+    ) -> List[Mapping[str, Any]]:
+        return await cls._list(
+            shards.for_user(user_id), sendings.c.from_user_id, user_id, after_id, limit
+        )
+
+    @classmethod
+    async def _list(
+        cls,
+        shard: Database,
+        user_column: sqlalchemy.Column,
+        user_id: int,
+        after_id: int,
+        limit: int,
+    ) -> List[Mapping[str, Any]]:
+        # Keyset pagination over (user column, id) index.
+        list_sendings_query = (
+            select(
+                [
+                    sendings.c.id,
+                    sendings.c.item_id,
+                    items.c.name.label("item_name"),
+                    sendings.c.from_user_id,
+                    sendings.c.to_user_id,
+                    sendings.c.confirmation_url,
+                ]
+            )
+            .select_from(
+                sendings.join(
+                    items,
+                    and_(
+                        items.c.user_id == sendings.c.from_user_id,
+                        items.c.id == sendings.c.item_id,
+                        live_items,
+                    ),
+                )
+            )
+            .where(and_(user_column == user_id, sendings.c.id > after_id))
+            .order_by(sendings.c.id)
+            .limit(limit)
+        )
+        sendings_ = await shard.fetch_all(list_sendings_query)
+        return sendings_
+
     @classmethod
     async def get_confirmation_url(
         cls, from_user_id: int, to_user_id: int, item_id: int
@@ -215,16 +820,21 @@ class SendingModel:
                 sendings.c.item_id == item_id,
             )
         )
-        confirmation_url = await database.fetch_val(select_url_query)
+        confirmation_url = await shards.for_user(from_user_id).fetch_val(
+            select_url_query
+        )
         return confirmation_url
 
     @classmethod
     async def create(
         cls, from_user_id: int, to_user_id: int, item_id: int, confirmation_url: str
     ) -> str:
+        shard_index = shards.index_for_user(from_user_id)
+        shard = shards.databases[shard_index]
         insert_url_query = (
             sendings.insert()
             .values(
+                id=shards.next_id("sendings_id_seq", shard_index),
                 item_id=item_id,
                 from_user_id=from_user_id,
                 to_user_id=to_user_id,
@@ -232,33 +842,77 @@ class SendingModel:
             )
             .returning(sendings.c.confirmation_url)
         )
-        confirmation_url = await database.execute(insert_url_query)
+        async with shard.transaction():
+            confirmation_url = await shard.execute(insert_url_query)
+            await cls.notify(
+                shard,
+                "sending_created",
+                user_ids=[to_user_id],
+                item_id=item_id,
+                from_user_id=from_user_id,
+                to_user_id=to_user_id,
+                confirmation_url=confirmation_url,
+            )
         return confirmation_url
 
+    @classmethod
+    async def notify(cls, shard: Database, event: str, **fields: Any) -> None:
+        # Delivered to listeners on commit of the surrounding transaction.
+        payload = json.dumps(dict(event=event, **fields))
+        notify_query = select([func.pg_notify(SENDING_EVENTS_CHANNEL, payload)])
+        await shard.execute(notify_query)
+
     @classmethod
     async def get(
         cls, to_user_id: int, item_id: int, confirmation_url: str
     ) -> Optional[Mapping[str, Any]]:
-
-        select_sending_query = sendings.select().where(
-            and_(
-                sendings.c.to_user_id == to_user_id,
-                sendings.c.item_id == item_id,
-                sendings.c.confirmation_url == confirmation_url,
+        # Sender is unknown to recipient, so this probes every shard and
+        # partition through its (to_user_id, id) index. Sendings of deleted
+        # items are left for purge, they aren't found anymore.
+        select_sending_query = (
+            select([sendings])
+            .select_from(
+                sendings.join(
+                    items,
+                    and_(
+                        items.c.user_id == sendings.c.from_user_id,
+                        items.c.id == sendings.c.item_id,
+                        live_items,
+                    ),
+                )
+            )
+            .where(
+                and_(
+                    sendings.c.to_user_id == to_user_id,
+                    sendings.c.item_id == item_id,
+                    sendings.c.confirmation_url == confirmation_url,
+                )
             )
         )
 
-        sending = await database.fetch_one(select_sending_query)
-        return sending
+        shards_sendings = await shards.fan_out(
+            lambda shard: shard.fetch_one(select_sending_query)
+        )
+        return next(filter(None, shards_sendings), None)
 
     @classmethod
-    async def delete(cls, item_id: int) -> int:
+    async def delete(cls, item_id: int, from_user_id: int) -> int:
 
         delete_sending_query = (
             sendings.delete()
             .returning(sendings.c.id)
-            .where(sendings.c.item_id == item_id)
+            .where(
+                and_(
+                    sendings.c.from_user_id == from_user_id,
+                    sendings.c.item_id == item_id,
+                )
+            )
         )
 
-        deleted_sending_id = await database.execute(delete_sending_query)
+        deleted_sending_id = await shards.for_user(from_user_id).execute(
+            delete_sending_query
+        )
         return deleted_sending_id
+
+
+OutboxModel.register(ITEM_TRANSFER, SendingModel.receive_transfer)
@@ -0,0 +1,162 @@
+import json
+import logging
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List
+
+import sqlalchemy
+from databases import Database
+from sqlalchemy import and_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.declarative import declarative_base
+
+from openweather_task import metrics
+from openweather_task.config import SHARD_OUTBOX_RELAY_BATCH_SIZE
+from openweather_task.database import metadata, shards
+from openweather_task.tracing import traced_methods
+
+Base = declarative_base()
+
+__all__ = ["inbox_messages", "OutboxModel", "outbox_messages"]
+
+logger = logging.getLogger(__name__)
+
+relayed_messages = metrics.counter(
+    "outbox_messages_relayed_total", "Cross-shard messages applied on target shard"
+)
+failed_messages = metrics.counter(
+    "outbox_messages_failed_total", "Cross-shard messages failed to apply"
+)
+
+MessageHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class OutboxMessage(Base):  # type: ignore
+    __tablename__ = "outbox_messages"
+    id = sqlalchemy.Column("id", sqlalchemy.BigInteger, primary_key=True)
+    target_shard = sqlalchemy.Column(
+        "target_shard", sqlalchemy.Integer, nullable=False
+    )
+    kind = sqlalchemy.Column("kind", sqlalchemy.String, nullable=False)
+    payload = sqlalchemy.Column("payload", sqlalchemy.Text, nullable=False)
+    created_at = sqlalchemy.Column("created_at", sqlalchemy.DateTime, nullable=False)
+
+
+outbox_messages = sqlalchemy.Table(
+    "outbox_messages",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.BigInteger, primary_key=True),
+    sqlalchemy.Column("target_shard", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("kind", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("payload", sqlalchemy.Text, nullable=False),
+    sqlalchemy.Column("created_at", sqlalchemy.DateTime, nullable=False),
+)
+
+
+class InboxMessage(Base):  # type: ignore
+    __tablename__ = "inbox_messages"
+    source_shard = sqlalchemy.Column(
+        "source_shard", sqlalchemy.Integer, primary_key=True
+    )
+    message_id = sqlalchemy.Column(
+        "message_id", sqlalchemy.BigInteger, primary_key=True
+    )
+
+
+inbox_messages = sqlalchemy.Table(
+    "inbox_messages",
+    metadata,
+    sqlalchemy.Column("source_shard", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("message_id", sqlalchemy.BigInteger, primary_key=True),
+)
+
+
+@traced_methods
+class OutboxModel:
+    """
+    Delivers writes to other shards exactly once.
+
+    Message is stored in the source shard's outbox within the transaction
+    that caused it, relay applies it on target shard and deletes it from
+    the outbox afterwards. Redelivery after a crash in between is skipped
+    by message id recorded in target shard's inbox in the same transaction
+    as the handler's writes.
+    """
+
+    handlers: Dict[str, MessageHandler] = {}
+
+    @classmethod
+    def register(cls, kind: str, handler: MessageHandler) -> None:
+        cls.handlers[kind] = handler
+
+    @classmethod
+    async def enqueue(
+        cls, shard: Database, target_shard: int, kind: str, payload: Dict[str, Any]
+    ) -> None:
+        enqueue_message_query = outbox_messages.insert().values(
+            target_shard=target_shard,
+            kind=kind,
+            payload=json.dumps(payload),
+            created_at=datetime.now(),
+        )
+        await shard.execute(enqueue_message_query)
+
+    @classmethod
+    async def relay(cls, shard_index: int) -> int:
+        """Applies batch of shard's pending messages, returns their count."""
+        source = shards.databases[shard_index]
+        select_messages_query = (
+            select([outbox_messages])
+            .order_by(outbox_messages.c.id)
+            .limit(SHARD_OUTBOX_RELAY_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        relayed: List[Dict[str, Any]] = []
+        async with source.transaction():
+            messages = await source.fetch_all(select_messages_query)
+            for message in messages:
+                try:
+                    await cls._apply(shard_index, message)
+                except Exception:
+                    failed_messages.inc(kind=message["kind"])
+                    logger.exception("Failed to relay message %s", message["id"])
+                    continue
+
+                relayed_messages.inc(kind=message["kind"])
+                relayed.append(dict(message))
+
+            if relayed:
+                delete_messages_query = outbox_messages.delete().where(
+                    outbox_messages.c.id.in_([message["id"] for message in relayed])
+                )
+                await source.execute(delete_messages_query)
+
+        # Deleted messages can't be redelivered anymore.
+        for message in relayed:
+            target = shards.databases[message["target_shard"]]
+            forget_message_query = inbox_messages.delete().where(
+                and_(
+                    inbox_messages.c.source_shard == shard_index,
+                    inbox_messages.c.message_id == message["id"],
+                )
+            )
+            await target.execute(forget_message_query)
+        return len(relayed)
+
+    @classmethod
+    async def _apply(cls, shard_index: int, message: Any) -> None:
+        target = shards.databases[message["target_shard"]]
+        receive_message_query = (
+            insert(inbox_messages)
+            .values(source_shard=shard_index, message_id=message["id"])
+            .on_conflict_do_nothing()
+            .returning(inbox_messages.c.message_id)
+        )
+        async with target.transaction():
+            if await target.execute(receive_message_query) is not None:
+                await cls.handlers[message["kind"]](json.loads(message["payload"]))
+
+    @classmethod
+    async def relay_pending(cls) -> None:
+        for shard_index in range(shards.count):
+            while await cls.relay(shard_index) == SHARD_OUTBOX_RELAY_BATCH_SIZE:
+                pass
@@ -1,18 +1,57 @@
 import secrets
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Any, Mapping, Optional
+from typing import Any, Dict, List, Mapping, Optional, Tuple
 
 import sqlalchemy
-from sqlalchemy import and_
+from databases import Database
+from sqlalchemy import and_, select, text
 from sqlalchemy.ext.declarative import declarative_base
 
-from openweather_task.config import TOKEN_BYTES_LENGTH, TOKEN_TTL_SECONDS
-from openweather_task.database import database, metadata
+from openweather_task import metrics
+from openweather_task.config import (
+    LOGIN_ID_CACHE_NEGATIVE_TTL_SECONDS,
+    LOGIN_ID_CACHE_SIZE,
+    TOKEN_BYTES_LENGTH,
+    TOKEN_FORMAT,
+    TOKEN_REFRESH_INTERVAL_SECONDS,
+    TOKEN_SLIDING_EXPIRATION,
+    TOKEN_TTL_SECONDS,
+)
+from openweather_task.database import metadata, shards
+from openweather_task.security import (
+    is_hashed,
+    is_signed_token,
+    password_hasher,
+    sign_token,
+    token_revocations,
+    verify_token,
+)
+from openweather_task.tracing import traced_methods
 
 Base = declarative_base()
 
 
-__all__ = ["users", "UserModel", "Base"]
+__all__ = [
+    "users",
+    "LoginIdCache",
+    "TokenRefreshes",
+    "UserModel",
+    "Base",
+    "login_ids",
+    "token_refreshes",
+]
+
+login_id_lookups = metrics.counter(
+    "login_id_lookups_total", "Login to user id lookups by cache result"
+)
+token_refresh_writes = metrics.counter(
+    "token_refreshes_total", "Sliding token expiration refreshes by stage"
+)
+
+# Two parameters per row, well below Postgres limit of 32767 per statement.
+TOKEN_REFRESH_BATCH_SIZE = 1000
 
 
 class User(Base):  # type: ignore
@@ -22,6 +61,21 @@ class User(Base):  # type: ignore
     password = sqlalchemy.Column(sqlalchemy.String, nullable=False)
     token = sqlalchemy.Column(sqlalchemy.String, unique=True, index=True)
     token_expiration_time = sqlalchemy.Column(sqlalchemy.DateTime)
+    token_generation = sqlalchemy.Column(
+        sqlalchemy.Integer, nullable=False, server_default="0"
+    )
+    # Set by revocation, recent ones are loaded by every worker.
+    tokens_revoked_at = sqlalchemy.Column(sqlalchemy.DateTime, nullable=True)
+    change_seq = sqlalchemy.Column(
+        sqlalchemy.BigInteger, nullable=False, server_default="0"
+    )
+    __table_args__ = (
+        sqlalchemy.Index(
+            "ix_users_tokens_revoked_at",
+            "tokens_revoked_at",
+            postgresql_where=text("tokens_revoked_at IS NOT NULL"),
+        ),
+    )
 
 
 users = sqlalchemy.Table(
@@ -32,53 +86,281 @@ users = sqlalchemy.Table(
     sqlalchemy.Column("password", sqlalchemy.String, nullable=False),
     sqlalchemy.Column("token", sqlalchemy.String, unique=True, index=True),
     sqlalchemy.Column("token_expiration_time", sqlalchemy.DateTime),
+    sqlalchemy.Column(
+        "token_generation", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
+    sqlalchemy.Column("tokens_revoked_at", sqlalchemy.DateTime, nullable=True),
+    sqlalchemy.Column(
+        "change_seq", sqlalchemy.BigInteger, nullable=False, server_default="0"
+    ),
+    sqlalchemy.Index(
+        "ix_users_tokens_revoked_at",
+        "tokens_revoked_at",
+        postgresql_where=text("tokens_revoked_at IS NOT NULL"),
+    ),
+)
+
+
+class LoginIdCache:
+    """
+    LRU cache of user ids by login.
+
+    Logins are never reassigned, so found ids don't expire. Unknown logins
+    are remembered for `negative_ttl_seconds`, they may be registered since.
+    """
+
+    def __init__(self, size: int, negative_ttl_seconds: float) -> None:
+        self.size = size
+        self.negative_ttl_seconds = negative_ttl_seconds
+        # Login -> (expiration time, user id or None for unknown login).
+        self._cache: "OrderedDict[str, Tuple[float, Optional[int]]]" = OrderedDict()
+
+    def get(self, login: str) -> Tuple[bool, Optional[int]]:
+        """Returns whether login is cached and its user id."""
+        cached = self._cache.get(login)
+        if cached is None:
+            return False, None
+
+        expires_at, user_id = cached
+        if expires_at < time.monotonic():
+            del self._cache[login]
+            return False, None
+
+        self._cache.move_to_end(login)
+        return True, user_id
+
+    def store(self, login: str, user_id: Optional[int]) -> None:
+        if user_id is None:
+            expires_at = time.monotonic() + self.negative_ttl_seconds
+        else:
+            expires_at = float("inf")
+        self._cache[login] = (expires_at, user_id)
+        self._cache.move_to_end(login)
+        while len(self._cache) > self.size:
+            self._cache.popitem(last=False)
+
+    def discard(self, login: str) -> None:
+        self._cache.pop(login, None)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+class TokenRefreshes:
+    """
+    Buffers sliding expiration refreshes of opaque tokens.
+
+    Token is refreshed once its expiration time is `interval_seconds` behind
+    the one it would get now, so reads turn into writes at most once per
+    interval. Buffered refreshes are written by `UserModel.flush_token_refreshes`.
+    """
+
+    def __init__(self, ttl_seconds: int, interval_seconds: int) -> None:
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.interval = timedelta(seconds=interval_seconds)
+        self._pending: Dict[Database, Dict[str, datetime]] = {}
+
+    def touch(self, shard: Database, token: str, expiration_time: datetime) -> None:
+        refreshed_expiration_time = datetime.now() + self.ttl
+        if refreshed_expiration_time - expiration_time < self.interval:
+            return
+
+        pending = self._pending.setdefault(shard, {})
+        if token not in pending:
+            token_refresh_writes.inc(stage="buffered")
+        pending[token] = refreshed_expiration_time
+
+    def pop(self) -> Dict[Database, Dict[str, datetime]]:
+        pending, self._pending = self._pending, {}
+        return pending
+
+
+login_ids = LoginIdCache(
+    size=LOGIN_ID_CACHE_SIZE, negative_ttl_seconds=LOGIN_ID_CACHE_NEGATIVE_TTL_SECONDS
 )
+token_refreshes = TokenRefreshes(
+    ttl_seconds=TOKEN_TTL_SECONDS, interval_seconds=TOKEN_REFRESH_INTERVAL_SECONDS
+)
+
+
+def refresh_tokens_query(expiration_times: List[Tuple[str, datetime]]) -> Any:
+    """Returns statement extending tokens' expiration, never shortening it."""
+    rows = ", ".join(
+        f"(:token_{index}, CAST(:expiration_time_{index} AS timestamp))"
+        for index in range(len(expiration_times))
+    )
+    values: Dict[str, Any] = {}
+    for index, (token, expiration_time) in enumerate(expiration_times):
+        values[f"token_{index}"] = token
+        values[f"expiration_time_{index}"] = expiration_time
 
+    return text(
+        f"""
+        UPDATE users
+        SET token_expiration_time = refreshed.expiration_time
+        FROM (VALUES {rows}) AS refreshed (token, expiration_time)
+        WHERE users.token = refreshed.token
+            AND users.token_expiration_time < refreshed.expiration_time
+        """
+    ).bindparams(**values)
 
+
+@traced_methods
 class UserModel:
     @classmethod
     async def create(cls, login: str, password: str) -> int:
-        insert_user_query = users.insert().values(login=login, password=password)
-        user_id = await database.execute(insert_user_query)
+        password_hash = await password_hasher.hash(password)
+        shard_index = shards.index_for_login(login)
+        insert_user_query = (
+            users.insert()
+            .values(
+                id=shards.next_id("users_id_seq", shard_index),
+                login=login,
+                password=password_hash,
+            )
+            .returning(users.c.id)
+        )
+        user_id = await shards.databases[shard_index].execute(insert_user_query)
+        # Forgets this worker's negative entry, others expire it by TTL.
+        login_ids.discard(login)
         return user_id
 
     @classmethod
     async def is_registered(cls, login: str) -> bool:
         select_user_query = users.select().where(users.c.login == login)
-        user = await database.fetch_one(select_user_query)
+        user = await shards.for_login(login).fetch_one(select_user_query)
         return bool(user)
 
+    @classmethod
+    async def check_credentials(
+        cls, login: str, password: str
+    ) -> Optional[Mapping[str, Any]]:
+        select_user_query = select(
+            [users.c.id, users.c.password, users.c.token_generation]
+        ).where(users.c.login == login)
+        shard = shards.for_login(login)
+        user = await shard.fetch_one(select_user_query)
+        if not user or not await password_hasher.verify(password, user["password"]):
+            return None
+
+        if not is_hashed(user["password"]):
+            password_hash = await password_hasher.hash(password)
+            rehash_password_query = (
+                users.update()
+                .where(
+                    and_(users.c.id == user["id"], users.c.password == user["password"])
+                )
+                .values(password=password_hash)
+            )
+            await shard.execute(rehash_password_query)
+
+        return user
+
     @classmethod
     async def authorize(cls, login: str, password: str) -> Optional[str]:
-        token = secrets.token_hex(nbytes=TOKEN_BYTES_LENGTH)
+        user = await cls.check_credentials(login, password)
+        if not user:
+            return None
+
+        if TOKEN_FORMAT == "signed":
+            return sign_token(
+                user_id=user["id"],
+                login=login,
+                generation=user["token_generation"],
+                ttl_seconds=TOKEN_TTL_SECONDS,
+            )
+
+        token = shards.tag_token(
+            user["id"], secrets.token_hex(nbytes=TOKEN_BYTES_LENGTH)
+        )
         token_expiration_time = datetime.now() + timedelta(seconds=TOKEN_TTL_SECONDS)
 
-        select_user_query = users.select().where(
-            and_(users.c.login == login, users.c.password == password)
+        set_token_query = (
+            users.update()
+            .where(users.c.id == user["id"])
+            .values(token=token, token_expiration_time=token_expiration_time)
         )
-        user = await database.execute(select_user_query)
-        if user:
+        await shards.for_user(user["id"]).execute(set_token_query)
+        return token
 
-            set_token_query = (
-                users.update()
-                .where(and_(users.c.login == login, users.c.password == password))
-                .values(token=token, token_expiration_time=token_expiration_time)
+    @classmethod
+    async def revoke_tokens(cls, user_id: int) -> None:
+        revoked_at = datetime.now()
+        revoke_tokens_query = (
+            users.update()
+            .where(users.c.id == user_id)
+            .values(
+                token=None,
+                token_expiration_time=None,
+                token_generation=users.c.token_generation + 1,
+                tokens_revoked_at=revoked_at,
             )
-            await database.execute(set_token_query)
-            return token
+            .returning(users.c.token_generation)
+        )
+        generation = await shards.for_user(user_id).execute(revoke_tokens_query)
+        if generation is not None:
+            token_revocations.revoke(user_id, generation, revoked_at)
 
-        return None
+    @classmethod
+    async def refresh_token_revocations(cls) -> None:
+        """Loads revocations of other workers, older ones revoked expired tokens."""
+        revoked_since = datetime.now() - timedelta(seconds=TOKEN_TTL_SECONDS)
+        select_revocations_query = select(
+            [users.c.id, users.c.token_generation, users.c.tokens_revoked_at]
+        ).where(users.c.tokens_revoked_at > revoked_since)
+        shards_rows = await shards.fan_out(
+            lambda shard: shard.fetch_all(select_revocations_query)
+        )
+        token_revocations.update(
+            (row["id"], row["token_generation"], row["tokens_revoked_at"])
+            for rows in shards_rows
+            for row in rows
+        )
 
     @classmethod
     async def get_authorized(cls, token: str) -> Optional[Mapping[str, Any]]:
+        if TOKEN_FORMAT == "signed" and is_signed_token(token):
+            return verify_token(token)
+
+        shard = shards.for_token(token)
+        if shard is None:
+            return None
+
         select_user_query = users.select().where(
             and_(users.c.token == token, datetime.now() < users.c.token_expiration_time)
         )
-        user = await database.fetch_one(select_user_query)
+        user = await shard.fetch_one(select_user_query)
+        if user and TOKEN_SLIDING_EXPIRATION:
+            token_refreshes.touch(shard, token, user["token_expiration_time"])
         return user
 
+    @classmethod
+    async def flush_token_refreshes(cls) -> None:
+        """Writes buffered refreshes with one statement per shard and batch."""
+        for shard, expiration_times in token_refreshes.pop().items():
+            refreshes = list(expiration_times.items())
+            while refreshes:
+                batch = refreshes[:TOKEN_REFRESH_BATCH_SIZE]
+                refreshes = refreshes[TOKEN_REFRESH_BATCH_SIZE:]
+                await shard.execute(refresh_tokens_query(batch))
+                token_refresh_writes.inc(len(batch), stage="written")
+
     @classmethod
     async def get_by_login(cls, login: str) -> Optional[Mapping[str, Any]]:
         select_user_query = users.select().where(users.c.login == login)
-        user = await database.fetch_one(select_user_query)
+        user = await shards.for_login(login).fetch_one(select_user_query)
         return user
+
+    @classmethod
+    async def get_id_by_login(cls, login: str) -> Optional[int]:
+        """Returns user id by login, without fetching user's credentials."""
+        cached, user_id = login_ids.get(login)
+        if cached:
+            login_id_lookups.inc(result="negative_hit" if user_id is None else "hit")
+            return user_id
+
+        login_id_lookups.inc(result="miss")
+        select_id_query = select([users.c.id]).where(users.c.login == login)
+        user_id = await shards.for_login(login).fetch_val(select_id_query)
+        login_ids.store(login, user_id)
+        return user_id
@@ -0,0 +1,80 @@
+import asyncio
+import zlib
+from typing import Awaitable, Callable, List, Optional, TypeVar
+
+from databases import Database
+from sqlalchemy import func
+from sqlalchemy.sql import ColumnElement
+
+__all__ = ["ShardRouter"]
+
+T = TypeVar("T")
+
+TOKEN_SHARD_SEPARATOR = "-"
+
+
+class ShardRouter:
+    """
+    Routes queries to the database owning user's data.
+
+    Users live on shard `crc32(login) % count` and get ids congruent to
+    that shard index modulo `count`, so both login and id resolve to the
+    same shard without a directory lookup. Items and sendings are stored
+    with their owner, their ids are allocated the same way to stay unique
+    across shards. Shards count can't change once data is written.
+    """
+
+    def __init__(self, databases: List[Database]) -> None:
+        self.databases = databases
+
+    @property
+    def count(self) -> int:
+        return len(self.databases)
+
+    def index_for_user(self, user_id: int) -> int:
+        return user_id % self.count
+
+    def for_user(self, user_id: int) -> Database:
+        return self.databases[self.index_for_user(user_id)]
+
+    def index_for_login(self, login: str) -> int:
+        return zlib.crc32(login.encode()) % self.count
+
+    def for_login(self, login: str) -> Database:
+        return self.databases[self.index_for_login(login)]
+
+    def next_id(self, sequence: str, shard_index: int) -> ColumnElement:
+        return func.nextval(sequence) * self.count + shard_index
+
+    def tag_token(self, user_id: int, token: str) -> str:
+        if self.count == 1:
+            return token
+        return f"{self.index_for_user(user_id)}{TOKEN_SHARD_SEPARATOR}{token}"
+
+    def for_token(self, token: str) -> Optional[Database]:
+        if self.count == 1:
+            return self.databases[0]
+
+        shard_index, _, _ = token.partition(TOKEN_SHARD_SEPARATOR)
+        if not shard_index.isdigit() or int(shard_index) >= self.count:
+            return None
+        return self.databases[int(shard_index)]
+
+    async def fan_out(self, query: Callable[[Database], Awaitable[T]]) -> List[T]:
+        """
+        Runs query on every shard, concurrently if there are several.
+
+        Must not be called inside a transaction, shard connections bound
+        to caller's context would be shared by concurrent queries.
+        """
+        if self.count == 1:
+            return [await query(self.databases[0])]
+        return list(await asyncio.gather(*(query(db) for db in self.databases)))
+
+    async def connect(self) -> None:
+        for db in self.databases:
+            await db.connect()
+
+    async def disconnect(self) -> None:
+        for db in self.databases:
+            await db.disconnect()
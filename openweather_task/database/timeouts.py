@@ -0,0 +1,65 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from databases.core import Connection
+
+from openweather_task.database.tracing import TracedConnection, TracedDatabase
+
+__all__ = [
+    "DeadlineConnection",
+    "DeadlineDatabase",
+    "remaining_statement_timeout",
+    "statement_deadline",
+]
+
+_statement_deadline: ContextVar[Optional[float]] = ContextVar(
+    "statement_deadline", default=None
+)
+
+
+@contextmanager
+def statement_deadline(seconds: Optional[float]) -> Iterator[None]:
+    """Limits statements of connections acquired within the context."""
+    deadline = None if seconds is None else time.monotonic() + seconds
+    token = _statement_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _statement_deadline.reset(token)
+
+
+def remaining_statement_timeout() -> Optional[int]:
+    """Returns milliseconds left until current deadline, None without one."""
+    deadline = _statement_deadline.get()
+    if deadline is None:
+        return None
+    # Zero would disable the timeout, so past deadlines fail on next statement.
+    return max(int((deadline - time.monotonic()) * 1000), 1)
+
+
+class DeadlineConnection(TracedConnection):
+    """
+    Sets `statement_timeout` left until deadline of the context on acquire.
+
+    Costs a round trip per connection acquired under deadline, pool resets
+    the timeout on release.
+    """
+
+    async def __aenter__(self) -> "Connection":
+        connection = await super().__aenter__()
+        timeout = remaining_statement_timeout()
+        if timeout is None or self._connection_counter > 1:
+            return connection
+
+        try:
+            await self.raw_connection.execute(f"SET statement_timeout = {timeout}")
+        except BaseException:
+            await super().__aexit__()
+            raise
+        return connection
+
+
+class DeadlineDatabase(TracedDatabase):
+    connection_class = DeadlineConnection
@@ -0,0 +1,79 @@
+from typing import Any, Union
+
+from databases import Database
+from databases.core import Connection
+from sqlalchemy.sql import ClauseElement
+
+from openweather_task.tracing import current_span, tracer
+
+__all__ = ["TracedConnection", "TracedDatabase"]
+
+MAX_STATEMENT_LENGTH = 2000
+
+Query = Union[ClauseElement, str]
+
+
+class TracedConnection(Connection):
+    """Traces pool acquire and statements of sampled requests."""
+
+    def __init__(self, database: Database) -> None:
+        super().__init__(database._backend)
+        self._instance = database.url.database
+
+    async def __aenter__(self) -> "Connection":
+        if current_span() is None or self._connection_counter:
+            return await super().__aenter__()
+
+        with tracer.span("db.acquire", **{"db.instance": self._instance}):
+            return await super().__aenter__()
+
+    def _statement(self, query: Query) -> str:
+        if isinstance(query, str):
+            return query[:MAX_STATEMENT_LENGTH]
+        try:
+            compiled = query.compile(dialect=self._backend._dialect)
+        except Exception:
+            return query.__visit_name__
+        return str(compiled)[:MAX_STATEMENT_LENGTH]
+
+    async def _traced(self, method: Any, query: Query, *args: Any) -> Any:
+        if current_span() is None:
+            return await method(query, *args)
+
+        with tracer.span(
+            "db.query",
+            **{"db.instance": self._instance, "db.statement": self._statement(query)},
+        ):
+            return await method(query, *args)
+
+    async def fetch_all(self, query: Query, values: dict = None) -> Any:
+        return await self._traced(super().fetch_all, query, values)
+
+    async def fetch_one(self, query: Query, values: dict = None) -> Any:
+        return await self._traced(super().fetch_one, query, values)
+
+    async def fetch_val(
+        self, query: Query, values: dict = None, column: Any = 0
+    ) -> Any:
+        return await self._traced(super().fetch_val, query, values, column)
+
+    async def execute(self, query: Query, values: dict = None) -> Any:
+        return await self._traced(super().execute, query, values)
+
+    async def execute_many(self, query: Query, values: list) -> None:
+        await self._traced(super().execute_many, query, values)
+
+
+class TracedDatabase(Database):
+    connection_class = TracedConnection
+
+    def connection(self) -> Connection:
+        if self._global_connection is not None:
+            return self._global_connection
+
+        try:
+            return self._connection_context.get()
+        except LookupError:
+            connection = self.connection_class(self)
+            self._connection_context.set(connection)
+            return connection
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Set
+
+import asyncpg
+
+from openweather_task import metrics
+from openweather_task.config import (
+    DATABASE_URI,
+    SENDING_EVENTS_QUEUE_SIZE,
+    SHARD_URIS,
+)
+
+__all__ = ["SENDING_EVENTS_CHANNEL", "SendingEventsListener", "sending_events"]
+
+SENDING_EVENTS_CHANNEL = "sending_events"
+
+logger = logging.getLogger(__name__)
+
+event_subscribers = metrics.gauge(
+    "sending_event_subscribers", "Open sending event streams in worker"
+)
+dropped_events = metrics.counter(
+    "sending_events_dropped_total", "Events dropped for slow subscribers"
+)
+
+
+class SendingEventsListener:
+    """
+    Fans out sending notifications to subscribed users.
+
+    Worker holds one dedicated connection per shard LISTENing on the
+    channel, regardless of subscribers count. Notifications carry
+    `user_ids` the event is addressed to.
+    """
+
+    def __init__(self, dsns: List[str], queue_size: int) -> None:
+        self.dsns = dsns
+        self.queue_size = queue_size
+        self._connections: Dict[str, asyncpg.Connection] = {}
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+
+    async def ensure_listening(self) -> None:
+        for dsn in self.dsns:
+            connection: Optional[asyncpg.Connection] = self._connections.get(dsn)
+            if connection is not None and not connection.is_closed():
+                continue
+
+            connection = await asyncpg.connect(dsn)
+            await connection.add_listener(SENDING_EVENTS_CHANNEL, self._dispatch)
+            self._connections[dsn] = connection
+
+    async def close(self) -> None:
+        connections, self._connections = self._connections, {}
+        for connection in connections.values():
+            await connection.close()
+
+    @contextmanager
+    def subscribe(self, user_id: int) -> Iterator[asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        event_subscribers.inc()
+        try:
+            yield queue
+        finally:
+            event_subscribers.dec()
+            user_queues = self._subscribers[user_id]
+            user_queues.discard(queue)
+            if not user_queues:
+                del self._subscribers[user_id]
+
+    def _dispatch(self, connection: Any, pid: int, channel: str, payload: str) -> None:
+        try:
+            event: Mapping[str, Any] = json.loads(payload)
+        except ValueError:
+            logger.warning("Malformed sending event: %r", payload)
+            return
+
+        for user_id in event.get("user_ids", ()):
+            for queue in self._subscribers.get(user_id, ()):
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    dropped_events.inc()
+
+
+sending_events = SendingEventsListener(
+    dsns=list(SHARD_URIS) or [DATABASE_URI], queue_size=SENDING_EVENTS_QUEUE_SIZE
+)
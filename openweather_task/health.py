@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from databases import Database
+
+from openweather_task import metrics
+from openweather_task.config import (
+    HEALTH_CHECK_MAX_AGE_SECONDS,
+    HEALTH_CHECK_TIMEOUT_SECONDS,
+    HEALTH_MAX_REPLICATION_LAG_SECONDS,
+)
+from openweather_task.database import pool_stats, shards
+
+__all__ = ["HealthChecker", "ShardHealth", "health_checker"]
+
+logger = logging.getLogger(__name__)
+
+database_up = metrics.gauge("database_up", "Whether shard answered last health check")
+replication_lag_seconds = metrics.gauge(
+    "database_replication_lag_seconds", "Replay lag of shard's slowest replica"
+)
+
+# Doubles as ping, NULL lag without replicas or privileges to see theirs.
+HEALTH_CHECK_QUERY = """
+SELECT (
+    SELECT extract(epoch FROM max(replay_lag)) FROM pg_stat_replication
+) AS replication_lag
+"""
+
+
+class ShardHealth:
+    __slots__ = ("up", "checked_at", "replication_lag", "error")
+
+    def __init__(self) -> None:
+        self.up = False
+        self.checked_at: Optional[float] = None
+        self.replication_lag: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def dict(self) -> Dict[str, Any]:
+        age = None if self.checked_at is None else time.monotonic() - self.checked_at
+        return dict(
+            up=self.up,
+            checked_seconds_ago=None if age is None else round(age, 3),
+            replication_lag_seconds=self.replication_lag,
+            error=self.error,
+        )
+
+
+class HealthChecker:
+    """
+    Checks shards in background, so readiness probes don't touch database.
+
+    Worker is ready while every shard answered a check within `max_age`
+    seconds, its replicas lag at most `max_replication_lag` seconds, zero
+    disables the lag check, and it isn't draining for shutdown.
+    """
+
+    def __init__(
+        self,
+        databases: List[Database],
+        timeout: float,
+        max_age: float,
+        max_replication_lag: float,
+    ) -> None:
+        self.databases = databases
+        self.timeout = timeout
+        self.max_age = max_age
+        self.max_replication_lag = max_replication_lag
+        self.draining = False
+        self.shards = [ShardHealth() for _ in databases]
+
+    async def _check_shard(self, index: int, database: Database) -> None:
+        shard = self.shards[index]
+        try:
+            lag = await asyncio.wait_for(
+                database.fetch_val(HEALTH_CHECK_QUERY), self.timeout
+            )
+        except Exception as exc:
+            if shard.up:
+                logger.warning("Shard %s health check failed: %r", index, exc)
+            shard.up, shard.error = False, repr(exc)
+        else:
+            shard.up, shard.error = True, None
+            shard.replication_lag = None if lag is None else float(lag)
+            if lag is not None:
+                replication_lag_seconds.set(float(lag), shard=str(index))
+        shard.checked_at = time.monotonic()
+        database_up.set(int(shard.up), shard=str(index))
+
+    async def check(self) -> None:
+        await asyncio.gather(
+            *(
+                self._check_shard(index, database)
+                for index, database in enumerate(self.databases)
+            )
+        )
+
+    def _shard_ready(self, shard: ShardHealth) -> bool:
+        if not shard.up or shard.checked_at is None:
+            return False
+        if time.monotonic() - shard.checked_at > self.max_age:
+            return False
+        return not (
+            self.max_replication_lag
+            and shard.replication_lag is not None
+            and shard.replication_lag > self.max_replication_lag
+        )
+
+    async def drain(self, delay: float) -> None:
+        """
+        Fails readiness for `delay` seconds before worker closes its pools.
+
+        Runs in shutdown hook, so it works regardless of server and event loop,
+        background tasks keep running meanwhile.
+        """
+        logger.info("Draining for %s seconds", delay)
+        self.draining = True
+        await asyncio.sleep(delay)
+
+    def readiness(self) -> Tuple[bool, Dict[str, Any]]:
+        """Returns whether worker is ready and state it's decided by."""
+        ready = not self.draining and all(map(self._shard_ready, self.shards))
+        return ready, dict(
+            ready=ready,
+            draining=self.draining,
+            pool=pool_stats(),
+            shards=[shard.dict() for shard in self.shards],
+        )
+
+
+health_checker = HealthChecker(
+    databases=shards.databases,
+    timeout=HEALTH_CHECK_TIMEOUT_SECONDS,
+    max_age=HEALTH_CHECK_MAX_AGE_SECONDS,
+    max_replication_lag=HEALTH_MAX_REPLICATION_LAG_SECONDS,
+)
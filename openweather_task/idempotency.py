@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from starlette import status
+from starlette.responses import JSONResponse
+
+from openweather_task.config import (
+    IDEMPOTENCY_CACHE_SIZE,
+    IDEMPOTENCY_KEY_TTL_SECONDS,
+    IDEMPOTENCY_LEASE_SECONDS,
+    IDEMPOTENCY_WAIT_TIMEOUT_SECONDS,
+)
+from openweather_task.database import shards
+from openweather_task.database.models import IdempotencyModel
+
+__all__ = [
+    "IDEMPOTENCY_KEY_HEADER",
+    "IdempotencyKeys",
+    "fingerprint",
+    "idempotency_keys_cache",
+]
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+POLL_INTERVAL_SECONDS = 0.05
+
+StoredResponse = Tuple[str, int, str]  # Fingerprint, status code, body.
+CacheKey = Tuple[int, str]  # User id, idempotency key.
+
+
+def fingerprint(route: str, request: BaseModel) -> str:
+    payload = json.dumps(
+        [route, request.dict(exclude={"token"})], sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class IdempotencyKeys:
+    """
+    Replays stored responses of mutating requests retried with same key.
+
+    Responses live in `idempotency_keys` table and are fronted by LRU cache.
+    Concurrent duplicates wait for the first execution: within the worker
+    on its future, across workers by polling the reserved row. Response is
+    stored in the transaction of handler's writes, so reservation of a
+    crashed worker has no writes and is taken over once its lease expires.
+    """
+
+    def __init__(self, cache_size: int, ttl_seconds: int, lease_seconds: int) -> None:
+        self.cache_size = cache_size
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self._cache: "OrderedDict[CacheKey, Tuple[float, StoredResponse]]" = (
+            OrderedDict()
+        )
+        self._in_flight: Dict[CacheKey, asyncio.Future] = {}
+
+    def _cached(self, cache_key: CacheKey) -> Optional[StoredResponse]:
+        cached = self._cache.get(cache_key)
+        if cached is None:
+            return None
+
+        expires_at, stored = cached
+        if expires_at < time.monotonic():
+            del self._cache[cache_key]
+            return None
+
+        self._cache.move_to_end(cache_key)
+        return stored
+
+    def _store(self, cache_key: CacheKey, stored: StoredResponse) -> None:
+        self._cache[cache_key] = (time.monotonic() + self.ttl_seconds, stored)
+        self._cache.move_to_end(cache_key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    @staticmethod
+    def _replay(
+        stored: StoredResponse,
+        request_fingerprint: str,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> JSONResponse:
+        stored_fingerprint, status_code, body = stored
+        if stored_fingerprint != request_fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was used with different request",
+            )
+
+        return JSONResponse(
+            status_code=status_code,
+            content=json.loads(body),
+            headers={**(headers or {}), "Idempotent-Replayed": "true"},
+        )
+
+    async def _wait_stored(self, user_id: int, key: str) -> Optional[StoredResponse]:
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_TIMEOUT_SECONDS
+        while time.monotonic() < deadline:
+            row = await IdempotencyModel.get(user_id, key)
+            if row is None:
+                return None
+            if row["status_code"] is not None:
+                return row["fingerprint"], row["status_code"], row["response"]
+            if row["expires_at"] < datetime.now():
+                # Lease of reservation expired, it's free to be taken over.
+                return None
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Request with this Idempotency-Key is in progress",
+        )
+
+    async def execute(
+        self,
+        user_id: int,
+        key: str,
+        request_fingerprint: str,
+        status_code: int,
+        handler: Callable[[], Awaitable[BaseModel]],
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Any:
+        """
+        Runs handler once per key, replays its response to retries.
+
+        Route's `headers` are added to replays, they aren't stored.
+        """
+        cache_key = (user_id, key)
+        while True:
+            stored = self._cached(cache_key)
+            if stored is not None:
+                return self._replay(stored, request_fingerprint, headers)
+
+            in_flight = self._in_flight.get(cache_key)
+            if in_flight is None:
+                break
+            await asyncio.shield(in_flight)
+
+        done = asyncio.get_event_loop().create_future()
+        self._in_flight[cache_key] = done
+        try:
+            while True:
+                lease_expires_at = datetime.now() + timedelta(
+                    seconds=self.lease_seconds
+                )
+                if await IdempotencyModel.reserve(
+                    user_id, key, request_fingerprint, lease_expires_at
+                ):
+                    break
+
+                stored = await self._wait_stored(user_id, key)
+                if stored is not None:
+                    self._store(cache_key, stored)
+                    return self._replay(stored, request_fingerprint, headers)
+                # First execution failed or its lease expired, retry reservation.
+
+            try:
+                async with shards.for_user(user_id).transaction():
+                    response = await handler()
+                    body = response.json()
+                    expires_at = datetime.now() + timedelta(seconds=self.ttl_seconds)
+                    if not await IdempotencyModel.complete(
+                        user_id, key, lease_expires_at, status_code, body, expires_at
+                    ):
+                        # Lease was taken over, its execution owns the key.
+                        raise HTTPException(
+                            status_code=status.HTTP_409_CONFLICT,
+                            detail="Request with this Idempotency-Key is in progress",
+                        )
+            except BaseException:
+                await IdempotencyModel.release(user_id, key, lease_expires_at)
+                raise
+
+            self._store(cache_key, (request_fingerprint, status_code, body))
+            return response
+        finally:
+            del self._in_flight[cache_key]
+            done.set_result(None)
+
+
+idempotency_keys_cache = IdempotencyKeys(
+    cache_size=IDEMPOTENCY_CACHE_SIZE,
+    ttl_seconds=IDEMPOTENCY_KEY_TTL_SECONDS,
+    lease_seconds=IDEMPOTENCY_LEASE_SECONDS,
+)
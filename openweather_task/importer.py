@@ -0,0 +1,398 @@
+"""
+Bulk import of users and items.
+
+Usage: python -m openweather_task.importer {users,items} <path or -> [options]
+
+Users input has `login` and `password` columns, items input has `login`
+of the owner and `name` columns, as CSV with header or NDJSON.
+"""
+import argparse
+import asyncio
+import codecs
+import csv
+import json
+import logging
+import sys
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+from openweather_task import metrics
+from openweather_task.config import (
+    BULK_IMPORT_BATCH_SIZE,
+    BULK_IMPORT_HASHING_WORKERS,
+    PASSWORD_HASHING_EXECUTOR,
+)
+from openweather_task.database import shards
+from openweather_task.security import PasswordHasher, is_hashed
+
+__all__ = [
+    "ImportStats",
+    "import_items",
+    "import_password_hasher",
+    "import_users",
+    "iter_lines",
+    "parse_records",
+]
+
+logger = logging.getLogger(__name__)
+
+imported_rows = metrics.counter(
+    "bulk_imported_rows_total", "Rows merged by bulk import"
+)
+
+import_password_hasher = PasswordHasher(
+    executor=PASSWORD_HASHING_EXECUTOR,
+    max_workers=BULK_IMPORT_HASHING_WORKERS,
+    max_concurrency=BULK_IMPORT_HASHING_WORKERS,
+    pool="import",
+)
+
+FORMATS = ("csv", "ndjson")
+ON_CONFLICT = ("skip", "update")
+
+Record = Dict[str, Any]
+
+
+class ImportStats:
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+        self.rows = 0
+        self.imported = 0
+        self.updated = 0
+        self.skipped = 0
+        self.started_at = time.monotonic()
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / max(time.monotonic() - self.started_at, 1e-9)
+
+    def dict(self) -> Dict[str, int]:
+        return dict(
+            rows=self.rows,
+            imported=self.imported,
+            updated=self.updated,
+            skipped=self.skipped,
+        )
+
+    def __str__(self) -> str:
+        return (
+            f"{self.kind}: {self.rows} rows, {self.imported} imported, "
+            f"{self.updated} updated, {self.skipped} skipped, "
+            f"{self.rows_per_second:.0f} rows/s"
+        )
+
+
+ProgressCallback = Callable[[ImportStats], None]
+
+# Staging tables live until the end of batch transaction.
+CREATE_USERS_STAGING = """
+    CREATE TEMP TABLE user_import (
+        row bigint NOT NULL, login varchar NOT NULL, password varchar NOT NULL
+    ) ON COMMIT DROP
+"""
+CREATE_ITEMS_STAGING = """
+    CREATE TEMP TABLE item_import (
+        row bigint NOT NULL, login varchar NOT NULL, name varchar NOT NULL
+    ) ON COMMIT DROP
+"""
+
+# Last row wins among duplicate logins of one batch.
+MERGE_USERS = """
+    WITH merged AS (
+        INSERT INTO users (id, login, password)
+        SELECT nextval('users_id_seq') * $1 + $2, login, password
+        FROM (
+            SELECT DISTINCT ON (login) login, password
+            FROM user_import
+            ORDER BY login, row DESC
+        ) AS batch
+        ON CONFLICT (login) DO {on_conflict}
+        RETURNING xmax = 0 AS inserted
+    )
+    SELECT
+        count(*) FILTER (WHERE inserted) AS imported,
+        count(*) FILTER (WHERE NOT inserted) AS updated
+    FROM merged
+"""
+ON_CONFLICT_ACTIONS = {
+    "skip": "NOTHING",
+    "update": "UPDATE SET password = EXCLUDED.password",
+}
+
+# Owners are locked in id order first, as in `ItemChangeModel.record`,
+# then their change sequences are bumped once per batch.
+LOCK_ITEM_OWNERS = """
+    SELECT id FROM users
+    WHERE login IN (SELECT login FROM item_import)
+    ORDER BY id
+    FOR UPDATE
+"""
+MERGE_ITEMS = """
+    WITH new_items AS (
+        INSERT INTO items (id, user_id, name)
+        SELECT nextval('items_id_seq') * $1 + $2, users.id, item_import.name
+        FROM item_import JOIN users ON users.login = item_import.login
+        ORDER BY item_import.row
+        RETURNING id, user_id, name
+    ), numbered AS (
+        SELECT
+            id,
+            user_id,
+            name,
+            row_number() OVER (PARTITION BY user_id ORDER BY id) AS position,
+            count(*) OVER (PARTITION BY user_id) AS user_total
+        FROM new_items
+    ), bumped AS (
+        UPDATE users SET change_seq = users.change_seq + totals.user_total
+        FROM (SELECT DISTINCT user_id, user_total FROM numbered) AS totals
+        WHERE users.id = totals.user_id
+        RETURNING users.id, users.change_seq
+    ), changes AS (
+        INSERT INTO item_changes (user_id, seq, item_id, operation, name, created_at)
+        SELECT
+            numbered.user_id,
+            bumped.change_seq - numbered.user_total + numbered.position,
+            numbered.id,
+            'upsert',
+            numbered.name,
+            now()::timestamp
+        FROM numbered JOIN bumped ON bumped.id = numbered.user_id
+        RETURNING 1
+    )
+    SELECT count(*) FROM changes
+"""
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Splits byte stream into text lines keeping one chunk in memory."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    tail = ""
+    async for chunk in chunks:
+        text = tail + decoder.decode(chunk)
+        *lines, tail = text.split("\n")
+        for line in lines:
+            yield line
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def parse_records(
+    lines: AsyncIterator[str], format_: str, columns: Tuple[str, ...]
+) -> AsyncIterator[Record]:
+    """
+    Parses records with `columns` from CSV with header or NDJSON lines.
+
+    CSV values must not contain line breaks.
+    """
+    header: Optional[List[str]] = None
+    async for line in lines:
+        line = line.rstrip("\r")
+        if not line.strip():
+            continue
+
+        if format_ == "ndjson":
+            record = json.loads(line)
+        elif header is None:
+            header = next(csv.reader([line]))
+            missing = set(columns) - set(header)
+            if missing:
+                raise ValueError(f"Missing CSV columns: {', '.join(sorted(missing))}")
+            continue
+        else:
+            record = dict(zip(header, next(csv.reader([line]))))
+
+        if not all(isinstance(record.get(column), str) for column in columns):
+            raise ValueError(f"Malformed record: {line[:200]!r}")
+        yield {column: record[column] for column in columns}
+
+
+async def batches(
+    records: AsyncIterator[Record], batch_size: int
+) -> AsyncIterator[List[Record]]:
+    batch: List[Record] = []
+    async for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def by_shard(batch: Iterable[Record]) -> Dict[int, List[Record]]:
+    # Items follow owner's login, the same key users are placed by.
+    shard_batches: Dict[int, List[Record]] = {}
+    for record in batch:
+        shard_index = shards.index_for_login(record["login"])
+        shard_batches.setdefault(shard_index, []).append(record)
+    return shard_batches
+
+
+async def _copy_and_merge(
+    shard_index: int,
+    create_staging: str,
+    staging_table: str,
+    columns: Tuple[str, ...],
+    records: List[Tuple[Any, ...]],
+    merge: Callable[[Any], Any],
+) -> Any:
+    async with shards.databases[shard_index].connection() as connection:
+        raw_connection = connection.raw_connection
+        async with raw_connection.transaction():
+            await raw_connection.execute(create_staging)
+            # Binary COPY protocol.
+            await raw_connection.copy_records_to_table(
+                staging_table, records=records, columns=columns
+            )
+            return await merge(raw_connection)
+
+
+async def hash_passwords(records: List[Record]) -> None:
+    """Hashes plain text passwords, as many at once as import pool runs."""
+    plain = [record for record in records if not is_hashed(record["password"])]
+    step = import_password_hasher.max_concurrency
+    for start in range(0, len(plain), step):
+        end = start + step
+        chunk = plain[start:end]
+        passwords = await asyncio.gather(
+            *(import_password_hasher.hash(record["password"]) for record in chunk)
+        )
+        for record, password in zip(chunk, passwords):
+            record["password"] = password
+
+
+async def import_users(
+    lines: AsyncIterator[str],
+    format_: str = "csv",
+    on_conflict: str = "skip",
+    batch_size: int = BULK_IMPORT_BATCH_SIZE,
+    progress: Optional[ProgressCallback] = None,
+) -> ImportStats:
+    """
+    Imports users, existing logins are skipped or get imported password.
+
+    Plain text passwords are hashed, already hashed ones are stored as is.
+    """
+    merge_users = MERGE_USERS.format(on_conflict=ON_CONFLICT_ACTIONS[on_conflict])
+    stats = ImportStats("users")
+    records = parse_records(lines, format_, ("login", "password"))
+    async for batch in batches(records, batch_size):
+        await hash_passwords(batch)
+
+        for shard_index, shard_batch in by_shard(batch).items():
+            imported, updated = await _copy_and_merge(
+                shard_index,
+                CREATE_USERS_STAGING,
+                "user_import",
+                ("row", "login", "password"),
+                [
+                    (stats.rows + position, record["login"], record["password"])
+                    for position, record in enumerate(shard_batch)
+                ],
+                lambda connection: connection.fetchrow(
+                    merge_users, shards.count, shard_index
+                ),
+            )
+            stats.rows += len(shard_batch)
+            stats.imported += imported
+            stats.updated += updated
+            stats.skipped += len(shard_batch) - imported - updated
+
+        imported_rows.inc(len(batch), kind="users")
+        if progress is not None:
+            progress(stats)
+    return stats
+
+
+async def import_items(
+    lines: AsyncIterator[str],
+    format_: str = "csv",
+    batch_size: int = BULK_IMPORT_BATCH_SIZE,
+    progress: Optional[ProgressCallback] = None,
+) -> ImportStats:
+    """Imports items of users by login, items of unknown users are skipped."""
+
+    async def merge(connection: Any) -> int:
+        await connection.execute(LOCK_ITEM_OWNERS)
+        return await connection.fetchval(MERGE_ITEMS, shards.count, shard_index)
+
+    stats = ImportStats("items")
+    records = parse_records(lines, format_, ("login", "name"))
+    async for batch in batches(records, batch_size):
+        for shard_index, shard_batch in by_shard(batch).items():
+            imported = await _copy_and_merge(
+                shard_index,
+                CREATE_ITEMS_STAGING,
+                "item_import",
+                ("row", "login", "name"),
+                [
+                    (stats.rows + position, record["login"], record["name"])
+                    for position, record in enumerate(shard_batch)
+                ],
+                merge,
+            )
+            stats.rows += len(shard_batch)
+            stats.imported += imported
+            stats.skipped += len(shard_batch) - imported
+
+        imported_rows.inc(len(batch), kind="items")
+        if progress is not None:
+            progress(stats)
+    return stats
+
+
+async def read_file(path: str) -> AsyncIterator[bytes]:
+    stream = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        while True:
+            chunk = stream.read(1 << 16)
+            if not chunk:
+                return
+            yield chunk
+            await asyncio.sleep(0)
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+
+async def run(args: argparse.Namespace) -> ImportStats:
+    def report(stats: ImportStats) -> None:
+        print(stats, file=sys.stderr)
+
+    await shards.connect()
+    import_password_hasher.start()
+    try:
+        lines = iter_lines(read_file(args.path))
+        if args.kind == "users":
+            return await import_users(
+                lines, args.format, args.on_conflict, args.batch_size, report
+            )
+        return await import_items(lines, args.format, args.batch_size, report)
+    finally:
+        import_password_hasher.stop()
+        await shards.disconnect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk import users or items.")
+    parser.add_argument("kind", choices=("users", "items"))
+    parser.add_argument("path", help="input file, - for stdin")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--on-conflict", choices=ON_CONFLICT, default="skip")
+    parser.add_argument("--batch-size", type=int, default=BULK_IMPORT_BATCH_SIZE)
+    stats = asyncio.run(run(parser.parse_args()))
+    print(json.dumps(stats.dict()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,179 @@
+import asyncio
+import signal
+
 from fastapi import FastAPI
 from starlette.responses import RedirectResponse
 
-from openweather_task.config import APP_NAME, DEBUG
-from openweather_task.database import database
+from openweather_task.config import (
+    APP_NAME,
+    CANCEL_ON_DISCONNECT,
+    COMPRESSION_BROTLI_QUALITY,
+    COMPRESSION_GZIP_LEVEL,
+    COMPRESSION_MINIMUM_SIZE,
+    DEBUG,
+    HEALTH_CHECK_INTERVAL_SECONDS,
+    IDEMPOTENCY_PURGE_INTERVAL_SECONDS,
+    ITEM_CHANGES_COMPACTION_INTERVAL_SECONDS,
+    ITEM_PURGE_INTERVAL_SECONDS,
+    LOAD_SHEDDING_MAX_LOOP_LAG_SECONDS,
+    LOAD_SHEDDING_MAX_POOL_WAITERS,
+    LOAD_SHEDDING_RETRY_AFTER_SECONDS,
+    PROFILING_ENABLED,
+    PROFILING_FLUSH_INTERVAL_SECONDS,
+    PROFILING_TOGGLE_SIGNAL,
+    RATE_LIMITER_MAX_BUCKETS,
+    RATE_LIMITS,
+    SENDING_EVENTS_RECONNECT_SECONDS,
+    SHARD_OUTBOX_RELAY_INTERVAL_SECONDS,
+    SHUTDOWN_DRAIN_SECONDS,
+    TOKEN_FORMAT,
+    TOKEN_REFRESH_FLUSH_INTERVAL_SECONDS,
+    TOKEN_REVOCATIONS_REFRESH_SECONDS,
+    TOKEN_SLIDING_EXPIRATION,
+    TRACING_EXPORT_INTERVAL_SECONDS,
+)
+from openweather_task.database import shards
+from openweather_task.database.models import (
+    IdempotencyModel,
+    ItemChangeModel,
+    ItemModel,
+    OutboxModel,
+    UserModel,
+)
+from openweather_task.events import sending_events
+from openweather_task.health import health_checker
+from openweather_task.importer import import_password_hasher
+from openweather_task.middleware import (
+    CancelOnDisconnectMiddleware,
+    CompressionMiddleware,
+    LoadSheddingMiddleware,
+    ProfilingMiddleware,
+    RateLimitMiddleware,
+    TracingMiddleware,
+    parse_rate_limits,
+)
+from openweather_task.monitoring import loop_lag_monitor
+from openweather_task.profiling import profiler
+from openweather_task.security import password_hasher
+from openweather_task.tasks import PeriodicTask
+from openweather_task.tracing import tracer
 
-from .routers import items, users
+from .routers import admin, batch, events, health, items, metrics, users
 
 app: FastAPI = FastAPI(title=APP_NAME, debug=DEBUG)
 
+# Innermost, so cancellation reaches handler without unwinding other middleware.
+if CANCEL_ON_DISCONNECT:
+    app.add_middleware(CancelOnDisconnectMiddleware)
+if COMPRESSION_MINIMUM_SIZE:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=COMPRESSION_MINIMUM_SIZE,
+        gzip_level=COMPRESSION_GZIP_LEVEL,
+        brotli_quality=COMPRESSION_BROTLI_QUALITY,
+    )
+
+rate_limits = parse_rate_limits(RATE_LIMITS)
+if rate_limits:
+    app.add_middleware(
+        RateLimitMiddleware, limits=rate_limits, max_buckets=RATE_LIMITER_MAX_BUCKETS
+    )
+app.add_middleware(
+    LoadSheddingMiddleware,
+    max_pool_waiters=LOAD_SHEDDING_MAX_POOL_WAITERS,
+    max_loop_lag_seconds=LOAD_SHEDDING_MAX_LOOP_LAG_SECONDS,
+    retry_after_seconds=LOAD_SHEDDING_RETRY_AFTER_SECONDS,
+    exempt_paths=("/metrics", "/healthz", "/readyz"),
+)
+# Installed while profiler may be toggled by signal, it's idle until enabled.
+profiling = PROFILING_ENABLED or bool(PROFILING_TOGGLE_SIGNAL)
+if profiling:
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+# Outermost, so admission control and rate limiting are traced too.
+if tracer.enabled:
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+
+background_tasks = [
+    PeriodicTask(loop_lag_monitor.measure, interval=0),
+    PeriodicTask(health_checker.check, interval=HEALTH_CHECK_INTERVAL_SECONDS),
+    # Reconnects shared LISTEN connection if it was lost.
+    PeriodicTask(
+        sending_events.ensure_listening, interval=SENDING_EVENTS_RECONNECT_SECONDS
+    ),
+    PeriodicTask(
+        IdempotencyModel.purge_expired, interval=IDEMPOTENCY_PURGE_INTERVAL_SECONDS
+    ),
+    PeriodicTask(
+        ItemChangeModel.compact_expired,
+        interval=ITEM_CHANGES_COMPACTION_INTERVAL_SECONDS,
+    ),
+    # Runs regardless of ITEM_SOFT_DELETE, so leftovers are purged once disabled.
+    PeriodicTask(ItemModel.purge_deleted, interval=ITEM_PURGE_INTERVAL_SECONDS),
+]
+if shards.count > 1:
+    background_tasks.append(
+        PeriodicTask(
+            OutboxModel.relay_pending, interval=SHARD_OUTBOX_RELAY_INTERVAL_SECONDS
+        )
+    )
+if tracer.enabled:
+    background_tasks.append(
+        PeriodicTask(tracer.flush, interval=TRACING_EXPORT_INTERVAL_SECONDS)
+    )
+if profiling:
+    background_tasks.append(
+        PeriodicTask(profiler.flush, interval=PROFILING_FLUSH_INTERVAL_SECONDS)
+    )
+if TOKEN_FORMAT == "signed":
+    background_tasks.append(
+        PeriodicTask(
+            UserModel.refresh_token_revocations,
+            interval=TOKEN_REVOCATIONS_REFRESH_SECONDS,
+        )
+    )
+if TOKEN_SLIDING_EXPIRATION:
+    background_tasks.append(
+        PeriodicTask(
+            UserModel.flush_token_refreshes,
+            interval=TOKEN_REFRESH_FLUSH_INTERVAL_SECONDS,
+        )
+    )
+
 
 @app.on_event("startup")
 async def startup():
-    await database.connect()
+    await shards.connect()
+    health_checker.draining = False
+    password_hasher.start()
+    loop_lag_monitor.start()
+    if PROFILING_ENABLED:
+        profiler.start()
+    if PROFILING_TOGGLE_SIGNAL:
+        asyncio.get_event_loop().add_signal_handler(
+            getattr(signal, PROFILING_TOGGLE_SIGNAL), profiler.toggle
+        )
+    for task in background_tasks:
+        task.start()
 
 
 @app.on_event("shutdown")
 async def shutdown():
-    await database.disconnect()
+    await health_checker.drain(SHUTDOWN_DRAIN_SECONDS)
+    for task in background_tasks:
+        await task.stop()
+    await UserModel.flush_token_refreshes()
+    await tracer.flush()
+    if PROFILING_TOGGLE_SIGNAL:
+        asyncio.get_event_loop().remove_signal_handler(
+            getattr(signal, PROFILING_TOGGLE_SIGNAL)
+        )
+    profiler.stop()
+    await profiler.flush()
+    loop_lag_monitor.stop()
+    password_hasher.stop()
+    import_password_hasher.stop()
+    await sending_events.close()
+    await shards.disconnect()
 
 
 @app.get("/")
@@ -26,3 +183,8 @@ async def redirect_to_docs() -> RedirectResponse:
 
 app.include_router(users.router)
 app.include_router(items.router)
+app.include_router(batch.router)
+app.include_router(metrics.router)
+app.include_router(events.router)
+app.include_router(admin.router)
+app.include_router(health.router)
@@ -0,0 +1,123 @@
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+__all__ = ["Counter", "Gauge", "Histogram", "counter", "gauge", "histogram", "render"]
+
+Labels = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Metric:
+    type_ = ""
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.type_}",
+        ]
+        return "\n".join(header + self.samples())
+
+
+class Counter(Metric):
+    type_ = "counter"
+
+    def __init__(self, name: str, description: str) -> None:
+        super().__init__(name, description)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _labels(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self.values.get(_labels(labels), 0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(labels)} {value}"
+            for labels, value in self.values.items()
+        ]
+
+
+class Gauge(Counter):
+    type_ = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        self.values[_labels(labels)] = value
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type_ = "histogram"
+
+    def __init__(
+        self, name: str, description: str, buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, description)
+        self.buckets = tuple(buckets)
+        self.counts: Dict[Labels, List[int]] = {}
+        self.sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _labels(labels)
+        counts = self.counts.setdefault(key, [0] * (len(self.buckets) + 1))
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[key] = self.sums.get(key, 0) + value
+
+    def samples(self) -> List[str]:
+        samples = []
+        for labels, counts in self.counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                bucket_labels = _format_labels(labels + (("le", str(bound)),))
+                samples.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            formatted_labels = _format_labels(labels)
+            samples.append(f"{self.name}_sum{formatted_labels} {self.sums[labels]}")
+            samples.append(f"{self.name}_count{formatted_labels} {cumulative}")
+        return samples
+
+
+_registry: Dict[str, Metric] = {}
+
+
+def _register(metric: Metric) -> Metric:
+    return _registry.setdefault(metric.name, metric)
+
+
+def counter(name: str, description: str) -> Counter:
+    return _register(Counter(name, description))  # type: ignore
+
+
+def gauge(name: str, description: str) -> Gauge:
+    return _register(Gauge(name, description))  # type: ignore
+
+
+def histogram(
+    name: str, description: str, buckets: Sequence[float] = DEFAULT_BUCKETS
+) -> Histogram:
+    return _register(Histogram(name, description, buckets))  # type: ignore
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in _registry.values()) + "\n"
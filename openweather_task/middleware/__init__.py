@@ -0,0 +1,6 @@
+from .compression import *  # noqa
+from .disconnect import *  # noqa
+from .load_shedding import *  # noqa
+from .profiling import *  # noqa
+from .rate_limit import *  # noqa
+from .tracing import *  # noqa
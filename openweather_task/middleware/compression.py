@@ -0,0 +1,149 @@
+import zlib
+from typing import Callable, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from openweather_task import metrics
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+__all__ = ["CompressionMiddleware", "parse_accept_encoding"]
+
+compressed_bytes = metrics.counter(
+    "response_compressed_bytes_total", "Response body bytes by compression stage"
+)
+
+
+def parse_accept_encoding(accept_encoding: str) -> List[str]:
+    """Returns accepted content codings, most preferred first."""
+    codings = []
+    for position, part in enumerate(accept_encoding.split(",")):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            codings.append((-quality, position, coding.strip().lower()))
+    return [coding for _, _, coding in sorted(codings)]
+
+
+class Compressor:
+    """Compresses body chunks, flushing each so streamed events aren't held."""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int) -> None:
+        self._finish: Callable[[], bytes]
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=brotli_quality)
+            self._process: Callable[[bytes], bytes] = compressor.process
+            self._flush: Callable[[], bytes] = compressor.flush
+            self._finish = compressor.finish
+        else:
+            # 16 + MAX_WBITS writes gzip header and trailer.
+            compressor = zlib.compressobj(
+                gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+            )
+            self._process = compressor.compress
+            self._flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = compressor.flush
+
+    def compress(self, chunk: bytes, last: bool) -> bytes:
+        compressed = self._process(chunk)
+        return compressed + (self._finish() if last else self._flush())
+
+
+class CompressionMiddleware:
+    """
+    Compresses response bodies of at least `minimum_size` bytes.
+
+    Brotli is preferred when installed and accepted by client, gzip otherwise.
+    Streamed responses are compressed chunk by chunk regardless of size.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int,
+        gzip_level: int,
+        brotli_quality: int,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = ("br", "gzip") if brotli is not None else ("gzip",)
+
+    def choose_encoding(self, accept_encoding: str) -> Optional[str]:
+        for coding in parse_accept_encoding(accept_encoding):
+            if coding in self.encodings:
+                return coding
+            if coding == "*":
+                return self.encodings[0]
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self.choose_encoding(
+            Headers(scope=scope).get("accept-encoding", "")
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Message = {}
+        compressor: Optional[Compressor] = None
+        started = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start_message, compressor, started
+            if message["type"] == "http.response.start":
+                # Headers depend on the first body chunk, hold them until it.
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if not started:
+                started = True
+                headers = MutableHeaders(raw=start_message["headers"])
+                if "content-encoding" in headers or (
+                    not more_body and len(body) < self.minimum_size
+                ):
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                compressor = Compressor(encoding, self.gzip_level, self.brotli_quality)
+                compressed = compressor.compress(body, last=not more_body)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(compressed))
+                await send(start_message)
+            elif compressor is None:
+                await send(message)
+                return
+            else:
+                compressed = compressor.compress(body, last=not more_body)
+
+            compressed_bytes.inc(len(body), stage="in")
+            compressed_bytes.inc(len(compressed), stage="out")
+            await send({**message, "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
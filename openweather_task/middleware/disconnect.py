@@ -0,0 +1,73 @@
+import asyncio
+from typing import Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from openweather_task import metrics
+
+__all__ = ["CancelOnDisconnectMiddleware"]
+
+cancelled_requests = metrics.counter(
+    "client_disconnects_total", "Requests cancelled as client disconnected"
+)
+
+
+class CancelOnDisconnectMiddleware:
+    """
+    Cancels handling of request once its client disconnects.
+
+    Cancellation interrupts awaited queries, asyncpg cancels them on server,
+    so abandoned requests don't hold pooled connections. Request keeps
+    being handled in its own task, client's messages are relayed to app by a
+    watcher. Watcher reads at most one message ahead of app, so request body
+    isn't buffered beyond it and disconnect is noticed once app has taken it.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        task: Optional[asyncio.Task] = asyncio.current_task()
+        assert task is not None
+        messages: "asyncio.Queue[Message]" = asyncio.Queue(maxsize=1)
+        response_complete = disconnected = False
+
+        async def send_tracked(message: Message) -> None:
+            nonlocal response_complete
+            if message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                response_complete = True
+            await send(message)
+
+        async def watch() -> None:
+            nonlocal disconnected
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect" and not response_complete:
+                    # Watcher runs while app awaits, so it's cancelled there.
+                    disconnected = True
+                    task.cancel()
+                # Waits for app to take previous message, keeping backpressure.
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    return
+
+        watcher = asyncio.ensure_future(watch())
+        try:
+            await self.app(scope, messages.get, send_tracked)
+        except asyncio.CancelledError:
+            if not disconnected:
+                # Server cancelled the request itself.
+                raise
+            # Python 3.11 counts cancellations for timeouts and task groups.
+            if hasattr(task, "uncancel"):
+                task.uncancel()
+            endpoint = scope.get("endpoint")
+            cancelled_requests.inc(route=getattr(endpoint, "__name__", "unknown"))
+        finally:
+            watcher.cancel()
@@ -0,0 +1,64 @@
+from starlette import status
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from openweather_task import metrics
+from openweather_task.database import pool_stats
+from openweather_task.monitoring import loop_lag_monitor
+
+__all__ = ["LoadSheddingMiddleware"]
+
+shed_requests = metrics.counter(
+    "shed_requests_total", "Requests rejected by admission control"
+)
+
+
+class LoadSheddingMiddleware:
+    """
+    Fails fast with 503 while worker is overloaded.
+
+    Worker is overloaded when too many coroutines wait for pooled
+    connection or event loop lags behind. Zero threshold disables the check.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        max_pool_waiters: int,
+        max_loop_lag_seconds: float,
+        retry_after_seconds: int,
+        exempt_paths: tuple = ("/metrics",),
+    ) -> None:
+        self.app = app
+        self.max_pool_waiters = max_pool_waiters
+        self.max_loop_lag_seconds = max_loop_lag_seconds
+        self.retry_after_seconds = retry_after_seconds
+        self.exempt_paths = exempt_paths
+
+    def overload_reason(self) -> str:
+        if self.max_pool_waiters and pool_stats()["waiters"] > self.max_pool_waiters:
+            return "pool_waiters"
+        if (
+            self.max_loop_lag_seconds
+            and loop_lag_monitor.lag > self.max_loop_lag_seconds
+        ):
+            return "loop_lag"
+        return ""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        reason = self.overload_reason()
+        if not reason:
+            await self.app(scope, receive, send)
+            return
+
+        shed_requests.inc(reason=reason)
+        response = JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "Service is overloaded"},
+            headers={"Retry-After": str(self.retry_after_seconds)},
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,41 @@
+import random
+import sys
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from openweather_task.profiling import SamplingProfiler
+
+__all__ = ["ProfilingMiddleware"]
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+class ProfilingMiddleware:
+    """
+    Registers sampled requests in profiler while it's enabled.
+
+    Profiles are aggregated by endpoint name, set in scope by routing.
+    """
+
+    def __init__(self, app: ASGIApp, profiler: SamplingProfiler) -> None:
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or not self.profiler.enabled
+            or random.random() >= self.profiler.sample_rate
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        # This coroutine's frame marks where request's stacks begin.
+        frame = sys._getframe()
+        request = self.profiler.begin(frame)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            endpoint = scope.get("endpoint")
+            route = getattr(endpoint, "__name__", UNMATCHED_ROUTE)
+            self.profiler.end(frame, request, route)
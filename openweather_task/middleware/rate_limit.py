@@ -0,0 +1,201 @@
+import json
+import math
+import time
+from collections import OrderedDict
+from typing import List, Optional, Pattern, Tuple
+from urllib.parse import parse_qs
+
+from starlette import status
+from starlette.responses import JSONResponse
+from starlette.routing import compile_path
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from openweather_task import metrics
+
+__all__ = ["RateLimitMiddleware", "RouteLimit", "parse_rate_limits"]
+
+rate_limited_requests = metrics.counter(
+    "rate_limited_requests_total", "Requests rejected by per-token rate limits"
+)
+
+
+class RouteLimit:
+    def __init__(
+        self, method: Optional[str], path: str, rate: float, burst: float
+    ) -> None:
+        self.method = method
+        self.path = path
+        self.path_regex: Optional[Pattern] = (
+            None if path == "*" else compile_path(path)[0]
+        )
+        self.rate = rate
+        self.burst = burst
+
+    @property
+    def name(self) -> str:
+        return f"{self.method} {self.path}" if self.method else self.path
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.method and self.method != method:
+            return False
+        return self.path_regex is None or bool(self.path_regex.match(path))
+
+
+def parse_rate_limits(spec: str) -> List[RouteLimit]:
+    """
+    Parses limits like "POST /items/new=5:10;*=50:100".
+
+    Each limit is `[METHOD ]<path>=<tokens per second>:<burst>`,
+    the first matching one is applied.
+    """
+    limits = []
+    for entry in filter(None, (entry.strip() for entry in spec.split(";"))):
+        route, _, values = entry.rpartition("=")
+        rate, _, burst = values.partition(":")
+        method, _, path = route.strip().rpartition(" ")
+        limits.append(
+            RouteLimit(
+                method=method.upper() or None,
+                path=path,
+                rate=float(rate),
+                burst=float(burst or rate),
+            )
+        )
+    return limits
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+
+    def take(self, now: float) -> float:
+        """Returns 0 if request is allowed, otherwise seconds to wait."""
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimitMiddleware:
+    """
+    Applies token bucket limits per access token and route.
+
+    Token is taken from `token` query parameter or JSON body field. Token
+    gets its own bucket once application accepts it, requests without one,
+    and so with made up tokens, are limited per client address.
+    """
+
+    def __init__(
+        self, app: ASGIApp, limits: List[RouteLimit], max_buckets: int
+    ) -> None:
+        self.app = app
+        self.limits = limits
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+
+    def match(self, method: str, path: str) -> Optional[RouteLimit]:
+        for limit in self.limits:
+            if limit.matches(method, path):
+                return limit
+        return None
+
+    def find_bucket(self, limit: RouteLimit, client_key: str) -> Optional[TokenBucket]:
+        bucket_key = (limit.name, client_key)
+        bucket = self._buckets.get(bucket_key)
+        if bucket is not None:
+            self._buckets.move_to_end(bucket_key)
+        return bucket
+
+    def bucket(self, limit: RouteLimit, client_key: str) -> TokenBucket:
+        bucket = self.find_bucket(limit, client_key)
+        if bucket is None:
+            bucket = TokenBucket(limit.rate, limit.burst, time.monotonic())
+            self._buckets[(limit.name, client_key)] = bucket
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return bucket
+
+    def bucket_on_acceptance(self, limit: RouteLimit, token: str, send: Send) -> Send:
+        """Gives token a bucket once response shows it was accepted."""
+
+        async def send_tracked(message: Message) -> None:
+            if (
+                message["type"] == "http.response.start"
+                and message["status"] != status.HTTP_401_UNAUTHORIZED
+            ):
+                self.bucket(limit, f"token:{token}").take(time.monotonic())
+            await send(message)
+
+        return send_tracked
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.match(scope["method"], scope["path"])
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        token, receive = await self.extract_token(scope, receive)
+        bucket = self.find_bucket(limit, f"token:{token}") if token else None
+        if bucket is None:
+            client_key = "client:{}".format((scope.get("client") or ("",))[0])
+            bucket = self.bucket(limit, client_key)
+            if token:
+                send = self.bucket_on_acceptance(limit, token, send)
+
+        retry_after = bucket.take(time.monotonic())
+        if not retry_after:
+            await self.app(scope, receive, send)
+            return
+
+        rate_limited_requests.inc(route=limit.name)
+        response = JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content={"detail": "Too many requests"},
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+        await response(scope, receive, send)
+
+    @staticmethod
+    async def extract_token(
+        scope: Scope, receive: Receive
+    ) -> Tuple[Optional[str], Receive]:
+        query = parse_qs(scope.get("query_string", b"").decode())
+        if "token" in query:
+            return query["token"][0], receive
+
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"application/json"):
+            return None, receive
+
+        messages: List[Message] = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            messages.append(message)
+            more_body = message.get("more_body", False)
+        body = b"".join(message.get("body", b"") for message in messages)
+
+        async def replay() -> Message:
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        try:
+            token = json.loads(body).get("token")
+        except (ValueError, AttributeError):
+            token = None
+
+        return token if isinstance(token, str) else None, replay
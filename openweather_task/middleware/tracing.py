@@ -0,0 +1,51 @@
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from openweather_task.tracing import Tracer
+
+__all__ = ["TracingMiddleware"]
+
+TRACEPARENT_HEADER = "traceparent"
+# Trace Context Level 2 response header, lets clients find sampled traces.
+TRACERESPONSE_HEADER = "traceresponse"
+
+
+class TracingMiddleware:
+    """
+    Runs sampled HTTP requests in trace root span.
+
+    Span is named by route template once routing is done, see `TracedRoute`.
+    """
+
+    def __init__(self, app: ASGIApp, tracer: Tracer) -> None:
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = Headers(scope=scope).get(TRACEPARENT_HEADER)
+        with self.tracer.trace(
+            f"{scope['method']} {scope['path']}",
+            traceparent=traceparent,
+            **{"http.method": scope["method"], "http.target": scope["path"]},
+        ) as span:
+            if span is None:
+                await self.app(scope, receive, send)
+                return
+
+            async def send_traced(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    span.set(**{"http.status_code": message["status"]})
+                    headers = MutableHeaders(scope=message)
+                    headers.append(TRACERESPONSE_HEADER, span.traceparent)
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_traced)
+            except Exception:
+                # Unhandled errors are answered with 500 by server, if not yet.
+                span.attributes.setdefault("http.status_code", 500)
+                raise
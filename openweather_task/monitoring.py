@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, Optional
+
+from openweather_task import metrics
+from openweather_task.config import (
+    LOOP_LAG_INTERVAL_SECONDS,
+    LOOP_SLOW_CALLBACK_SECONDS,
+)
+
+__all__ = ["EventLoopLagMonitor", "loop_lag_monitor"]
+
+logger = logging.getLogger(__name__)
+
+loop_lag_seconds = metrics.gauge(
+    "event_loop_lag_seconds", "Delay of event loop wakeups over expected time"
+)
+slow_callbacks = metrics.counter(
+    "event_loop_slow_callbacks_total", "Callbacks blocking event loop over threshold"
+)
+
+MAX_REPORTED_FRAMES = 30
+
+
+class EventLoopLagMonitor:
+    """
+    Measures how late event loop wakes up coroutine sleeping `interval`.
+
+    With `slow_callback_threshold` set, watchdog thread reports stack and
+    route of a callback blocking the loop longer than that, while it's
+    still running.
+    """
+
+    def __init__(self, interval: float, slow_callback_threshold: float = 0) -> None:
+        self.interval = interval
+        self.slow_callback_threshold = slow_callback_threshold
+        self.lag = 0.0
+        # Routes of tasks handling requests, set by `TracedRoute`.
+        self.task_routes: Dict[asyncio.Task, str] = {}
+        self._last_wakeup = time.perf_counter()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id = 0
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    async def measure(self) -> None:
+        started_at = time.perf_counter()
+        await asyncio.sleep(self.interval)
+        self._last_wakeup = time.perf_counter()
+        self.lag = max(self._last_wakeup - started_at - self.interval, 0.0)
+        loop_lag_seconds.set(self.lag)
+
+    def start(self) -> None:
+        """Starts watchdog of event loop running in calling thread."""
+        if not self.slow_callback_threshold or self._watchdog is not None:
+            return
+
+        self._loop = asyncio.get_event_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_wakeup = time.perf_counter()
+        self._stopped.clear()
+        self._watchdog = threading.Thread(
+            target=self._watch, name="event-loop-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    def stop(self) -> None:
+        if self._watchdog is None:
+            return
+
+        self._stopped.set()
+        self._watchdog.join()
+        self._watchdog = None
+
+    def _watch(self) -> None:
+        reported_wakeup = None
+        while not self._stopped.wait(self.slow_callback_threshold / 2):
+            last_wakeup = self._last_wakeup
+            blocked = time.perf_counter() - last_wakeup - self.interval
+            # One report per blocking callback.
+            if blocked < self.slow_callback_threshold or last_wakeup == reported_wakeup:
+                continue
+
+            reported_wakeup = last_wakeup
+            self._report(blocked)
+
+    def _report(self, blocked: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame, limit=MAX_REPORTED_FRAMES))
+        task = asyncio.current_task(self._loop) if self._loop else None
+        route = self.task_routes.get(task) if task else None
+        if route is None and task is not None:
+            route = f"task {task.get_coro().__qualname__}"
+
+        slow_callbacks.inc(route=route or "unknown")
+        logger.warning(
+            "Event loop blocked for %.3fs by %s, at:\n%s",
+            blocked,
+            route or "callback outside of tasks",
+            stack,
+        )
+
+
+loop_lag_monitor = EventLoopLagMonitor(
+    interval=LOOP_LAG_INTERVAL_SECONDS,
+    slow_callback_threshold=LOOP_SLOW_CALLBACK_SECONDS,
+)
@@ -0,0 +1,198 @@
+"""
+Statistical profiler of requests running on the event loop.
+
+Sampler thread periodically captures the event loop thread's stack and
+attributes it to the profiled request whose coroutine chain is running, so
+only CPU time spent on behalf of that request is counted. Stacks are
+aggregated per route and written in folded format, one `frame;frame count`
+line per stack, accepted by flamegraph.pl, speedscope and inferno.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import CodeType, FrameType
+from typing import Dict, List, Optional
+
+from openweather_task import metrics
+from openweather_task.config import (
+    PROFILING_DIR,
+    PROFILING_INTERVAL_SECONDS,
+    PROFILING_LATENCY_THRESHOLD_SECONDS,
+    PROFILING_MAX_BYTES,
+    PROFILING_SAMPLE_RATE,
+)
+
+__all__ = ["ProfiledRequest", "SamplingProfiler", "profiler"]
+
+logger = logging.getLogger(__name__)
+
+profiled_requests = metrics.counter(
+    "profiled_requests_total", "Profiled requests by whether profile was kept"
+)
+
+MAX_STACK_DEPTH = 128
+PROFILE_SUFFIX = ".folded"
+
+
+class ProfiledRequest:
+    __slots__ = ("samples", "started_at")
+
+    def __init__(self) -> None:
+        self.samples: Counter = Counter()
+        self.started_at = time.perf_counter()
+
+
+class SamplingProfiler:
+    """
+    Samples stacks of requests registered by `ProfilingMiddleware`.
+
+    Requests are profiled with `sample_rate` probability and their profiles
+    are kept if they took at least `latency_threshold` seconds.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        interval: float,
+        sample_rate: float,
+        latency_threshold: float,
+        max_bytes: int,
+    ) -> None:
+        self.directory = directory
+        self.interval = interval
+        self.sample_rate = sample_rate
+        self.latency_threshold = latency_threshold
+        self.max_bytes = max_bytes
+        # Frames of profiled requests' outermost coroutines by their id.
+        self._requests: Dict[int, ProfiledRequest] = {}
+        self._routes: Dict[str, Counter] = {}
+        self._labels: Dict[CodeType, str] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread_id = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        """Starts sampling requests of event loop running in calling thread."""
+        if self._thread is not None:
+            return
+
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._sample, name="request-profiler", daemon=True
+        )
+        self._thread.start()
+        logger.info("Request profiler started, writing to %s", self.directory)
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        self._requests.clear()
+        logger.info("Request profiler stopped")
+
+    def toggle(self) -> None:
+        if self.enabled:
+            self.stop()
+        else:
+            self.start()
+
+    def begin(self, frame: FrameType) -> ProfiledRequest:
+        request = ProfiledRequest()
+        self._requests[id(frame)] = request
+        return request
+
+    def end(self, frame: FrameType, request: ProfiledRequest, route: str) -> None:
+        self._requests.pop(id(frame), None)
+        kept = time.perf_counter() - request.started_at >= self.latency_threshold
+        profiled_requests.inc(kept=str(kept).lower())
+        if not kept:
+            return
+
+        with self._lock:
+            self._routes.setdefault(route, Counter()).update(request.samples)
+
+    def _label(self, code: CodeType) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)})"
+            self._labels[code] = label
+        return label
+
+    def _sample(self) -> None:
+        while not self._stopped.wait(self.interval):
+            if not self._requests:
+                continue
+
+            frame: Optional[FrameType] = sys._current_frames().get(
+                self._loop_thread_id
+            )
+            stack: List[str] = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                request = self._requests.get(id(frame))
+                if request is not None:
+                    with self._lock:
+                        request.samples[tuple(reversed(stack))] += 1
+                    break
+
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+
+    def _write(self, routes: Dict[str, Counter]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        timestamp = int(time.time())
+        for route, samples in routes.items():
+            path = os.path.join(self.directory, f"{route}.{timestamp}{PROFILE_SUFFIX}")
+            with open(path, "a") as file:
+                for stack, count in samples.most_common():
+                    file.write(f"{';'.join((route,) + stack)} {count}\n")
+        self._rotate()
+
+    def _rotate(self) -> None:
+        """Removes oldest profiles while directory exceeds `max_bytes`."""
+        profiles = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(PROFILE_SUFFIX):
+                stat = entry.stat()
+                profiles.append((stat.st_mtime, entry.path, stat.st_size))
+
+        total = sum(size for _, _, size in profiles)
+        for _, path, size in sorted(profiles):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    async def flush(self) -> None:
+        """Writes profiles aggregated since last flush in executor."""
+        with self._lock:
+            routes, self._routes = self._routes, {}
+        if not routes:
+            return
+
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, self._write, routes)
+        except Exception:
+            logger.exception("Failed to write request profiles")
+
+
+profiler = SamplingProfiler(
+    directory=PROFILING_DIR,
+    interval=PROFILING_INTERVAL_SECONDS,
+    sample_rate=PROFILING_SAMPLE_RATE,
+    latency_threshold=PROFILING_LATENCY_THRESHOLD_SECONDS,
+    max_bytes=PROFILING_MAX_BYTES,
+)
@@ -0,0 +1,87 @@
+import hmac
+import logging
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from starlette import status
+from starlette.requests import Request
+
+from openweather_task.config import ADMIN_TOKEN
+from openweather_task.importer import (
+    ImportStats,
+    import_items,
+    import_users,
+    iter_lines,
+)
+from openweather_task.routers.timeouts import TimedRoute
+from openweather_task.schemas import ImportResponse
+
+router = APIRouter(route_class=TimedRoute)
+
+logger = logging.getLogger(__name__)
+
+
+def check_admin_token(admin_token: str) -> None:
+    # Compared as bytes, headers may carry non-ASCII characters.
+    if not str(ADMIN_TOKEN) or not hmac.compare_digest(
+        admin_token.encode(), str(ADMIN_TOKEN).encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Provided admin token is invalid",
+        )
+
+
+def log_progress(stats: ImportStats) -> None:
+    logger.info("Bulk import progress: %s", stats)
+
+
+@router.post(
+    "/admin/import/users",
+    status_code=status.HTTP_200_OK,
+    response_model=ImportResponse,
+    description="""
+    Imports users from CSV with `login,password` header or NDJSON request body.
+    Existing logins are skipped or get imported password with `on_conflict=update`.
+    """,
+)
+async def import_users_route(
+    request: Request,
+    format: str = Query("csv", regex="^(csv|ndjson)$"),  # noqa
+    on_conflict: str = Query("skip", regex="^(skip|update)$"),
+    admin_token: str = Header("", alias="X-Admin-Token"),
+) -> ImportResponse:
+    check_admin_token(admin_token)
+    try:
+        stats = await import_users(
+            iter_lines(request.stream()),
+            format_=format,
+            on_conflict=on_conflict,
+            progress=log_progress,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    return ImportResponse(**stats.dict())
+
+
+@router.post(
+    "/admin/import/items",
+    status_code=status.HTTP_200_OK,
+    response_model=ImportResponse,
+    description="""
+    Imports items from CSV with `login,name` header or NDJSON request body,
+    `login` is the owner. Items of unknown users are skipped.
+    """,
+)
+async def import_items_route(
+    request: Request,
+    format: str = Query("csv", regex="^(csv|ndjson)$"),  # noqa
+    admin_token: str = Header("", alias="X-Admin-Token"),
+) -> ImportResponse:
+    check_admin_token(admin_token)
+    try:
+        stats = await import_items(
+            iter_lines(request.stream()), format_=format, progress=log_progress
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    return ImportResponse(**stats.dict())
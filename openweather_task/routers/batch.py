@@ -0,0 +1,241 @@
+import json
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional
+
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, ValidationError, conint, constr
+from starlette import status
+from starlette.responses import Response
+
+from openweather_task import metrics
+from openweather_task.config import BATCH_MAX_OPERATIONS
+from openweather_task.database import shards
+from openweather_task.database.models import ItemModel, UserModel
+from openweather_task.routers.items import (
+    create_user_item,
+    delete_user_item,
+    etag,
+    find_user_item,
+    parse_if_match,
+    receive_item,
+    search_user_items,
+    send_user_item,
+)
+from openweather_task.routers.timeouts import TimedRoute
+from openweather_task.schemas import (
+    BatchOperationName,
+    BatchRequest,
+    BatchResponse,
+    BatchResult,
+    ItemSchema,
+)
+
+router = APIRouter(route_class=TimedRoute)
+
+batch_operations = metrics.counter(
+    "batch_operations_total", "Operations executed in batches by operation and status"
+)
+
+RESULT_REFERENCE = re.compile(r"^\$(\d+)\.(\w+)$")
+
+User = Mapping[str, Any]
+
+
+class ItemArgs(BaseModel):
+    id: int
+
+
+class CreateItemArgs(BaseModel):
+    name: str
+
+
+class DeleteItemArgs(BaseModel):
+    id: int
+    if_match: Optional[str] = None
+
+
+class SearchItemsArgs(BaseModel):
+    query: constr(min_length=1)  # type: ignore
+    limit: conint(gt=0, le=100) = 20  # type: ignore
+    offset: conint(ge=0) = 0  # type: ignore
+
+
+class SendItemArgs(BaseModel):
+    id: int
+    recipient: str
+
+
+class GetItemArgs(BaseModel):
+    id: int
+    confirmation_url: str
+
+
+def result(status_code: int, body: Any, **headers: str) -> BatchResult:
+    return BatchResult(status=status_code, body=body, headers=headers)
+
+
+def from_response(response: Response) -> BatchResult:
+    return result(response.status_code, json.loads(response.body))
+
+
+async def create_item(user: User, args: Dict[str, Any]) -> BatchResult:
+    request = CreateItemArgs(**args)
+    created = await create_user_item(user, request.name)
+    return result(status.HTTP_201_CREATED, created.dict(), ETag=etag(1))
+
+
+async def delete_item(user: User, args: Dict[str, Any]) -> BatchResult:
+    request = DeleteItemArgs(**args)
+    response = await delete_user_item(
+        user, request.id, parse_if_match(request.if_match)
+    )
+    return from_response(response)
+
+
+async def get_user_item(user: User, args: Dict[str, Any]) -> BatchResult:
+    item = await find_user_item(user, ItemArgs(**args).id)
+    return result(
+        status.HTTP_200_OK, ItemSchema(**item).dict(), ETag=etag(item["version"])
+    )
+
+
+async def list_items(user: User, args: Dict[str, Any]) -> BatchResult:
+    items = await ItemModel.list(user_id=user["id"])
+    return result(status.HTTP_200_OK, [ItemSchema(**item).dict() for item in items])
+
+
+async def search_items(user: User, args: Dict[str, Any]) -> BatchResult:
+    request = SearchItemsArgs(**args)
+    items, next_offset = await search_user_items(
+        user, request.query, request.limit, request.offset
+    )
+    return result(
+        status.HTTP_200_OK,
+        {
+            "items": [ItemSchema(**item).dict() for item in items],
+            "next_offset": next_offset,
+        },
+    )
+
+
+async def send_item(user: User, args: Dict[str, Any]) -> BatchResult:
+    request = SendItemArgs(**args)
+    sent = await send_user_item(user, request.id, request.recipient)
+    return result(status.HTTP_201_CREATED, sent.dict())
+
+
+async def get_item(user: User, args: Dict[str, Any]) -> BatchResult:
+    request = GetItemArgs(**args)
+    response = await receive_item(user, request.id, request.confirmation_url)
+    return from_response(response)
+
+
+OPERATIONS: Dict[
+    BatchOperationName, Callable[[User, Dict[str, Any]], Awaitable[BatchResult]]
+] = {
+    BatchOperationName.CREATE_ITEM: create_item,
+    BatchOperationName.DELETE_ITEM: delete_item,
+    BatchOperationName.GET_USER_ITEM: get_user_item,
+    BatchOperationName.LIST_ITEMS: list_items,
+    BatchOperationName.SEARCH_ITEMS: search_items,
+    BatchOperationName.SEND_ITEM: send_item,
+    BatchOperationName.GET_ITEM: get_item,
+}
+
+
+def resolve_references(
+    args: Dict[str, Any], results: List[BatchResult]
+) -> Dict[str, Any]:
+    """Replaces "$<index>.<field>" values with fields of earlier results."""
+    resolved = {}
+    for name, value in args.items():
+        reference = RESULT_REFERENCE.match(value) if isinstance(value, str) else None
+        if reference:
+            index, field = int(reference.group(1)), reference.group(2)
+            body = results[index].body if index < len(results) else None
+            if not isinstance(body, dict) or field not in body:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail=f"Argument {name} refers to missing result field {value}",
+                )
+            value = body[field]
+        resolved[name] = value
+    return resolved
+
+
+async def execute(
+    user: User, request: BatchRequest, results: List[BatchResult]
+) -> bool:
+    """Appends operations' results, returns whether all of them succeeded."""
+    for operation in request.operations:
+        try:
+            args = resolve_references(operation.args, results)
+            operation_result = await OPERATIONS[operation.op](user, args)
+        except HTTPException as exc:
+            operation_result = result(exc.status_code, {"detail": exc.detail})
+        except ValidationError as exc:
+            operation_result = result(
+                status.HTTP_422_UNPROCESSABLE_ENTITY, {"detail": exc.errors()}
+            )
+
+        results.append(operation_result)
+        batch_operations.inc(op=operation.op.value, status=str(operation_result.status))
+        if operation_result.status >= 400 and request.transaction:
+            return False
+    return True
+
+
+@router.post(
+    "/batch",
+    status_code=status.HTTP_200_OK,
+    response_model=BatchResponse,
+    description="""
+    Executes item operations in order with one authorization and connection.
+    Operations are named after handlers and take their parameters in `args`,
+    `"$<index>.<field>"` argument takes field of earlier operation's result.
+    With `transaction` operations on user's shard are applied all or none,
+    operations after failed one aren't executed and get 424 status.
+    """,
+)
+async def execute_batch(request: BatchRequest) -> BatchResponse:
+    if len(request.operations) > BATCH_MAX_OPERATIONS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Batch is limited to {BATCH_MAX_OPERATIONS} operations",
+        )
+
+    user = await UserModel.get_authorized(request.token)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Provided token is unauthorized",
+        )
+
+    results: List[BatchResult] = []
+    shard = shards.for_user(user["id"])
+    # Queries of all operations reuse connection bound to this context.
+    async with shard.connection():
+        if not request.transaction:
+            await execute(user, request, results)
+            return BatchResponse(results=results)
+
+        transaction = await shard.transaction().start()
+        try:
+            succeeded = await execute(user, request, results)
+        except BaseException:
+            await transaction.rollback()
+            raise
+
+        if succeeded:
+            await transaction.commit()
+            return BatchResponse(results=results)
+
+        await transaction.rollback()
+        failed = results[-1]
+        rolled_back = result(
+            status.HTTP_424_FAILED_DEPENDENCY,
+            {"detail": "Batch transaction was rolled back"},
+        )
+        results = [rolled_back] * (len(results) - 1) + [failed]
+        results += [rolled_back] * (len(request.operations) - len(results))
+        return BatchResponse(results=results)
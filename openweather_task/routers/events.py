@@ -0,0 +1,52 @@
+import asyncio
+import json
+from typing import AsyncIterator
+
+from fastapi import APIRouter, HTTPException
+from starlette import status
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+
+from openweather_task.config import SENDING_EVENTS_HEARTBEAT_SECONDS
+from openweather_task.database.models import UserModel
+from openweather_task.events import sending_events
+from openweather_task.routers.timeouts import TimedRoute
+
+router = APIRouter(route_class=TimedRoute)
+
+
+@router.get(
+    "/events",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+    description="""
+    Streams Server-Sent Events about sendings addressed to authorized user
+    and completed transfers of user's items.
+    """,
+)
+async def stream_events(request: Request, token: str) -> StreamingResponse:
+    user = await UserModel.get_authorized(token)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Provided token is unauthorized",
+        )
+
+    async def events() -> AsyncIterator[str]:
+        with sending_events.subscribe(user["id"]) as queue:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), timeout=SENDING_EVENTS_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+
+                yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,37 @@
+from fastapi import APIRouter
+from starlette import status
+from starlette.responses import JSONResponse
+
+from openweather_task.health import health_checker
+from openweather_task.routers.tracing import TracedRoute
+
+router = APIRouter(route_class=TracedRoute)
+
+
+@router.get(
+    "/healthz",
+    status_code=status.HTTP_200_OK,
+    description="""
+    Liveness probe, responds while worker serves requests.
+    """,
+)
+async def get_liveness() -> JSONResponse:
+    return JSONResponse(content={"status": "ok"})
+
+
+@router.get(
+    "/readyz",
+    status_code=status.HTTP_200_OK,
+    description="""
+    Readiness probe, responds 503 while database is unhealthy or worker drains.
+    Reports pool stats and shards' state from last background check.
+    """,
+)
+async def get_readiness() -> JSONResponse:
+    ready, state = health_checker.readiness()
+    return JSONResponse(
+        status_code=status.HTTP_200_OK
+        if ready
+        else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=state,
+    )
@@ -1,26 +1,205 @@
-from typing import List
+from typing import Any, List, Mapping, Optional, Tuple
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Query
 from starlette import status
-from starlette.responses import JSONResponse
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
 
 from openweather_task.database.models import (
+    ItemChangeModel,
+    ItemDeleteStatus,
     ItemModel,
     SendingModel,
     SendingStatus,
     UserModel,
 )
+from openweather_task.idempotency import (
+    IDEMPOTENCY_KEY_HEADER,
+    fingerprint,
+    idempotency_keys_cache,
+)
+from openweather_task.routers.negotiation import (
+    COLUMNAR_JSON,
+    COLUMNAR_MSGPACK,
+    MSGPACK,
+    listing_response,
+)
+from openweather_task.routers.timeouts import TimedRoute
 from openweather_task.schemas import (
     CreateItemRequest,
     CreateItemResponse,
     DeleteItemRequest,
     DeleteItemResponse,
+    ItemChangeSchema,
+    ItemChangesResponse,
     ItemSchema,
+    SearchItemsResponse,
     SendItemRequest,
+    SendingSchema,
+    SendingsResponse,
     SendItemResponse,
 )
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
+
+# Documents alternative listing representations, negotiated by `Accept`.
+LISTING_RESPONSES = {
+    200: {
+        "content": {
+            COLUMNAR_JSON: {},
+            MSGPACK: {},
+            COLUMNAR_MSGPACK: {},
+        }
+    }
+}
+ITEM_FIELDS = ("id", "name")
+SENDING_FIELDS = tuple(SendingSchema.__fields__)
+
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """Returns item version required by `If-Match`, None if any matches."""
+    if if_match is None or if_match.strip() == "*":
+        return None
+
+    tag = if_match.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    if not tag.isdigit():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="If-Match must be a single item ETag",
+        )
+    return int(tag)
+
+
+async def list_sendings(
+    request: Request, token: str, incoming: bool, after_id: int, limit: int
+) -> Response:
+    user = await UserModel.get_authorized(token)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Provided token is unauthorized",
+        )
+
+    list_ = SendingModel.list_incoming if incoming else SendingModel.list_outgoing
+    sendings = await list_(user_id=user["id"], after_id=after_id, limit=limit + 1)
+    next_after_id = sendings[limit - 1]["id"] if len(sendings) > limit else None
+    return listing_response(
+        request,
+        sendings[:limit],
+        SENDING_FIELDS,
+        key="sendings",
+        next_after_id=next_after_id,
+    )
+
+
+async def create_user_item(
+    user: Mapping[str, Any], name: str
+) -> CreateItemResponse:
+    item_id = await ItemModel.create(name=name, user_id=user["id"])
+    return CreateItemResponse(id=item_id, name=name, message="Item created")
+
+
+async def delete_user_item(
+    user: Mapping[str, Any], item_id: int, version: Optional[int]
+) -> JSONResponse:
+    delete_status = await ItemModel.delete(item_id, user_id=user["id"], version=version)
+    if delete_status == ItemDeleteStatus.CONFLICT:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Item was modified, fetch its current version",
+        )
+
+    if delete_status == ItemDeleteStatus.DELETED:
+        return JSONResponse(
+            status_code=status.HTTP_200_OK,
+            content=DeleteItemResponse(message="Item successfully deleted").dict(),
+        )
+
+    return JSONResponse(
+        status_code=status.HTTP_204_NO_CONTENT,
+        content=DeleteItemResponse(message="No such item").dict(),
+    )
+
+
+async def search_user_items(
+    user: Mapping[str, Any], query: str, limit: int, offset: int
+) -> Tuple[List[Mapping[str, Any]], Optional[int]]:
+    """Returns page of found items and offset of the next one."""
+    items = await ItemModel.search(
+        user_id=user["id"], query=query, limit=limit + 1, offset=offset
+    )
+    next_offset = offset + limit if len(items) > limit else None
+    return items[:limit], next_offset
+
+
+async def find_user_item(user: Mapping[str, Any], item_id: int) -> Mapping[str, Any]:
+    item = await ItemModel.get(item_id, user_id=user["id"])
+    if not item:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No such item",
+        )
+    return item
+
+
+async def send_user_item(
+    sender: Mapping[str, Any], item_id: int, recipient: str
+) -> SendItemResponse:
+    if sender["login"] == recipient:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Can't send item to yourself",
+        )
+
+    item = await find_user_item(sender, item_id)
+    recipient_id = await UserModel.get_id_by_login(recipient)
+    if recipient_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No such recipient",
+        )
+
+    confirmation_url = await SendingModel.initiate_sending(
+        from_user_id=sender["id"],
+        to_user_id=recipient_id,
+        item_id=item_id,
+        item_version=item["version"],
+    )
+    return SendItemResponse(confirmation_url=confirmation_url)
+
+
+async def receive_item(
+    user: Mapping[str, Any], item_id: int, confirmation_url: str
+) -> JSONResponse:
+    sending_status = await SendingModel.complete_sending(
+        to_user_id=user["id"], item_id=item_id, confirmation_url=confirmation_url
+    )
+    if sending_status == SendingStatus.NO_SENDING:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No such sending",
+        )
+
+    if sending_status == SendingStatus.CONFLICT:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Item is being modified, retry later",
+        )
+
+    if sending_status == sending_status.COMPLETED:
+        return JSONResponse(content={"message": "Item successfully received"})
+
+    raise HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail="Something went wrong while receiving an item",
+    )
 
 
 @router.post(
@@ -29,13 +208,31 @@ router = APIRouter()
     response_model=CreateItemResponse,
     description="""
     Creates item for authorized user.
+    Returns item version in `ETag`.
     """
 )
-async def create_item(request: CreateItemRequest) -> CreateItemResponse:
+async def create_item(
+    request: CreateItemRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_KEY_HEADER),
+) -> CreateItemResponse:
     user = await UserModel.get_authorized(request.token)
     if user:
-        item_id = await ItemModel.create(name=request.name, user_id=user["id"])
-        return CreateItemResponse(id=item_id, name=request.name, message="Item created")
+        # New items start with the first version.
+        response.headers["ETag"] = etag(1)
+
+        if idempotency_key:
+            return await idempotency_keys_cache.execute(
+                user_id=user["id"],
+                key=idempotency_key,
+                request_fingerprint=fingerprint("/items/new", request),
+                status_code=status.HTTP_201_CREATED,
+                handler=lambda: create_user_item(user, request.name),
+                # Replayed response is returned as is, without `response`.
+                headers={"ETag": etag(1)},
+            )
+
+        return await create_user_item(user, request.name)
 
     raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -48,22 +245,15 @@ async def create_item(request: CreateItemRequest) -> CreateItemResponse:
     response_model=DeleteItemResponse,
     description="""
     Deletes specified item.
+    With `If-Match` deletes only that item version, responds 409 on mismatch.
     """
 )
-async def delete_item(request: DeleteItemRequest) -> JSONResponse:
+async def delete_item(
+    request: DeleteItemRequest, if_match: Optional[str] = Header(None)
+) -> JSONResponse:
     user = await UserModel.get_authorized(request.token)
     if user:
-        item_id = await ItemModel.delete(request.id)
-        if item_id:
-            return JSONResponse(
-                status_code=status.HTTP_200_OK,
-                content=DeleteItemResponse(message="Item successfully deleted").dict(),
-            )
-
-        return JSONResponse(
-            status_code=status.HTTP_204_NO_CONTENT,
-            content=DeleteItemResponse(message="No such item").dict(),
-        )
+        return await delete_user_item(user, request.id, parse_if_match(if_match))
 
     raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -75,15 +265,47 @@ async def delete_item(request: DeleteItemRequest) -> JSONResponse:
     "/items",
     status_code=status.HTTP_200_OK,
     response_model=List[ItemSchema],
+    responses=LISTING_RESPONSES,
     description="""
     Returns items listing of authorized user.
+    Columnar and MessagePack representations are negotiated by `Accept`.
     """
 )
-async def list_items(token: str) -> List[ItemSchema]:
+async def list_items(request: Request, token: str) -> Response:
     user = await UserModel.get_authorized(token)
     if user:
         items = await ItemModel.list(user_id=user["id"])
-        return items
+        return listing_response(request, items, ITEM_FIELDS)
+
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Provided token is unauthorized",
+    )
+
+
+@router.get(
+    "/items/search",
+    status_code=status.HTTP_200_OK,
+    response_model=SearchItemsResponse,
+    responses=LISTING_RESPONSES,
+    description="""
+    Searches items of authorized user by name substring.
+    Prefix matches are ranked first.
+    """
+)
+async def search_items(
+    request: Request,
+    token: str,
+    query: str = Query(..., min_length=1),
+    limit: int = Query(20, gt=0, le=100),
+    offset: int = Query(0, ge=0),
+) -> Response:
+    user = await UserModel.get_authorized(token)
+    if user:
+        items, next_offset = await search_user_items(user, query, limit, offset)
+        return listing_response(
+            request, items, ITEM_FIELDS, key="items", next_offset=next_offset
+        )
 
     raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -91,6 +313,68 @@ async def list_items(token: str) -> List[ItemSchema]:
     )
 
 
+@router.get(
+    "/items/changes",
+    status_code=status.HTTP_200_OK,
+    response_model=ItemChangesResponse,
+    description="""
+    Returns changes of authorized user's items after `since` sequence number.
+    Without `since` returns current sequence number to start sync from.
+    Responds 410 if requested changes were compacted, full resync required.
+    """
+)
+async def list_item_changes(
+    token: str,
+    since: Optional[int] = Query(None, ge=0),
+    limit: int = Query(1000, gt=0, le=10000),
+) -> ItemChangesResponse:
+    user = await UserModel.get_authorized(token)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Provided token is unauthorized",
+        )
+
+    last_seq = await ItemChangeModel.last_seq(user["id"]) or 0
+    if since is None or since >= last_seq:
+        return ItemChangesResponse(changes=[], last_seq=last_seq, has_more=False)
+
+    changes = await ItemChangeModel.list_since(user["id"], since, limit + 1)
+    # Sequence is dense, so a gap right after `since` means compacted changes.
+    if not changes or changes[0]["seq"] != since + 1:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Changes were compacted, full resync required",
+        )
+
+    return ItemChangesResponse(
+        changes=[ItemChangeSchema(**change) for change in changes[:limit]],
+        last_seq=changes[:limit][-1]["seq"],
+        has_more=len(changes) > limit,
+    )
+
+
+@router.get(
+    "/items/{id}",
+    status_code=status.HTTP_200_OK,
+    response_model=ItemSchema,
+    description="""
+    Returns item of authorized user with its version in `ETag`.
+    """
+)
+async def get_user_item(id: int, token: str, response: Response) -> ItemSchema:  # noqa
+    user = await UserModel.get_authorized(token)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Provided token is unauthorized",
+        )
+
+    item = await find_user_item(user, id)
+    response.headers["ETag"] = etag(item["version"])
+    return ItemSchema(**item)
+
+
 @router.post(
     "/send",
     status_code=status.HTTP_201_CREATED,
@@ -99,37 +383,27 @@ async def list_items(token: str) -> List[ItemSchema]:
     Initiates item sending, returns confirmation link for item receiving.
     """,
 )
-async def send_item(request: SendItemRequest) -> SendItemResponse:
+async def send_item(
+    request: SendItemRequest,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_KEY_HEADER),
+) -> SendItemResponse:
     sender = await UserModel.get_authorized(request.token)
     if not sender:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Provided token is unauthorized",
         )
-    if sender["login"] == request.recipient:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Can't send item to yourself",
-        )
-
-    item = await ItemModel.get(request.id)
-    if not item:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="No such item",
-        )
 
-    recipient = await UserModel.get_by_login(request.recipient)
-    if not recipient:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="No such recipient",
+    if idempotency_key:
+        return await idempotency_keys_cache.execute(
+            user_id=sender["id"],
+            key=idempotency_key,
+            request_fingerprint=fingerprint("/send", request),
+            status_code=status.HTTP_201_CREATED,
+            handler=lambda: send_user_item(sender, request.id, request.recipient),
         )
 
-    confirmation_url = await SendingModel.initiate_sending(
-        from_user_id=sender["id"], to_user_id=recipient["id"], item_id=request.id
-    )
-    return SendItemResponse(confirmation_url=confirmation_url)
+    return await send_user_item(sender, request.id, request.recipient)
 
 
 @router.get(
@@ -148,26 +422,46 @@ async def get_item(id: int, confirmation_url: str, token: str) -> JSONResponse:
             detail="Provided token is unauthorized",
         )
 
-    item = await ItemModel.get(id)
-    if not item:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="No such item",
-        )
+    return await receive_item(user, id, confirmation_url)
 
-    sending_status = await SendingModel.complete_sending(
-        to_user_id=user["id"], item_id=id, confirmation_url=confirmation_url
+
+@router.get(
+    "/sendings/incoming",
+    status_code=status.HTTP_200_OK,
+    response_model=SendingsResponse,
+    responses=LISTING_RESPONSES,
+    description="""
+    Returns pending sendings addressed to authorized user.
+    Pass `next_after_id` of response as `after_id` to get next page.
+    """,
+)
+async def list_incoming_sendings(
+    request: Request,
+    token: str,
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(50, gt=0, le=500),
+) -> Response:
+    return await list_sendings(
+        request, token, incoming=True, after_id=after_id, limit=limit
     )
-    if sending_status == SendingStatus.NO_SENDING:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="No such sending",
-        )
 
-    if sending_status == sending_status.COMPLETED:
-        return JSONResponse(content={"message": "Item successfully received"})
 
-    raise HTTPException(
-        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-        detail="Something went wrong while receiving an item",
+@router.get(
+    "/sendings/outgoing",
+    status_code=status.HTTP_200_OK,
+    response_model=SendingsResponse,
+    responses=LISTING_RESPONSES,
+    description="""
+    Returns pending sendings initiated by authorized user.
+    Pass `next_after_id` of response as `after_id` to get next page.
+    """,
+)
+async def list_outgoing_sendings(
+    request: Request,
+    token: str,
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(50, gt=0, le=500),
+) -> Response:
+    return await list_sendings(
+        request, token, incoming=False, after_id=after_id, limit=limit
     )
@@ -0,0 +1,18 @@
+from fastapi import APIRouter
+from starlette.responses import PlainTextResponse
+
+from openweather_task import metrics
+from openweather_task.routers.tracing import TracedRoute
+
+router = APIRouter(route_class=TracedRoute)
+
+
+@router.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    description="""
+    Returns worker metrics in Prometheus text format.
+    """,
+)
+async def get_metrics() -> PlainTextResponse:
+    return PlainTextResponse(metrics.render())
@@ -0,0 +1,106 @@
+"""
+`Accept`-based representations of listings.
+
+Besides default JSON with an object per row, listings are served as columnar
+JSON with a parallel array per field, e.g. `{"ids": [1, 2], "names": [...]}`,
+and, with msgpack installed, as MessagePack of either shape. All skip
+response model validation, rows go from database records to bytes.
+"""
+import json
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+__all__ = [
+    "COLUMNAR_JSON",
+    "COLUMNAR_MSGPACK",
+    "JSON",
+    "MSGPACK",
+    "listing_response",
+    "negotiate",
+]
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+COLUMNAR_JSON = "application/vnd.openweather.columnar+json"
+COLUMNAR_MSGPACK = "application/vnd.openweather.columnar+msgpack"
+
+MEDIA_TYPES = (JSON, COLUMNAR_JSON) + (
+    (MSGPACK, COLUMNAR_MSGPACK) if msgpack is not None else ()
+)
+# Clients commonly send the legacy name.
+MEDIA_TYPE_ALIASES = {"application/x-msgpack": MSGPACK}
+VARY_ACCEPT = {"Vary": "Accept"}
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Returns supported media type preferred by `Accept`, JSON if none is."""
+    if not accept:
+        return JSON
+
+    best, best_quality = JSON, 0.0
+    for part in accept.split(","):
+        media_type, _, params = part.strip().partition(";")
+        media_type = media_type.strip().lower()
+        media_type = MEDIA_TYPE_ALIASES.get(media_type, media_type)
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        # Explicitly listed media types take precedence over wildcards.
+        if media_type in ("*/*", "application/*"):
+            media_type, quality = JSON, quality - 0.0001
+        if media_type in MEDIA_TYPES and quality > best_quality:
+            best, best_quality = media_type, quality
+    return best
+
+
+def columns(
+    rows: Sequence[Mapping[str, Any]], fields: Sequence[str]
+) -> Dict[str, List[Any]]:
+    """Returns a column per field, named by field in plural."""
+    return {f"{field}s": [row[field] for row in rows] for field in fields}
+
+
+def listing_response(
+    request: Request,
+    rows: Sequence[Mapping[str, Any]],
+    fields: Sequence[str],
+    key: Optional[str] = None,
+    **extra: Any,
+) -> Response:
+    """
+    Renders `rows` in representation negotiated by request's `Accept`.
+
+    Rows are nested under `key` along with `extra` fields, or are the whole
+    body without it.
+    """
+    media_type = negotiate(request.headers.get("accept"))
+    content: Any
+    if media_type in (COLUMNAR_JSON, COLUMNAR_MSGPACK):
+        content = {**columns(rows, fields), **extra}
+    else:
+        records: List[Dict[str, Any]] = [
+            {field: row[field] for field in fields} for row in rows
+        ]
+        content = {key: records, **extra} if key else records
+
+    if media_type in (JSON, COLUMNAR_JSON):
+        # Same rendering as `JSONResponse`.
+        body = json.dumps(
+            content, ensure_ascii=False, separators=(",", ":")
+        ).encode()
+    else:
+        body = msgpack.packb(content)
+    return Response(body, media_type=media_type, headers=VARY_ACCEPT)
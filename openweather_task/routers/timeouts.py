@@ -0,0 +1,82 @@
+from typing import Callable, List, Optional, Tuple
+
+from asyncpg.exceptions import QueryCanceledError
+from fastapi import HTTPException
+from starlette import status
+from starlette.requests import Request
+from starlette.responses import Response
+
+from openweather_task import metrics
+from openweather_task.config import ROUTE_STATEMENT_TIMEOUTS
+from openweather_task.database.timeouts import statement_deadline
+from openweather_task.routers.tracing import TracedRoute
+
+__all__ = ["RouteTimeout", "TimedRoute", "parse_route_timeouts", "route_timeout"]
+
+# Method or None for any, route path template or "*" for any, seconds.
+RouteTimeout = Tuple[Optional[str], str, float]
+
+statement_timeouts = metrics.counter(
+    "statement_timeouts_total", "Requests failed by statement deadline of route"
+)
+
+
+def parse_route_timeouts(spec: str) -> List[RouteTimeout]:
+    """
+    Parses timeouts like "GET /items=2;POST /send=5;*=10".
+
+    Each timeout is `[METHOD ]<route path template>=<seconds>`,
+    the first matching one is applied.
+    """
+    timeouts = []
+    for entry in filter(None, (entry.strip() for entry in spec.split(";"))):
+        route, _, seconds = entry.rpartition("=")
+        method, _, path = route.strip().rpartition(" ")
+        timeouts.append((method.upper() or None, path, float(seconds)))
+    return timeouts
+
+
+def route_timeout(
+    timeouts: List[RouteTimeout], method: str, path: str
+) -> Optional[float]:
+    for timeout_method, timeout_path, seconds in timeouts:
+        if timeout_method not in (None, method):
+            continue
+        if timeout_path in ("*", path):
+            return seconds
+    return None
+
+
+route_timeouts = parse_route_timeouts(ROUTE_STATEMENT_TIMEOUTS)
+
+
+class TimedRoute(TracedRoute):
+    """
+    Limits statements of handler by deadline from `ROUTE_STATEMENT_TIMEOUTS`.
+
+    Request whose statement outlived the deadline fails with 503.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        timeouts = {
+            method: route_timeout(route_timeouts, method, self.path_format)
+            for method in self.methods or ()
+        }
+
+        async def timed_handler(request: Request) -> Response:
+            timeout = timeouts.get(request.method)
+            if timeout is None:
+                return await handler(request)
+
+            try:
+                with statement_deadline(timeout):
+                    return await handler(request)
+            except QueryCanceledError:
+                statement_timeouts.inc(route=f"{request.method} {self.path_format}")
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Request took too long",
+                )
+
+        return timed_handler
@@ -0,0 +1,43 @@
+import asyncio
+from typing import Callable
+
+from fastapi.routing import APIRoute
+from starlette.requests import Request
+from starlette.responses import Response
+
+from openweather_task.monitoring import loop_lag_monitor
+from openweather_task.tracing import current_span, tracer
+
+__all__ = ["TracedRoute"]
+
+
+class TracedRoute(APIRoute):
+    """
+    Runs handler, with request validation and serialization, in a span.
+
+    Handling task is registered by route, so slow callbacks reported by
+    `loop_lag_monitor` are attributed to it.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        span_name = f"handler {self.name}"
+        task_routes = loop_lag_monitor.task_routes
+
+        async def traced_handler(request: Request) -> Response:
+            task = asyncio.current_task()
+            task_routes[task] = f"{request.method} {self.path_format}"
+            try:
+                span = current_span()
+                if span is None:
+                    return await handler(request)
+
+                # Route template keeps root span names low cardinality.
+                span.root.name = task_routes[task]
+                span.root.set(**{"http.route": self.path_format})
+                with tracer.span(span_name):
+                    return await handler(request)
+            finally:
+                task_routes.pop(task, None)
+
+        return traced_handler
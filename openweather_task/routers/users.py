@@ -2,14 +2,17 @@ from fastapi import APIRouter, HTTPException
 from starlette import status
 
 from openweather_task.database.models import UserModel
+from openweather_task.routers.timeouts import TimedRoute
 from openweather_task.schemas import (
     AuthorizeUserRequest,
     AuthorizeUserResponse,
+    LogoutUserRequest,
+    LogoutUserResponse,
     RegisterUserRequest,
     RegisterUserResponse,
 )
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 
 @router.post(
@@ -46,3 +49,23 @@ async def login_user(request: AuthorizeUserRequest) -> AuthorizeUserResponse:
         return AuthorizeUserResponse(token=token)
 
     raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No such user")
+
+
+@router.post(
+    "/logout",
+    status_code=status.HTTP_200_OK,
+    response_model=LogoutUserResponse,
+    description="""
+    Revokes all tokens of authorized user.
+    """
+)
+async def logout_user(request: LogoutUserRequest) -> LogoutUserResponse:
+    user = await UserModel.get_authorized(request.token)
+    if user:
+        await UserModel.revoke_tokens(user["id"])
+        return LogoutUserResponse(message="User successfully logged out")
+
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Provided token is unauthorized",
+    )
@@ -1,17 +1,33 @@
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
 from pydantic import BaseModel
 
 __all__ = [
     "AuthorizeUserRequest",
     "AuthorizeUserResponse",
+    "BatchOperation",
+    "BatchOperationName",
+    "BatchRequest",
+    "BatchResponse",
+    "BatchResult",
+    "LogoutUserRequest",
+    "LogoutUserResponse",
     "RegisterUserRequest",
     "RegisterUserResponse",
     "CreateItemRequest",
     "CreateItemResponse",
     "DeleteItemRequest",
     "DeleteItemResponse",
+    "ImportResponse",
     "ItemSchema",
+    "ItemChangeSchema",
+    "ItemChangesResponse",
+    "SearchItemsResponse",
     "SendItemRequest",
     "SendItemResponse",
+    "SendingSchema",
+    "SendingsResponse",
 ]
 
 
@@ -45,6 +61,20 @@ class AuthorizeUserResponse(BaseModel):
         orm_mode = True
 
 
+class LogoutUserRequest(BaseModel):
+    token: str
+
+    class Config:
+        orm_mode = True
+
+
+class LogoutUserResponse(BaseModel):
+    message: str
+
+    class Config:
+        orm_mode = True
+
+
 class CreateItemRequest(BaseModel):
     name: str
     token: str
@@ -85,6 +115,33 @@ class ItemSchema(BaseModel):
         orm_mode = True
 
 
+class ItemChangeSchema(BaseModel):
+    seq: int
+    operation: str
+    item_id: int
+    name: Optional[str]
+
+    class Config:
+        orm_mode = True
+
+
+class ItemChangesResponse(BaseModel):
+    changes: List[ItemChangeSchema]
+    last_seq: int
+    has_more: bool
+
+    class Config:
+        orm_mode = True
+
+
+class SearchItemsResponse(BaseModel):
+    items: List[ItemSchema]
+    next_offset: Optional[int]
+
+    class Config:
+        orm_mode = True
+
+
 class SendItemRequest(BaseModel):
     id: int
     token: str
@@ -99,3 +156,78 @@ class SendItemResponse(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class SendingSchema(BaseModel):
+    id: int
+    item_id: int
+    item_name: str
+    from_user_id: int
+    to_user_id: int
+    confirmation_url: str
+
+    class Config:
+        orm_mode = True
+
+
+class SendingsResponse(BaseModel):
+    sendings: List[SendingSchema]
+    next_after_id: Optional[int]
+
+    class Config:
+        orm_mode = True
+
+
+class ImportResponse(BaseModel):
+    rows: int
+    imported: int
+    updated: int
+    skipped: int
+
+    class Config:
+        orm_mode = True
+
+
+class BatchOperationName(str, Enum):
+    CREATE_ITEM = "create_item"
+    DELETE_ITEM = "delete_item"
+    GET_USER_ITEM = "get_user_item"
+    LIST_ITEMS = "list_items"
+    SEARCH_ITEMS = "search_items"
+    SEND_ITEM = "send_item"
+    GET_ITEM = "get_item"
+
+
+class BatchOperation(BaseModel):
+    op: BatchOperationName
+    # Handler's parameters except token, "$<index>.<field>" string refers to
+    # field of earlier operation's result.
+    args: Dict[str, Any] = {}
+
+    class Config:
+        orm_mode = True
+
+
+class BatchRequest(BaseModel):
+    token: str
+    transaction: bool = False
+    operations: List[BatchOperation]
+
+    class Config:
+        orm_mode = True
+
+
+class BatchResult(BaseModel):
+    status: int
+    body: Any
+    headers: Dict[str, str] = {}
+
+    class Config:
+        orm_mode = True
+
+
+class BatchResponse(BaseModel):
+    results: List[BatchResult]
+
+    class Config:
+        orm_mode = True
@@ -0,0 +1,2 @@
+from .passwords import *  # noqa
+from .tokens import *  # noqa
@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import hmac
+import secrets
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from openweather_task import metrics
+from openweather_task.config import (
+    PASSWORD_HASHING_EXECUTOR,
+    PASSWORD_HASHING_MAX_CONCURRENCY,
+    PASSWORD_HASHING_WORKERS,
+)
+
+__all__ = ["PasswordHasher", "hash_password", "is_hashed", "password_hasher"]
+
+SCHEME = "scrypt"
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+# OpenSSL's default memory limit, `hashlib.scrypt` applies it unless `maxmem` is set.
+SCRYPT_MAX_MEMORY = 32 * 1024 * 1024
+
+hashing_in_flight = metrics.gauge(
+    "password_hashing_in_flight", "Key derivations running in executor"
+)
+hashing_queue_depth = metrics.gauge(
+    "password_hashing_queue_depth", "Key derivations waiting for executor slot"
+)
+hashing_seconds = metrics.histogram(
+    "password_hashing_seconds", "Key derivation latency including queue wait"
+)
+
+
+def _derive(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p)
+
+
+def hash_password(password: str, salt: Optional[bytes] = None) -> str:
+    """Derives key in the calling thread, prefer `password_hasher` in handlers."""
+    salt = salt or secrets.token_bytes(SALT_BYTES)
+    key = _derive(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return "$".join(
+        [SCHEME, str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P), salt.hex(), key.hex()]
+    )
+
+
+# Cost parameters, salt and derived key.
+ParsedHash = Tuple[int, int, int, bytes, bytes]
+
+
+def _parse(password_hash: str) -> Optional[ParsedHash]:
+    scheme, _, params = password_hash.partition("$")
+    if scheme != SCHEME:
+        return None
+    try:
+        n, r, p, salt, key = params.split("$")
+        parsed_hash = int(n), int(r), int(p), bytes.fromhex(salt), bytes.fromhex(key)
+    except ValueError:
+        return None
+    return parsed_hash if _is_derivable(*parsed_hash) else None
+
+
+def _is_derivable(n: int, r: int, p: int, salt: bytes, key: bytes) -> bool:
+    """Checks parameters are accepted by `hashlib.scrypt`, as OpenSSL does."""
+    return (
+        n > 1
+        and n & (n - 1) == 0
+        and r > 0
+        and p > 0
+        and n < 2 ** (16 * r)
+        and 128 * r * (n + p + 2) <= SCRYPT_MAX_MEMORY
+        and bool(salt)
+        and bool(key)
+    )
+
+
+def _verify(password: str, parsed_hash: ParsedHash) -> bool:
+    n, r, p, salt, key = parsed_hash
+    return hmac.compare_digest(_derive(password, salt, n, r, p), key)
+
+
+def is_hashed(password: str) -> bool:
+    """Legacy plain text passwords may look like hashes, only valid ones are."""
+    return _parse(password) is not None
+
+
+class PasswordHasher:
+    """
+    Runs key derivation out of the event loop.
+
+    At most `max_concurrency` derivations are submitted to the executor,
+    the rest wait on semaphore and are reported as queue depth of `pool`.
+    """
+
+    def __init__(
+        self,
+        executor: str,
+        max_workers: int,
+        max_concurrency: int,
+        pool: str = "requests",
+    ) -> None:
+        self.executor_type = executor
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self.pool = pool
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def start(self) -> None:
+        if self.executor_type == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    def stop(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def _run(self, func, *args):  # type: ignore
+        if self._semaphore is None:
+            self.start()
+        assert self._semaphore is not None
+
+        started_at = time.perf_counter()
+        waiting = True
+        hashing_queue_depth.inc(pool=self.pool)
+        try:
+            async with self._semaphore:
+                waiting = False
+                hashing_queue_depth.dec(pool=self.pool)
+                hashing_in_flight.inc(pool=self.pool)
+                try:
+                    loop = asyncio.get_event_loop()
+                    return await loop.run_in_executor(self._executor, func, *args)
+                finally:
+                    hashing_in_flight.dec(pool=self.pool)
+        finally:
+            if waiting:
+                hashing_queue_depth.dec(pool=self.pool)
+            hashing_seconds.observe(time.perf_counter() - started_at, pool=self.pool)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        parsed_hash = _parse(password_hash)
+        if parsed_hash is None:
+            # Legacy rows store plain text passwords.
+            return hmac.compare_digest(password.encode(), password_hash.encode())
+
+        return await self._run(_verify, password, parsed_hash)
+
+
+password_hasher = PasswordHasher(
+    executor=PASSWORD_HASHING_EXECUTOR,
+    max_workers=PASSWORD_HASHING_WORKERS,
+    max_concurrency=PASSWORD_HASHING_MAX_CONCURRENCY,
+)
@@ -0,0 +1,169 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+
+from openweather_task.config import TOKEN_SECRET_KEY, TOKEN_TTL_SECONDS
+
+__all__ = [
+    "TokenRevocations",
+    "is_signed_token",
+    "sign_confirmation_url",
+    "sign_token",
+    "token_revocations",
+    "verify_confirmation_url",
+    "verify_token",
+]
+
+SIGNATURE_SEPARATOR = "."
+# Keeps confirmation URLs from being accepted as tokens and vice versa.
+CONFIRMATION_URL_CONTEXT = "sending:"
+
+
+class TokenRevocations:
+    """
+    In-memory copy of per-user token generations revoked recently.
+
+    Signed tokens carry the generation they were issued with,
+    tokens of older generations are considered revoked. Revocation is
+    forgotten `ttl_seconds` after it's made, tokens it revoked have expired.
+    """
+
+    def __init__(self, ttl_seconds: float) -> None:
+        self.ttl_seconds = ttl_seconds
+        # User id -> (generation, revocation time).
+        self._generations: Dict[int, Tuple[int, datetime]] = {}
+
+    def update(self, revocations: Iterable[Tuple[int, int, datetime]]) -> None:
+        """
+        Merges revocations loaded from database, drops expired ones.
+
+        Newer generation wins, so revocations made while they were loaded
+        aren't lost.
+        """
+        for user_id, generation, revoked_at in revocations:
+            self.revoke(user_id, generation, revoked_at)
+        expired_at = datetime.now() - timedelta(seconds=self.ttl_seconds)
+        self._generations = {
+            user_id: revocation
+            for user_id, revocation in self._generations.items()
+            if revocation[1] > expired_at
+        }
+
+    def revoke(self, user_id: int, generation: int, revoked_at: datetime) -> None:
+        revocation = self._generations.get(user_id)
+        if revocation is None or revocation < (generation, revoked_at):
+            self._generations[user_id] = (generation, revoked_at)
+
+    def is_revoked(self, user_id: int, generation: int) -> bool:
+        revocation = self._generations.get(user_id)
+        return revocation is not None and generation < revocation[0]
+
+    def clear(self) -> None:
+        self._generations.clear()
+
+
+token_revocations = TokenRevocations(ttl_seconds=TOKEN_TTL_SECONDS)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _signature(payload: str, context: str = "") -> str:
+    digest = hmac.new(
+        str(TOKEN_SECRET_KEY).encode(), (context + payload).encode(), hashlib.sha256
+    ).digest()
+    return _b64encode(digest)
+
+
+def _sign(claims: Mapping[str, Any], context: str = "") -> str:
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}{SIGNATURE_SEPARATOR}{_signature(payload, context)}"
+
+
+def _verify(signed: str, context: str = "") -> Optional[Dict[str, Any]]:
+    payload, _, signature = signed.partition(SIGNATURE_SEPARATOR)
+    # Compared as bytes, strings with non-ASCII characters aren't supported.
+    expected_signature = _signature(payload, context)
+    if not hmac.compare_digest(signature.encode(), expected_signature.encode()):
+        return None
+
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+
+    if claims["exp"] <= time.time():
+        return None
+    return claims
+
+
+def is_signed_token(token: str) -> bool:
+    return SIGNATURE_SEPARATOR in token
+
+
+def sign_token(user_id: int, login: str, generation: int, ttl_seconds: int) -> str:
+    if not str(TOKEN_SECRET_KEY):
+        raise RuntimeError("TOKEN_SECRET_KEY is required to issue signed tokens")
+
+    claims = {
+        "id": user_id,
+        "login": login,
+        "gen": generation,
+        "exp": int(time.time()) + ttl_seconds,
+    }
+    return _sign(claims)
+
+
+def verify_token(token: str) -> Optional[Mapping[str, Any]]:
+    if not str(TOKEN_SECRET_KEY):
+        return None
+
+    claims = _verify(token)
+    if claims is None:
+        return None
+    if token_revocations.is_revoked(claims["id"], claims["gen"]):
+        return None
+
+    return {"id": claims["id"], "login": claims["login"]}
+
+
+def sign_confirmation_url(
+    item_id: int, version: int, from_user_id: int, to_user_id: int, ttl_seconds: int
+) -> str:
+    """Signs sending of given item version, so it's completed at most once."""
+    if not str(TOKEN_SECRET_KEY):
+        raise RuntimeError("TOKEN_SECRET_KEY is required to sign confirmation URLs")
+
+    claims = {
+        "item": item_id,
+        "ver": version,
+        "from": from_user_id,
+        "to": to_user_id,
+        "exp": int(time.time()) + ttl_seconds,
+    }
+    return _sign(claims, CONFIRMATION_URL_CONTEXT)
+
+
+def verify_confirmation_url(url: str) -> Optional[Mapping[str, Any]]:
+    if not str(TOKEN_SECRET_KEY):
+        return None
+
+    claims = _verify(url, CONFIRMATION_URL_CONTEXT)
+    if claims is None:
+        return None
+
+    return {
+        "item_id": claims["item"],
+        "version": claims["ver"],
+        "from_user_id": claims["from"],
+        "to_user_id": claims["to"],
+    }
@@ -0,0 +1,316 @@
+"""
+Synthetic dataset generator for scale testing.
+
+Usage: python -m openweather_task.seeding --users 10000000 --seed 42 [options]
+
+Rows are written with binary COPY into migrated, preferably empty, shards.
+Given the same seed, `--now` and starting sequence values the dataset is
+identical. All users share `--password`.
+"""
+import argparse
+import asyncio
+import base64
+import bisect
+import hashlib
+import random
+import sys
+import time
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from openweather_task.config import TOKEN_BYTES_LENGTH, TOKEN_TTL_SECONDS
+from openweather_task.database import shards
+from openweather_task.security import hash_password
+
+__all__ = ["DatasetGenerator", "DatasetSpec", "ShardRows", "seed"]
+
+USER_COLUMNS = ("id", "login", "password", "token", "token_expiration_time")
+ITEM_COLUMNS = ("id", "user_id", "name")
+SENDING_COLUMNS = ("id", "item_id", "from_user_id", "to_user_id", "confirmation_url")
+
+ADJECTIVES = (
+    "ancient amber bright broken copper crimson dusty electric faded frozen "
+    "gilded golden hidden iron jade lucky misty noble old polished quiet "
+    "rusty silent silver smooth tiny velvet wild wooden"
+).split()
+NOUNS = (
+    "amulet anchor arrow badge bell book bottle box candle coin compass "
+    "crown cup dagger feather flute gem hammer helmet key lamp lantern map "
+    "mask mirror necklace ring scroll shield sword telescope watch"
+).split()
+
+
+class DatasetSpec:
+    def __init__(
+        self,
+        users: int = 100000,
+        seed: int = 0,
+        zipf_exponent: float = 1.2,
+        max_items: int = 1000,
+        pending_sendings: float = 0.02,
+        token_share: float = 0.5,
+        expired_token_share: float = 0.1,
+        password: str = "password",
+        login_prefix: str = "user",
+        block_size: int = 20000,
+        now: Optional[datetime] = None,
+    ) -> None:
+        self.users = users
+        self.seed = seed
+        self.zipf_exponent = zipf_exponent
+        self.max_items = max_items
+        self.pending_sendings = pending_sendings
+        self.token_share = token_share
+        self.expired_token_share = expired_token_share
+        self.password = password
+        self.login_prefix = login_prefix
+        self.block_size = block_size
+        self.now = now or datetime.now()
+
+
+class ShardRows:
+    __slots__ = ("users", "items", "sendings")
+
+    def __init__(self) -> None:
+        self.users: List[Tuple[Any, ...]] = []
+        self.items: List[Tuple[Any, ...]] = []
+        self.sendings: List[Tuple[Any, ...]] = []
+
+    def __len__(self) -> int:
+        return len(self.users) + len(self.items) + len(self.sendings)
+
+
+class DatasetGenerator:
+    """
+    Generates rows block by block of `block_size` users.
+
+    Item counts per user follow Zipf distribution bounded by `max_items`,
+    `pending_sendings` share of items has a sending to another user of the
+    same block. Ids follow shard router allocation, starting after given
+    per shard sequence values.
+    """
+
+    def __init__(
+        self,
+        spec: DatasetSpec,
+        last_user_ids: List[int],
+        last_item_ids: List[int],
+        last_sending_ids: List[int],
+    ) -> None:
+        self.spec = spec
+        self.rng = random.Random(spec.seed)
+        self.last_user_ids = list(last_user_ids)
+        self.last_item_ids = list(last_item_ids)
+        self.last_sending_ids = list(last_sending_ids)
+
+        weights = [
+            1 / (count + 1) ** spec.zipf_exponent for count in range(spec.max_items + 1)
+        ]
+        total = sum(weights)
+        self._items_cdf: List[float] = []
+        cumulative = 0.0
+        for weight in weights:
+            cumulative += weight / total
+            self._items_cdf.append(cumulative)
+
+        salt = hashlib.sha256(str(spec.seed).encode()).digest()[:16]
+        self.password_hash = hash_password(spec.password, salt=salt)
+
+    def _next_id(self, last_ids: List[int], shard_index: int) -> int:
+        last_ids[shard_index] += 1
+        return last_ids[shard_index] * shards.count + shard_index
+
+    def _items_count(self) -> int:
+        count = bisect.bisect_left(self._items_cdf, self.rng.random())
+        return min(count, self.spec.max_items)
+
+    def _token(self, user_id: int) -> Tuple[Optional[str], Optional[datetime]]:
+        rng = self.rng
+        if rng.random() >= self.spec.token_share:
+            return None, None
+
+        token_bytes = rng.getrandbits(TOKEN_BYTES_LENGTH * 8).to_bytes(
+            TOKEN_BYTES_LENGTH, "big"
+        )
+        token = shards.tag_token(user_id, token_bytes.hex())
+        ttl = rng.uniform(0, TOKEN_TTL_SECONDS)
+        if rng.random() < self.spec.expired_token_share:
+            ttl = -ttl
+        return token, self.spec.now + timedelta(seconds=ttl)
+
+    def blocks(self) -> Iterator[Dict[int, ShardRows]]:
+        spec, rng = self.spec, self.rng
+        for block_start in range(0, spec.users, spec.block_size):
+            block_end = min(block_start + spec.block_size, spec.users)
+            rows = {shard_index: ShardRows() for shard_index in range(shards.count)}
+            block_user_ids: List[int] = []
+            owned_items: List[Tuple[int, int, int]] = []
+
+            for number in range(block_start, block_end):
+                login = f"{spec.login_prefix}{number}"
+                shard_index = shards.index_for_login(login)
+                user_id = self._next_id(self.last_user_ids, shard_index)
+                token, token_expiration_time = self._token(user_id)
+                rows[shard_index].users.append(
+                    (user_id, login, self.password_hash, token, token_expiration_time)
+                )
+                block_user_ids.append(user_id)
+
+                for _ in range(self._items_count()):
+                    item_id = self._next_id(self.last_item_ids, shard_index)
+                    name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}"
+                    rows[shard_index].items.append((item_id, user_id, name))
+                    owned_items.append((shard_index, item_id, user_id))
+
+            if len(block_user_ids) > 1:
+                for shard_index, item_id, user_id in owned_items:
+                    if rng.random() >= spec.pending_sendings:
+                        continue
+
+                    to_user_id = user_id
+                    while to_user_id == user_id:
+                        to_user_id = rng.choice(block_user_ids)
+                    url = base64.urlsafe_b64encode(
+                        rng.getrandbits(128).to_bytes(16, "big")
+                    ).rstrip(b"=")
+                    rows[shard_index].sendings.append(
+                        (
+                            self._next_id(self.last_sending_ids, shard_index),
+                            item_id,
+                            user_id,
+                            to_user_id,
+                            url.decode(),
+                        )
+                    )
+            yield rows
+
+
+async def _last_values(connection: Any, sequence: str) -> int:
+    row = await connection.fetchrow(f"SELECT last_value, is_called FROM {sequence}")
+    return row["last_value"] if row["is_called"] else row["last_value"] - 1
+
+
+async def seed(spec: DatasetSpec, fk_checks: bool = True) -> int:
+    """Writes dataset to shards, returns number of written rows."""
+    async with AsyncExitStack() as stack:
+        connections = []
+        for db in shards.databases:
+            connection = await stack.enter_async_context(db.connection())
+            connections.append(connection.raw_connection)
+            if not fk_checks:
+                # Skips foreign key triggers, rows are consistent by construction.
+                await connection.raw_connection.execute(
+                    "SET session_replication_role = replica"
+                )
+
+        generator = DatasetGenerator(
+            spec,
+            last_user_ids=[await _last_values(c, "users_id_seq") for c in connections],
+            last_item_ids=[await _last_values(c, "items_id_seq") for c in connections],
+            last_sending_ids=[
+                await _last_values(c, "sendings_id_seq") for c in connections
+            ],
+        )
+
+        written, started_at = 0, time.monotonic()
+        for block in generator.blocks():
+            for shard_index, rows in block.items():
+                connection = connections[shard_index]
+                async with connection.transaction():
+                    for table, columns, records in (
+                        ("users", USER_COLUMNS, rows.users),
+                        ("items", ITEM_COLUMNS, rows.items),
+                        ("sendings", SENDING_COLUMNS, rows.sendings),
+                    ):
+                        if records:
+                            await connection.copy_records_to_table(
+                                table, records=records, columns=columns
+                            )
+                written += len(rows)
+
+            elapsed = max(time.monotonic() - started_at, 1e-9)
+            print(
+                f"{written} rows, {written / elapsed:.0f} rows/s", file=sys.stderr
+            )
+
+        for shard_index, connection in enumerate(connections):
+            for sequence, last_ids in (
+                ("users_id_seq", generator.last_user_ids),
+                ("items_id_seq", generator.last_item_ids),
+                ("sendings_id_seq", generator.last_sending_ids),
+            ):
+                if last_ids[shard_index]:
+                    await connection.execute(
+                        "SELECT setval($1, $2)", sequence, last_ids[shard_index]
+                    )
+            await connection.execute("ANALYZE users, items, sendings")
+        return written
+
+
+def main() -> None:
+    defaults = DatasetSpec()
+    parser = argparse.ArgumentParser(description="Generate synthetic dataset.")
+    parser.add_argument("--users", type=int, default=defaults.users)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--zipf-exponent", type=float, default=defaults.zipf_exponent)
+    parser.add_argument("--max-items", type=int, default=defaults.max_items)
+    parser.add_argument(
+        "--pending-sendings",
+        type=float,
+        default=defaults.pending_sendings,
+        help="share of items with pending sending",
+    )
+    parser.add_argument(
+        "--token-share",
+        type=float,
+        default=defaults.token_share,
+        help="share of users with a token",
+    )
+    parser.add_argument(
+        "--expired-token-share",
+        type=float,
+        default=defaults.expired_token_share,
+        help="share of tokens already expired",
+    )
+    parser.add_argument("--password", default=defaults.password)
+    parser.add_argument("--login-prefix", default=defaults.login_prefix)
+    parser.add_argument("--block-size", type=int, default=defaults.block_size)
+    parser.add_argument(
+        "--now",
+        type=datetime.fromisoformat,
+        default=None,
+        help="reference time of token expirations, ISO format",
+    )
+    parser.add_argument(
+        "--no-fk-checks",
+        action="store_true",
+        help="skip foreign key checks, requires superuser",
+    )
+    args = parser.parse_args()
+    spec = DatasetSpec(
+        users=args.users,
+        seed=args.seed,
+        zipf_exponent=args.zipf_exponent,
+        max_items=args.max_items,
+        pending_sendings=args.pending_sendings,
+        token_share=args.token_share,
+        expired_token_share=args.expired_token_share,
+        password=args.password,
+        login_prefix=args.login_prefix,
+        block_size=args.block_size,
+        now=args.now,
+    )
+
+    async def run() -> int:
+        await shards.connect()
+        try:
+            return await seed(spec, fk_checks=not args.no_fk_checks)
+        finally:
+            await shards.disconnect()
+
+    print(asyncio.run(run()))
+
+
+if __name__ == "__main__":
+    main()
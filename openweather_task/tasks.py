@@ -0,0 +1,44 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+__all__ = ["PeriodicTask"]
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """Runs coroutine function in background every `interval` seconds."""
+
+    def __init__(
+        self, callback: Callable[[], Awaitable[None]], interval: float
+    ) -> None:
+        self.callback = callback
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.callback()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Periodic task %r failed", self.callback)
+
+            await asyncio.sleep(self.interval)
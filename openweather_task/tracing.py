@@ -0,0 +1,295 @@
+"""
+Lightweight request tracing.
+
+Spans are recorded only for sampled traces, unsampled requests pay for one
+context variable lookup per instrumented call. Finished traces are buffered
+and written by exporter out of request handling, see `Tracer.flush`.
+"""
+import asyncio
+import functools
+import importlib
+import inspect
+import json
+import logging
+import random
+import re
+import secrets
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Type,
+    TypeVar,
+)
+
+from openweather_task import metrics
+from openweather_task.config import (
+    TRACING_EXPORTER,
+    TRACING_JSONL_PATH,
+    TRACING_MAX_PENDING_SPANS,
+    TRACING_SAMPLE_RATE,
+)
+
+__all__ = [
+    "JsonLinesExporter",
+    "Span",
+    "SpanExporter",
+    "Tracer",
+    "current_span",
+    "traced",
+    "traced_methods",
+    "tracer",
+]
+
+logger = logging.getLogger(__name__)
+
+dropped_spans = metrics.counter(
+    "tracing_dropped_spans_total", "Spans dropped because export fell behind"
+)
+
+# https://www.w3.org/TR/trace-context/#traceparent-header
+TRACEPARENT_PATTERN = re.compile(
+    r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$"
+)
+SAMPLED_FLAG = 0x01
+
+T = TypeVar("T")
+
+
+class Span:
+    __slots__ = (
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "name",
+        "attributes",
+        "started_at",
+        "start_time",
+        "duration",
+        "error",
+        "root",
+        "children",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str] = None,
+        root: Optional["Span"] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes or {}
+        self.start_time = time.time()
+        self.started_at = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        # Root collects finished spans of its trace, they are exported together.
+        self.root = root or self
+        self.children: List[Span] = []
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{SAMPLED_FLAG:02x}"
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self.started_at
+        if self.root is not self:
+            self.root.children.append(self)
+
+    def dict(self) -> Dict[str, Any]:
+        return dict(
+            trace_id=self.trace_id,
+            span_id=self.span_id,
+            parent_id=self.parent_id,
+            name=self.name,
+            start_time=self.start_time,
+            duration_ms=round((self.duration or 0) * 1000, 3),
+            attributes=self.attributes,
+            error=self.error,
+        )
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+class SpanExporter:
+    """Writes finished spans, called out of request handling."""
+
+    def export(self, spans: List[Span]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class JsonLinesExporter(SpanExporter):
+    """Appends spans as JSON lines, for environments without a collector."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def export(self, spans: List[Span]) -> None:
+        with open(self.path, "a") as file:
+            file.writelines(json.dumps(span.dict()) + "\n" for span in spans)
+
+
+class Tracer:
+    def __init__(
+        self,
+        exporter: Optional[SpanExporter],
+        sample_rate: float,
+        max_pending_spans: int,
+    ) -> None:
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.max_pending_spans = max_pending_spans
+        self._pending: List[Span] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    @contextmanager
+    def trace(
+        self, name: str, traceparent: Optional[str] = None, **attributes: Any
+    ) -> Iterator[Optional[Span]]:
+        """
+        Starts trace root, continuing remote parent from `traceparent`.
+
+        Sampled remote parents are always continued, new traces are sampled
+        with `sample_rate`. Yields None for unsampled traces.
+        """
+        parent = TRACEPARENT_PATTERN.match(traceparent or "")
+        if parent:
+            trace_id, parent_id, flags = parent.groups()
+            sampled = bool(int(flags, 16) & SAMPLED_FLAG)
+        else:
+            trace_id, parent_id = secrets.token_hex(16), None
+            sampled = random.random() < self.sample_rate
+
+        if not self.enabled or not sampled:
+            yield None
+            return
+
+        span = Span(name, trace_id, parent_id, attributes=attributes)
+        try:
+            with self._activate(span):
+                yield span
+        finally:
+            # Failed and cancelled requests are exported with their error.
+            self._collect(span)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Starts child span of current one, yields None outside sampled trace."""
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+
+        span = Span(name, parent.trace_id, parent.span_id, parent.root, attributes)
+        with self._activate(span):
+            yield span
+
+    @contextmanager
+    def _activate(self, span: Span) -> Iterator[None]:
+        token = _current_span.set(span)
+        try:
+            yield
+        except BaseException as exc:
+            span.error = repr(exc)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.finish()
+
+    def _collect(self, root: Span) -> None:
+        spans = [root] + root.children
+        root.children = []
+        if len(self._pending) + len(spans) > self.max_pending_spans:
+            dropped_spans.inc(len(spans))
+            return
+        self._pending.extend(spans)
+
+    async def flush(self) -> None:
+        """Exports pending spans in executor, so file writes don't block loop."""
+        if not self._pending or self.exporter is None:
+            return
+
+        spans, self._pending = self._pending, []
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, self.exporter.export, spans)
+        except Exception:
+            dropped_spans.inc(len(spans))
+            logger.exception("Failed to export %s spans", len(spans))
+
+
+def traced(
+    name: Optional[str] = None,
+) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """Decorates coroutine function to run in its own span."""
+
+    def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            if _current_span.get() is None:
+                return await func(*args, **kwargs)
+
+            with tracer.span(span_name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def traced_methods(cls: Type[T]) -> Type[T]:
+    """Class decorator tracing coroutine classmethods as `Class.method` spans."""
+    for attribute, value in list(vars(cls).items()):
+        if isinstance(value, classmethod) and inspect.iscoroutinefunction(
+            value.__func__
+        ):
+            span_name = f"{cls.__name__}.{attribute}"
+            setattr(cls, attribute, classmethod(traced(span_name)(value.__func__)))
+    return cls
+
+
+def load_exporter(name: str) -> Optional[SpanExporter]:
+    """Returns built-in "jsonl" exporter or one created by `module:factory`."""
+    if not name:
+        return None
+    if name == "jsonl":
+        return JsonLinesExporter(TRACING_JSONL_PATH)
+
+    module_name, _, factory_name = name.partition(":")
+    factory = getattr(importlib.import_module(module_name), factory_name)
+    return factory()
+
+
+tracer = Tracer(
+    exporter=load_exporter(TRACING_EXPORTER),
+    sample_rate=TRACING_SAMPLE_RATE,
+    max_pending_spans=TRACING_MAX_PENDING_SPANS,
+)
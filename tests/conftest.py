@@ -7,6 +7,8 @@ from alembic import command
 from alembic.config import Config
 from databases import Database
 
+from openweather_task.database.models import login_ids
+
 POSTGRES_DOCKER_IMAGE = "postgres:13"
 EXPOSED_PORT = 5432
 POSTGRES_TEST_SERVER_URI = (
@@ -46,6 +48,8 @@ async def database():
     await db.connect()
     yield db
     await db.disconnect()
+    # Tests truncate users, so ids cached by their logins go stale.
+    login_ids.clear()
 
 
 def run_migrations() -> None:
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import sys
+from typing import AsyncIterator, List
+
+import pytest
+from async_asgi_testclient import TestClient
+from databases import Database
+from sqlalchemy import select
+from starlette import status
+
+from openweather_task.database.models import item_changes, items, users
+from openweather_task.importer import (
+    hash_passwords,
+    import_items,
+    import_password_hasher,
+    iter_lines,
+)
+from openweather_task.main import app
+
+ADMIN_TOKEN = "sample_admin_token"
+
+
+@pytest.fixture(autouse=True)
+def admin_token(monkeypatch) -> None:
+    admin = sys.modules["openweather_task.routers.admin"]
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", ADMIN_TOKEN)
+
+
+async def stream(*chunks: bytes) -> AsyncIterator[bytes]:
+    for chunk in chunks:
+        yield chunk
+
+
+async def collect(lines: AsyncIterator[str]) -> List[str]:
+    return [line async for line in lines]
+
+
+@pytest.mark.asyncio
+async def test_lines_split_across_chunks() -> None:
+    snowman = "☃".encode()
+    lines = iter_lines(
+        stream(b"login,na", b"me\nAlex,", snowman[:1], snowman[1:], b"\n")
+    )
+
+    assert await collect(lines) == ["login,name", "Alex,☃"]
+
+
+@pytest.mark.asyncio
+async def test_imported_passwords_hashed_in_chunks(monkeypatch) -> None:
+    in_flight = max_in_flight = 0
+
+    async def hash_password(password: str) -> str:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0)
+        in_flight -= 1
+        return f"scrypt${password}"
+
+    monkeypatch.setattr(import_password_hasher, "max_concurrency", 2)
+    monkeypatch.setattr(import_password_hasher, "hash", hash_password)
+    records = [{"password": f"password{n}"} for n in range(5)]
+    records.append({"password": "scrypt$16384$8$1$00$00"})
+    await hash_passwords(records)
+
+    # No more hashes are queued than import pool runs at once.
+    assert max_in_flight == 2
+    assert [record["password"] for record in records] == [
+        f"scrypt$password{n}" for n in range(5)
+    ] + ["scrypt$16384$8$1$00$00"]
+
+
+@pytest.mark.asyncio
+async def test_import_users(database: Database) -> None:
+    body = (
+        "login,password\n"
+        "Alex,new_password\n"
+        "Ben,first_password\n"
+        "Ben,second_password\n"
+        "Carl,scrypt$16384$8$1$00$00\n"
+    )
+    try:
+        await database.execute(
+            users.insert().values(id=1, login="Alex", password="sample_password")
+        )
+
+        async with TestClient(app) as client:
+            forbidden = await client.post(
+                "/admin/import/users", data=body, headers={"X-Admin-Token": "wrong"}
+            )
+            non_ascii_forbidden = await client.post(
+                "/admin/import/users", data=body, headers={"X-Admin-Token": "wrongé"}
+            )
+            response = await client.post(
+                "/admin/import/users",
+                data=body,
+                headers={"X-Admin-Token": ADMIN_TOKEN},
+            )
+
+        rows = await database.fetch_all(select([users.c.login, users.c.password]))
+        passwords = {row["login"]: row["password"] for row in rows}
+
+        assert forbidden.status_code == status.HTTP_403_FORBIDDEN
+        assert non_ascii_forbidden.status_code == status.HTTP_403_FORBIDDEN
+        assert response.json() == {"rows": 4, "imported": 2, "updated": 0, "skipped": 2}
+        assert passwords["Alex"] == "sample_password"
+        assert passwords["Ben"].startswith("scrypt$")
+        assert passwords["Carl"] == "scrypt$16384$8$1$00$00"
+
+    finally:
+        await database.execute("TRUNCATE users RESTART IDENTITY CASCADE")
+
+
+@pytest.mark.asyncio
+async def test_import_users_updates_conflicts(database: Database) -> None:
+    body = "\n".join(
+        json.dumps(user)
+        for user in [
+            {"login": "Alex", "password": "scrypt$16384$8$1$00$01"},
+            {"login": "Ben", "password": "scrypt$16384$8$1$00$02"},
+        ]
+    )
+    try:
+        await database.execute(
+            users.insert().values(id=1, login="Alex", password="sample_password")
+        )
+
+        async with TestClient(app) as client:
+            response = await client.post(
+                "/admin/import/users",
+                query_string={"format": "ndjson", "on_conflict": "update"},
+                data=body,
+                headers={"X-Admin-Token": ADMIN_TOKEN},
+            )
+
+        alex_password = await database.fetch_val(
+            select([users.c.password]).where(users.c.login == "Alex")
+        )
+
+        assert response.json() == {"rows": 2, "imported": 1, "updated": 1, "skipped": 0}
+        assert alex_password == "scrypt$16384$8$1$00$01"
+
+    finally:
+        await database.execute("TRUNCATE users RESTART IDENTITY CASCADE")
+
+
+@pytest.mark.asyncio
+async def test_import_items(database: Database) -> None:
+    lines = [
+        "login,name",
+        "Alex,first",
+        'Alex,"second, with comma"',
+        "Ghost,orphan",
+    ]
+    progress = []
+    try:
+        await database.execute(
+            users.insert().values(id=1, login="Alex", password="sample_password")
+        )
+
+        async with TestClient(app):
+            stats = await import_items(
+                iter_lines(stream(*(f"{line}\n".encode() for line in lines))),
+                batch_size=2,
+                progress=lambda stats: progress.append(stats.rows),
+            )
+
+        imported_items = await database.fetch_all(
+            select([items.c.user_id, items.c.name]).order_by(items.c.id)
+        )
+        changes = await database.fetch_all(
+            select([item_changes.c.seq, item_changes.c.name]).order_by(
+                item_changes.c.seq
+            )
+        )
+
+        assert stats.dict() == {"rows": 3, "imported": 2, "updated": 0, "skipped": 1}
+        assert progress == [2, 3]
+        assert [(item["user_id"], item["name"]) for item in imported_items] == [
+            (1, "first"),
+            (1, "second, with comma"),
+        ]
+        assert [(change["seq"], change["name"]) for change in changes] == [
+            (1, "first"),
+            (2, "second, with comma"),
+        ]
+
+    finally:
+        await database.execute("TRUNCATE users RESTART IDENTITY CASCADE")
@@ -0,0 +1,230 @@
+import asyncio
+import zlib
+
+import pytest
+from async_asgi_testclient import TestClient
+from starlette import status
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+
+from openweather_task.middleware import (
+    CancelOnDisconnectMiddleware,
+    CompressionMiddleware,
+    LoadSheddingMiddleware,
+    RateLimitMiddleware,
+    parse_rate_limits,
+)
+from openweather_task.monitoring import loop_lag_monitor
+
+
+def echo_app() -> Starlette:
+    app = Starlette()
+
+    @app.route("/items", methods=["GET", "POST"])
+    async def echo(request) -> JSONResponse:  # type: ignore
+        body = await request.body()
+        return JSONResponse({"body": body.decode()})
+
+    return app
+
+
+def test_parse_rate_limits() -> None:
+    limits = parse_rate_limits("POST /items/{id}=5:10; *=50")
+
+    assert [limit.name for limit in limits] == ["POST /items/{id}", "*"]
+    assert limits[0].matches("POST", "/items/1")
+    assert not limits[0].matches("GET", "/items/1")
+    assert (limits[1].rate, limits[1].burst) == (50, 50)
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_per_token() -> None:
+    app = echo_app()
+    app.add_middleware(
+        RateLimitMiddleware,
+        limits=parse_rate_limits("POST /items=0.001:2"),
+        max_buckets=10,
+    )
+
+    async with TestClient(app) as client:
+        responses = [
+            await client.post("/items", json={"token": "token_a"}) for _ in range(3)
+        ]
+        other_token_response = await client.post("/items", json={"token": "token_b"})
+        unlimited_response = await client.get("/items", query_string={"token": "a"})
+
+    assert [response.status_code for response in responses] == [
+        status.HTTP_200_OK,
+        status.HTTP_200_OK,
+        status.HTTP_429_TOO_MANY_REQUESTS,
+    ]
+    assert "Retry-After" in responses[2].headers
+    # Body consumed by middleware is replayed to application.
+    assert responses[0].json() == {"body": '{"token": "token_a"}'}
+    assert other_token_response.status_code == status.HTTP_200_OK
+    assert unlimited_response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_unaccepted_tokens_per_client() -> None:
+    app = Starlette()
+
+    @app.route("/items", methods=["POST"])
+    async def authorize(request) -> JSONResponse:  # type: ignore
+        accepted = (await request.json())["token"] == "valid_token"
+        return JSONResponse({}, status_code=200 if accepted else 401)
+
+    app.add_middleware(
+        RateLimitMiddleware,
+        limits=parse_rate_limits("POST /items=0.001:2"),
+        max_buckets=10,
+    )
+
+    async with TestClient(app) as client:
+        valid_responses = [
+            await client.post("/items", json={"token": "valid_token"})
+            for _ in range(3)
+        ]
+        made_up_responses = [
+            await client.post("/items", json={"token": f"made_up_{index}"})
+            for index in range(2)
+        ]
+
+    # First request of token is charged to its client, later ones to token.
+    assert [response.status_code for response in valid_responses] == [
+        status.HTTP_200_OK,
+        status.HTTP_200_OK,
+        status.HTTP_429_TOO_MANY_REQUESTS,
+    ]
+    assert [response.status_code for response in made_up_responses] == [
+        status.HTTP_401_UNAUTHORIZED,
+        status.HTTP_429_TOO_MANY_REQUESTS,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_load_shedding_on_loop_lag(monkeypatch) -> None:
+    app = echo_app()
+    app.add_middleware(
+        LoadSheddingMiddleware,
+        max_pool_waiters=0,
+        max_loop_lag_seconds=0.5,
+        retry_after_seconds=1,
+    )
+
+    async with TestClient(app) as client:
+        monkeypatch.setattr(loop_lag_monitor, "lag", 0.1)
+        response = await client.get("/items")
+        monkeypatch.setattr(loop_lag_monitor, "lag", 1.0)
+        shed_response = await client.get("/items")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert shed_response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert shed_response.headers["Retry-After"] == "1"
+
+
+@pytest.mark.asyncio
+async def test_compression() -> None:
+    # Brotli is installed with the optional "compact" extra only.
+    brotli = pytest.importorskip("brotli")
+    app = echo_app()
+    app.add_middleware(
+        CompressionMiddleware, minimum_size=100, gzip_level=5, brotli_quality=4
+    )
+
+    async with TestClient(app) as client:
+        small = await client.post("/items", data="x", headers={"Accept-Encoding": "br"})
+        large = await client.post(
+            "/items", data="x" * 1000, headers={"Accept-Encoding": "gzip;q=0.5, br"}
+        )
+
+    assert "Content-Encoding" not in small.headers
+    assert large.headers["Content-Encoding"] == "br"
+    assert large.headers["Content-Length"] == str(len(large.content))
+    assert brotli.decompress(large.content) == b'{"body":"%s"}' % (b"x" * 1000)
+
+
+@pytest.mark.asyncio
+async def test_streamed_response_compression() -> None:
+    chunks = [b"data: %d\n\n" % number for number in range(3)]
+
+    async def stream_events(scope, receive, send):  # type: ignore
+        headers = [(b"content-type", b"text/event-stream")]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        for number, chunk in enumerate(chunks, start=1):
+            more_body = number < len(chunks)
+            await send(
+                {"type": "http.response.body", "body": chunk, "more_body": more_body}
+            )
+
+    messages = []
+
+    async def send(message):  # type: ignore
+        messages.append(message)
+
+    app = CompressionMiddleware(
+        stream_events, minimum_size=100, gzip_level=5, brotli_quality=4
+    )
+    scope = {"type": "http", "headers": [(b"accept-encoding", b"gzip")]}
+    await app(scope, None, send)
+
+    start, *bodies = messages
+    assert (b"content-encoding", b"gzip") in start["headers"]
+    # Every chunk is flushed, so events are decodable on arrival.
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    assert [decompressor.decompress(body["body"]) for body in bodies] == chunks
+    assert decompressor.eof
+
+
+@pytest.mark.asyncio
+async def test_cancel_on_disconnect() -> None:
+    handled = asyncio.Event()
+    cancelled = False
+
+    async def slow_app(scope, receive, send):  # type: ignore
+        nonlocal cancelled
+        assert await receive() == {"type": "http.request", "body": b""}
+        handled.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+
+    messages = [{"type": "http.request", "body": b""}, {"type": "http.disconnect"}]
+
+    async def receive():  # type: ignore
+        message = messages.pop(0)
+        if message["type"] == "http.disconnect":
+            await handled.wait()
+        return message
+
+    app = CancelOnDisconnectMiddleware(slow_app)
+    await asyncio.wait_for(app({"type": "http"}, receive, None), 1)
+
+    assert cancelled
+
+
+@pytest.mark.asyncio
+async def test_cancel_on_disconnect_keeps_backpressure() -> None:
+    chunks_received = 0
+    chunks_received_before_reading = 0
+
+    async def receive():  # type: ignore
+        nonlocal chunks_received
+        await asyncio.sleep(0)
+        chunks_received += 1
+        return {"type": "http.request", "body": b"chunk", "more_body": True}
+
+    async def lazy_app(scope, receive, send):  # type: ignore
+        nonlocal chunks_received_before_reading
+        await asyncio.sleep(0.05)
+        chunks_received_before_reading = chunks_received
+        for _ in range(3):
+            assert (await receive())["body"] == b"chunk"
+
+    app = CancelOnDisconnectMiddleware(lazy_app)
+    await asyncio.wait_for(app({"type": "http"}, receive, None), 1)
+
+    # One message is queued for app, one more is awaiting room in queue.
+    assert chunks_received_before_reading == 2
@@ -0,0 +1,44 @@
+import asyncio
+import logging
+import time
+
+import pytest
+
+from openweather_task import monitoring
+from openweather_task.monitoring import EventLoopLagMonitor
+
+
+def block_loop(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+@pytest.mark.asyncio
+async def test_slow_callback_reported(caplog, monkeypatch) -> None:
+    # Alembic's logging config disables loggers existing when migrations run.
+    monkeypatch.setattr(monitoring.logger, "disabled", False)
+    monitor = EventLoopLagMonitor(interval=0.01, slow_callback_threshold=0.05)
+    measuring = True
+
+    async def measure() -> None:
+        while measuring:
+            await monitor.measure()
+
+    async def handle_request() -> None:
+        monitor.task_routes[asyncio.current_task()] = "POST /items/new"
+        await asyncio.sleep(0.05)
+        block_loop(0.3)
+
+    measurer = asyncio.ensure_future(measure())
+    monitor.start()
+    try:
+        with caplog.at_level(logging.WARNING, logger="openweather_task.monitoring"):
+            await handle_request()
+            await asyncio.sleep(0.05)
+    finally:
+        monitor.stop()
+        measuring = False
+        await measurer
+
+    [record] = caplog.records
+    assert "by POST /items/new" in record.getMessage()
+    assert "in block_loop" in record.getMessage()
@@ -0,0 +1,65 @@
+import pytest
+from asyncpg.exceptions import ForeignKeyViolationError
+from databases import Database
+
+from openweather_task.database import shards
+from openweather_task.database.models import (
+    ItemModel,
+    SendingModel,
+    SendingStatus,
+    items,
+    sendings,
+    users,
+)
+
+ITEM_PARTITION_QUERY = "SELECT tableoid::regclass::text FROM items WHERE id = :id"
+
+
+@pytest.fixture
+async def shard(database: Database, monkeypatch) -> Database:
+    monkeypatch.setattr(shards, "databases", [database])
+    await database.execute(users.insert().values(id=1, login="A", password="-"))
+    await database.execute(users.insert().values(id=2, login="B", password="-"))
+    await database.execute(items.insert().values(id=1, user_id=1, name="item"))
+    await database.execute(
+        sendings.insert().values(
+            id=1, item_id=1, from_user_id=1, to_user_id=2, confirmation_url="url"
+        )
+    )
+    yield database
+    await database.execute("TRUNCATE users CASCADE")
+
+
+@pytest.mark.asyncio
+async def test_transfer_moves_item_between_partitions(shard: Database) -> None:
+    sender_partition = await shard.fetch_val(ITEM_PARTITION_QUERY, {"id": 1})
+
+    sending_status = await SendingModel.complete_sending(
+        to_user_id=2, item_id=1, confirmation_url="url"
+    )
+
+    assert sending_status == SendingStatus.COMPLETED
+    assert await shard.fetch_val(ITEM_PARTITION_QUERY, {"id": 1}) != sender_partition
+    assert await ItemModel.get(1, user_id=1) is None
+    assert dict(await ItemModel.get(1, user_id=2)) == {
+        "user_id": 2,
+        "id": 1,
+        "name": "item",
+        "version": 2,
+    }
+    assert await ItemModel.list(user_id=1) == []
+    assert await shard.fetch_all(sendings.select()) == []
+
+
+@pytest.mark.asyncio
+async def test_sendings_foreign_key_checked_on_commit(shard: Database) -> None:
+    # Sending of moved item is left behind, so commit fails.
+    with pytest.raises(ForeignKeyViolationError):
+        async with shard.transaction():
+            await shard.execute(
+                items.update().where(items.c.id == 1).values(user_id=2)
+            )
+
+    assert [dict(item) for item in await ItemModel.list(user_id=1)] == [
+        {"id": 1, "name": "item"}
+    ]
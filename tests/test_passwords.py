@@ -0,0 +1,130 @@
+import asyncio
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+import pytest
+from async_asgi_testclient import TestClient
+from databases import Database
+from starlette import status
+
+from openweather_task.config import PASSWORD_HASHING_WORKERS
+from openweather_task.database.models import users
+from openweather_task.main import app
+from openweather_task.security.passwords import (
+    PasswordHasher,
+    hash_password,
+    is_hashed,
+)
+
+LOGIN_STORM_SIZE = 40
+
+
+@pytest.fixture
+def hasher() -> PasswordHasher:
+    hasher = PasswordHasher(executor="thread", max_workers=1, max_concurrency=1)
+    yield hasher
+    hasher.stop()
+
+
+@pytest.mark.asyncio
+async def test_hash_verified(hasher: PasswordHasher) -> None:
+    password_hash = await hasher.hash("sample_password")
+
+    assert is_hashed(password_hash)
+    assert await hasher.verify("sample_password", password_hash)
+    assert not await hasher.verify("wrong_password", password_hash)
+
+
+@pytest.mark.asyncio
+async def test_legacy_plain_text_verified(hasher: PasswordHasher) -> None:
+    assert not is_hashed("sample_password")
+    assert await hasher.verify("sample_password", "sample_password")
+    assert not await hasher.verify("wrong_password", "sample_password")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "legacy_password",
+    [
+        "scrypt$not$a$hash",
+        "scrypt$3$1$1$00$00",
+        "scrypt$16384$0$1$00$00",
+        "scrypt$16384$8$0$00$00",
+        "scrypt$65536$1$1$00$00",
+        "scrypt$1048576$8$1$00$00",
+        "scrypt$16384$8$1$$00",
+        "scrypt$16384$8$1$00$",
+    ],
+)
+async def test_legacy_plain_text_like_hash_verified(
+    hasher: PasswordHasher, legacy_password: str
+) -> None:
+    assert not is_hashed(legacy_password)
+    assert await hasher.verify(legacy_password, legacy_password)
+    assert not await hasher.verify("wrong_password", legacy_password)
+
+
+# Hashing workers sharing event loop's core slow it down regardless.
+@pytest.mark.skipif(
+    (os.cpu_count() or 1) <= PASSWORD_HASHING_WORKERS,
+    reason="Hashing workers need cores besides event loop's",
+)
+@pytest.mark.asyncio
+async def test_items_latency_flat_during_login_storm(database: Database) -> None:
+    started_at = time.perf_counter()
+    password_hash = hash_password("sample_password")
+    derivation_seconds = time.perf_counter() - started_at
+    token = "cca8568a441e4f082527908791ec3bea"
+    user = {
+        "id": 1,
+        "login": "sample_login",
+        "password": "sample_password",
+        "token": token,
+        "token_expiration_time": datetime.now() + timedelta(hours=1),
+    }
+    # Logins replace tokens, so they're made by another user.
+    storming_user = {"id": 2, "login": "storming_login", "password": password_hash}
+    login_request = {"login": "storming_login", "password": "sample_password"}
+    try:
+        await database.execute(users.insert().values(**user))
+        await database.execute(users.insert().values(**storming_user))
+
+        async with TestClient(app) as client:
+
+            async def list_items(count: int) -> List[float]:
+                latencies = []
+                for _ in range(count):
+                    started_at = time.perf_counter()
+                    response = await client.get("/items", query_string={"token": token})
+                    latencies.append(time.perf_counter() - started_at)
+                    assert response.status_code == status.HTTP_200_OK
+                return latencies
+
+            # Warms up executor, its workers are started on first use.
+            await client.post("/login", json=login_request)
+            baseline_latencies = await list_items(20)
+            logins = [
+                asyncio.ensure_future(client.post("/login", json=login_request))
+                for _ in range(LOGIN_STORM_SIZE)
+            ]
+            storm_latencies = await list_items(20)
+            logins_in_flight = sum(not login.done() for login in logins)
+            login_responses = await asyncio.gather(*logins)
+
+        baseline_latency = statistics.median(baseline_latencies)
+        storm_latency = statistics.median(storm_latencies)
+
+        assert logins_in_flight > 0
+        assert all(
+            response.status_code == status.HTTP_201_CREATED
+            for response in login_responses
+        )
+        # Requests would wait for key derivations run on event loop.
+        assert storm_latency < derivation_seconds / 2
+        assert storm_latency < baseline_latency * 2 + 0.005
+
+    finally:
+        await database.execute("TRUNCATE users CASCADE")
@@ -0,0 +1,89 @@
+import os
+import time
+
+import pytest
+from async_asgi_testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from openweather_task.middleware import (
+    CancelOnDisconnectMiddleware,
+    ProfilingMiddleware,
+)
+from openweather_task.profiling import SamplingProfiler
+
+
+def busy_loop(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def slow_endpoint(request) -> PlainTextResponse:
+    busy_loop(0.2)
+    return PlainTextResponse("done")
+
+
+def make_profiler(directory: str, latency_threshold: float = 0) -> SamplingProfiler:
+    return SamplingProfiler(
+        directory=directory,
+        interval=0.001,
+        sample_rate=1,
+        latency_threshold=latency_threshold,
+        max_bytes=1024 * 1024,
+    )
+
+
+async def profile_request(
+    profiler: SamplingProfiler, cancel_on_disconnect: bool = False
+) -> None:
+    app = Starlette(routes=[Route("/slow", slow_endpoint)])
+    if cancel_on_disconnect:
+        app = CancelOnDisconnectMiddleware(app)
+    profiler.start()
+    try:
+        async with TestClient(ProfilingMiddleware(app, profiler=profiler)) as client:
+            await client.get("/slow")
+    finally:
+        profiler.stop()
+    await profiler.flush()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("cancel_on_disconnect", [False, True])
+async def test_slow_request_profiled(tmp_path, cancel_on_disconnect: bool) -> None:
+    await profile_request(make_profiler(str(tmp_path)), cancel_on_disconnect)
+
+    (profile,) = os.listdir(tmp_path)
+    with open(tmp_path / profile) as file:
+        stacks = [line.rsplit(" ", 1) for line in file]
+
+    assert profile.startswith("slow_endpoint.")
+    assert all(stack.startswith("slow_endpoint;") for stack, _ in stacks)
+    busy_samples = sum(
+        int(count)
+        for stack, count in stacks
+        if "busy_loop (test_profiling.py)" in stack
+    )
+    assert busy_samples > 10
+
+
+@pytest.mark.asyncio
+async def test_fast_request_discarded(tmp_path) -> None:
+    await profile_request(make_profiler(str(tmp_path), latency_threshold=10))
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_oldest_profiles_rotated(tmp_path) -> None:
+    profiler = make_profiler(str(tmp_path))
+    profiler.max_bytes = 2048
+    for age, name in enumerate(["new", "middle", "old"]):
+        path = tmp_path / f"route.{name}.folded"
+        path.write_text("x" * 1024)
+        os.utime(path, (time.time() - age, time.time() - age))
+
+    profiler._rotate()
+
+    assert sorted(os.listdir(tmp_path)) == ["route.middle.folded", "route.new.folded"]
@@ -1,20 +1,34 @@
+import asyncio
+import sys
 from datetime import datetime, timedelta
 from typing import Any, Dict, List
 
 import pytest
+import uvloop
 from async_asgi_testclient import TestClient
 from databases import Database
-from sqlalchemy import and_, select
+from sqlalchemy import func, select
 from starlette import status
 from starlette.responses import JSONResponse
 
-from openweather_task.database.models import items, sendings, users
+from openweather_task import main
+from openweather_task.database.models import (
+    SendingModel,
+    UserModel,
+    idempotency_keys,
+    items,
+    sendings,
+    users,
+)
+from openweather_task.events import sending_events
+from openweather_task.health import health_checker
 from openweather_task.main import app
 from openweather_task.schemas import (
     CreateItemResponse,
     DeleteItemResponse,
     RegisterUserResponse,
 )
+from openweather_task.security import tokens
 
 JSON = Dict[str, Any]
 
@@ -127,16 +141,15 @@ async def test_login_user(
         async with TestClient(app) as client:
             response = await client.post("/login", json=login_request)
 
-        expected_token = await database.execute(
-            select([users.c.token]).where(
-                and_(
-                    users.c.login == login_request["login"],
-                    users.c.password == login_request["password"],
-                )
+        expected_user = await database.fetch_one(
+            select([users.c.token, users.c.password]).where(
+                users.c.login == login_request["login"]
             )
         )
         if user:
-            assert response.json()["token"] == expected_token
+            assert response.json()["token"] == expected_user["token"]
+            # Plain text password is rehashed on successful login.
+            assert expected_user["password"].startswith("scrypt$")
         assert response.status_code == expected_status
 
     finally:
@@ -303,6 +316,185 @@ async def test_delete_item(
         await database.execute("TRUNCATE users CASCADE")
 
 
+@pytest.mark.asyncio
+async def test_delete_item_if_match(database: Database) -> None:
+    token = "cca8568a441e4f082527908791ec3bea"
+    user = {
+        "id": 1,
+        "login": "sample_login",
+        "password": "sample_password",
+        "token": token,
+        "token_expiration_time": datetime.now() + timedelta(hours=1),
+    }
+    try:
+        await database.execute(users.insert().values(**user))
+
+        async with TestClient(app) as client:
+            created = await client.post(
+                "/items/new", json={"name": "item", "token": token}
+            )
+            item_id = created.json()["id"]
+            fetched = await client.get(
+                f"/items/{item_id}", query_string={"token": token}
+            )
+            stale = await client.delete(
+                f"/items/{item_id}",
+                json={"id": item_id, "token": token},
+                headers={"If-Match": '"2"'},
+            )
+            deleted = await client.delete(
+                f"/items/{item_id}",
+                json={"id": item_id, "token": token},
+                headers={"If-Match": fetched.headers["ETag"]},
+            )
+
+        assert created.headers["ETag"] == '"1"'
+        assert fetched.json() == {"id": item_id, "name": "item"}
+        assert fetched.headers["ETag"] == '"1"'
+        assert stale.status_code == status.HTTP_409_CONFLICT
+        assert deleted.json() == {"message": "Item successfully deleted"}
+
+    finally:
+        await database.execute("TRUNCATE users CASCADE")
+
+
+@pytest.mark.asyncio
+async def test_concurrent_item_writes_conflict(database: Database) -> None:
+    token = "cca8568a441e4f082527908791ec3bea"
+    user = {
+        "id": 1,
+        "login": "sample_login",
+        "password": "sample_password",
+        "token": token,
+        "token_expiration_time": datetime.now() + timedelta(hours=1),
+    }
+    recipient_token = "dca8568a441e4f082527908791ec3bea"
+    recipient = dict(user, id=2, login="recipient", token=recipient_token)
+    confirmation_url = "3ciaK7RvNsBgY-ehrkqZtg"
+    receive_request = {
+        "id": 1,
+        "token": recipient_token,
+        "confirmation_url": confirmation_url,
+    }
+    try:
+        await database.execute(users.insert().values(**user))
+        await database.execute(users.insert().values(**recipient))
+        await database.execute(items.insert().values(id=1, user_id=1, name="item"))
+        await database.execute(
+            sendings.insert().values(
+                id=1,
+                item_id=1,
+                from_user_id=1,
+                to_user_id=2,
+                confirmation_url=confirmation_url,
+            )
+        )
+
+        async with TestClient(app) as client:
+            # Concurrent transfer moves item to recipient's partition, holding
+            # its lock until rolled back.
+            transaction = await database.transaction()
+            try:
+                await database.execute(
+                    items.update().where(items.c.id == 1).values(user_id=2)
+                )
+                deleted_while_moving = await asyncio.wait_for(
+                    client.delete("/items/1", json={"id": 1, "token": token}), 5
+                )
+                received_while_moving = await asyncio.wait_for(
+                    client.get(
+                        f"/get/{confirmation_url}", query_string=receive_request
+                    ),
+                    5,
+                )
+            finally:
+                await transaction.rollback()
+
+            received = await client.get(
+                f"/get/{confirmation_url}", query_string=receive_request
+            )
+            deleted = await client.delete("/items/1", json={"id": 1, "token": token})
+            recipient_items = await client.get(
+                "/items", query_string={"token": recipient_token}
+            )
+
+        assert deleted_while_moving.status_code == status.HTTP_409_CONFLICT
+        assert received_while_moving.status_code == status.HTTP_409_CONFLICT
+        assert received.status_code == status.HTTP_200_OK
+        assert deleted.status_code == status.HTTP_204_NO_CONTENT
+        assert recipient_items.json() == [{"id": 1, "name": "item"}]
+
+    finally:
+        await database.execute("TRUNCATE users CASCADE")
+
+
+@pytest.mark.asyncio
+async def test_soft_delete_item(monkeypatch, database: Database) -> None:
+    items_module = sys.modules["openweather_task.database.models.items"]
+    monkeypatch.setattr(items_module, "ITEM_SOFT_DELETE", True)
+    # Purged explicitly below, background purger would race with the checks.
+    monkeypatch.setattr(
+        main,
+        "background_tasks",
+        [
+            task
+            for task in main.background_tasks
+            if task.callback != items_module.ItemModel.purge_deleted
+        ],
+    )
+    token = "cca8568a441e4f082527908791ec3bea"
+    user = {
+        "id": 1,
+        "login": "sample_login",
+        "password": "sample_password",
+        "token": token,
+        "token_expiration_time": datetime.now() + timedelta(hours=1),
+    }
+    recipient_token = "dca8568a441e4f082527908791ec3bea"
+    recipient = dict(user, id=2, login="recipient", token=recipient_token)
+    try:
+        await database.execute(users.insert().values(**user))
+        await database.execute(users.insert().values(**recipient))
+        await database.execute(items.insert().values(id=1, user_id=1, name="item"))
+        await database.execute(
+            sendings.insert().values(
+                id=1, item_id=1, from_user_id=1, to_user_id=2, confirmation_url="url"
+            )
+        )
+
+        async with TestClient(app) as client:
+            response = await client.delete("/items/1", json={"id": 1, "token": token})
+            repeated_response = await client.delete(
+                "/items/1", json={"id": 1, "token": token}
+            )
+            listing = await client.get("/items", query_string={"token": token})
+            # Retained sending of deleted item is neither listed nor received.
+            incoming = await client.get(
+                "/sendings/incoming", query_string={"token": recipient_token}
+            )
+            received = await client.get(
+                "/get/url", query_string={"id": 1, "token": recipient_token}
+            )
+
+        deleted_at = await database.fetch_val(select([items.c.deleted_at]))
+        retained_sendings = await database.fetch_all(sendings.select())
+        purged = await items_module.ItemModel.purge(database, batch_size=10)
+
+        assert response.json() == {"message": "Item successfully deleted"}
+        assert repeated_response.json() == {"message": "No such item"}
+        assert listing.json() == []
+        assert incoming.json()["sendings"] == []
+        assert received.status_code == status.HTTP_404_NOT_FOUND
+        assert deleted_at is not None
+        assert len(retained_sendings) == 1
+        assert purged == 1
+        assert await database.fetch_all(items.select()) == []
+        assert await database.fetch_all(sendings.select()) == []
+
+    finally:
+        await database.execute("TRUNCATE users CASCADE")
+
+
 @pytest.mark.parametrize(
     "user, items_, list_items_request, expected_response",
     # fmt: off
@@ -376,6 +568,91 @@ async def test_list_items(
         await database.execute("TRUNCATE users CASCADE")
 
 
+@pytest.mark.asyncio
+async def test_list_items_negotiated(database: Database) -> None:
+    # MessagePack is served with the optional "compact" extra only.
+    msgpack = pytest.importorskip("msgpack")
+    token = "cca8568a441e4f082527908791ec3bea"
+    user = {
+        "id": 1,
+        "login": "Alex",
+        "password": "sample_password",
+        "token": token,
+        "token_expiration_time": datetime.now() + timedelta(hours=1),
+    }
+    try:
+        await database.execute(users.insert().values(**user))
+        await database.execute_many(
+            items.insert(),
+            values=[
+                {"id": 1, "user_id": 1, "name": "a"},
+                {"id": 2, "user_id": 1, "name": "b"},
+            ],
+        )
+
+        async with TestClient(app) as client:
+            columnar = await client.get(
+                "/items",
+                query_string={"token": token},
+                headers={"Accept": "application/vnd.openweather.columnar+json"},
+            )
+            packed = await client.get(
+                "/items/search",
+                query_string={"token": token, "query": "a"},
+                headers={"Accept": "application/x-msgpack, */*;q=0.8"},
+            )
+
+        assert columnar.headers["Content-Type"] == (
+            "application/vnd.openweather.columnar+json"
+        )
+        assert columnar.json() == {"ids": [1, 2], "names": ["a", "b"]}
+        assert packed.headers["Content-Type"] == "application/msgpack"
+        assert msgpack.unpackb(packed.content) == {
+            "items": [{"id": 1, "name": "a"}],
+            "next_offset": None,
+        }
+
+    finally:
+        await database.execute("TRUNCATE users CASCADE")
+
+
+@pytest.mark.asyncio
+async def test_send_item_to_unknown_recipient_cached(database: Database) -> None:
+    token = "cca8568a441e4f082527908791ec3bea"
+    user = {
+        "id": 101,
+        "login": "Alex",
+        "password": "sample_password",
+        "token": token,
+        "token_expiration_time": datetime.now() + timedelta(hours=1),
+    }
+    send_item_request = {"id": 1, "recipient": "Bob", "token": token}
+    try:
+        await database.execute(users.insert().values(**user))
+        await database.execute(items.insert().values(id=1, user_id=101, name="item"))
+
+        async with TestClient(app) as client:
+            unknown = await client.post("/send", json=send_item_request)
+            # Registered by another worker, this one still has negative entry.
+            await database.execute(
+                users.insert().values(id=102, login="Bob", password="-")
+            )
+            cached = await client.post("/send", json=send_item_request)
+            await client.post(
+                "/registration", json={"login": "Carl", "password": "password"}
+            )
+            registered = await client.post(
+                "/send", json={**send_item_request, "recipient": "Carl"}
+            )
+
+        assert unknown.status_code == status.HTTP_404_NOT_FOUND
+        assert cached.status_code == status.HTTP_404_NOT_FOUND
+        assert registered.status_code == status.HTTP_201_CREATED
+
+    finally:
+        await database.execute("TRUNCATE users CASCADE")
+
+
 @pytest.mark.parametrize(
     "user_a, user_a_items, user_b, send_item_request, expected_status",
     # fmt: off
@@ -616,3 +893,779 @@ async def test_get_item(
 
     finally:
         await database.execute("TRUNCATE users CASCADE")
+
+
+@pytest.mark.asyncio
+async def test_get_item_signed_confirmation_url(
+    monkeypatch, database: Database
+) -> None:
+    items_module = sys.modules["openweather_task.database.models.items"]
+    monkeypatch.setattr(items_module, "SENDING_CONFIRMATION_FORMAT", "signed")
+    monkeypatch.setattr(tokens, "TOKEN_SECRET_KEY", "sample_secret")
+    token_a = "cca8568a441e4f082527908791ec3bea"
+    token_b = "dca8568a441e4f082527908791ec3bea"
+    user_a = {
+        "id": 1,
+        "login": "Alex",
+        "password": "sample_password",
+        "token": token_a,
+        "token_expiration_time": datetime.now() + timedelta(hours=1),
+    }
+    user_b = dict(user_a, id=2, login="Ben", token=token_b)
+    try:
+        await database.execute(users.insert().values(**user_a))
+        await database.execute(users.insert().values(**user_b))
+        await database.execute(items.insert().values(id=1, user_id=1, name="item"))
+
+        async with TestClient(app) as client:
+            sending = await client.post(
+                "/send", json={"id": 1, "recipient": "Ben", "token": token_a}
+            )
+            confirmation_url = sending.json()["confirmation_url"]
+            get_request = {"id": 1, "token": token_b}
+            foreign_response = await client.get(
+                f"/get/{confirmation_url}", query_string=dict(get_request, id=2)
+            )
+            response = await client.get(
+                f"/get/{confirmation_url}", query_string=get_request
+            )
+            repeated_response = await client.get(
+                f"/get/{confirmation_url}", query_string=get_request
+            )
+
+        owner = await database.fetch_val(select([items.c.user_id]))
+
+        assert foreign_response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.status_code == status.HTTP_200_OK
+        assert repeated_response.status_code == status.HTTP_404_NOT_FOUND
+        assert owner == 2
+        assert await database.fetch_all(sendings.select()) == []
+
+    finally:
+        await database.execute("TRUNCATE users CASCADE")
+
+
+@pytest.mark.parametrize(
+    "user, logout_request, expected_status",
+    # fmt: off
+    [
+        # Authorized, tokens revoked.
+        (
+            {
+                "id": 1,
+                "login": "sample_login",
+                "password": "sample_password",
+                "token": "cca8568a441e4f082527908791ec3bea",
+                "token_expiration_time": datetime.now() + timedelta(hours=1),
+            },
+            {"token": "cca8568a441e4f082527908791ec3bea"},
+            status.HTTP_200_OK,
+        ),
+
+        # No user with such token, unauthorized.
+        (
+            None,
+            {"token": "cca8568a441e4f082527908791ec3bea"},
+            status.HTTP_401_UNAUTHORIZED,
+        ),
+    ]
+    # fmt: on
+)
+@pytest.mark.asyncio
+async def test_logout_user(
+    user: JSON,
+    logout_request: JSON,
+    expected_status: int,
+    database: Database,
+) -> None:
+    try:
+        if user:
+            await database.execute(users.insert().values(**user))
+
+        async with TestClient(app) as client:
+            response = await client.post("/logout", json=logout_request)
+            list_response = await client.get("/items", query_string=logout_request)
+
+        assert response.status_code == expected_status
+        assert list_response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    finally:
+        await database.execute("TRUNCATE users CASCADE")
+
+
+@pytest.mark.asyncio
+async def test_signed_token(monkeypatch, database: Database) -> None:
+    users_module = sys.modules["openweather_task.database.models.users"]
+    monkeypatch.setattr(users_module, "TOKEN_FORMAT", "signed")
+    monkeypatch.setattr(tokens, "TOKEN_SECRET_KEY", "sample_secret")
+    tokens.token_revocations.clear()
+    user = {"id": 1, "login": "sample_login", "password": "sample_password"}
+    try:
+        await database.execute(users.insert().values(**user))
+
+        async with TestClient(app) as client:
+            response = await client.post(
+                "/login", json={"login": "sample_login", "password": "sample_password"}
+            )
+            token = response.json()["token"]
+            list_response = await client.get("/items", query_string={"token": token})
+            await client.post("/logout", json={"token": token})
+            revoked_response = await client.get(
+                "/items", query_string={"token": token}
+            )
+            # Worker that didn't handle logout learns revocation from database.
+            tokens.token_revocations.clear()
+            await UserModel.refresh_token_revocations()
+            refreshed_revoked_response = await client.get(
+                "/items", query_string={"token": token}
+            )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert list_response.status_code == status.HTTP_200_OK
+        assert revoked_response.status_code == status.HTTP_401_UNAUTHORIZED
+        assert refreshed_revoked_response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    finally:
+        await database.execute("TRUNCATE users CASCADE")
+
+
+@pytest.mark.asyncio
+async def test_create_item_idempotency_key(database: Database) -> None:
+    user = {
+        "id": 1,
+        "login": "sample_login",
+        "password": "sample_password",
+        "token": "cca8568a441e4f082527908791ec3bea",
+        "token_expiration_time": datetime.now() + timedelta(hours=1),
+    }
+    create_item_request = {
+        "name": "sample_name",
+        "token": "cca8568a441e4f082527908791ec3bea",
+    }
+    headers = {"Idempotency-Key": "create-item-idempotency-key"}
+    try:
+        await database.execute(users.insert().values(**user))
+
+        async with TestClient(app) as client:
+            responses = await asyncio.gather(
+                *[
+                    client.post(
+                        "/items/new", json=create_item_request, headers=headers
+                    )
+                    for _ in range(3)
+                ]
+            )
+            conflicting_response = await client.post(
+                "/items/new",
+                json={**create_item_request, "name": "other_name"},
+                headers=headers,
+            )
+
+        items_count = await database.fetch_val(
+            select([func.count()]).select_from(items)
+        )
+        assert items_count == 1
+        assert all(
+            response.status_code == status.HTTP_201_CREATED for response in responses
+        )
+        assert len({response.content for response in responses}) == 1
+        assert {response.headers["ETag"] for response in responses} == {'"1"'}
+        assert conflicting_response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    finally:
+        await database.execute("TRUNCATE users CASCADE")
+
+
+@pytest.mark.asyncio
+async def test_stale_idempotency_key_taken_over(database: Database) -> None:
+    token = "cca8568a441e4f082527908791ec3bea"
+    user = {
+        "id": 1,
+        "login": "sample_login",
+        "password": "sample_password",
+        "token": token,
+        "token_expiration_time": datetime.now() + timedelta(hours=1),
+    }
+    create_item_request = {"name": "sample_name", "token": token}
+    headers = {"Idempotency-Key": "stale-idempotency-key"}
+    try:
+        await database.execute(users.insert().values(**user))
+        # Reservation of a worker crashed before it stored response.
+        await database.execute(
+            idempotency_keys.insert().values(
+                user_id=1,
+                key="stale-idempotency-key",
+                fingerprint="-",
+                expires_at=datetime.now() - timedelta(seconds=1),
+            )
+        )
+
+        async with TestClient(app) as client:
+            response = await client.post(
+                "/items/new", json=create_item_request, headers=headers
+            )
+            replayed_response = await client.post(
+                "/items/new", json=create_item_request, headers=headers
+            )
+
+        stored = await database.fetch_one(idempotency_keys.select())
+        items_count = await database.fetch_val(
+            select([func.count()]).select_from(items)
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        assert replayed_response.content == response.content
+        assert stored["status_code"] == status.HTTP_201_CREATED
+        assert stored["expires_at"] > datetime.now() + timedelta(hours=1)
+        assert items_count == 1
+
+    finally:
+        await database.execute("TRUNCATE users CASCADE")
+
+
+@pytest.mark.asyncio
+async def test_create_items_batched(monkeypatch, database: Database) -> None:
+    items_module = sys.modules["openweather_task.database.models.items"]
+    monkeypatch.setattr(items_module, "ITEM_CREATE_BATCHING", True)
+    user = {
+        "id": 1,
+        "login": "sample_login",
+        "password": "sample_password",
+        "token": "cca8568a441e4f082527908791ec3bea",
+        "token_expiration_time": datetime.now() + timedelta(hours=1),
+    }
+    try:
+        await database.execute(users.insert().values(**user))
+
+        async with TestClient(app):
+            item_ids = await asyncio.gather(
+                *[items_module.ItemModel.create(f"item_{i}", 1) for i in range(5)]
+            )
+            invalid_user_item, valid_item = await asyncio.gather(
+                items_module.ItemModel.create("no_such_user_item", 99),
+                items_module.ItemModel.create("item_5", 1),
+                return_exceptions=True,
+            )
+
+        assert isinstance(invalid_user_item, Exception)
+        created_items = await database.fetch_all(
+            select([items.c.id, items.c.name]).order_by(items.c.id)
+        )
+        assert [(item["id"], item["name"]) for item in created_items] == list(
+            zip(item_ids + [valid_item], [f"item_{i}" for i in range(6)])
+        )
+
+    finally:
+        await database.execute("TRUNCATE users CASCADE")
+
+
+@pytest.mark.parametrize(
+    "search_items_request, expected_response",
+    # fmt: off
+    [
+        # Prefix matches first, then by match position and name length.
+        (
+            {"token": "cca8568a441e4f082527908791ec3bea", "query": "sword"},
+            {
+                "items": [
+                    {"id": 2, "name": "Sword"},
+                    {"id": 3, "name": "Sword of fire"},
+                    {"id": 1, "name": "Long sword"},
+                ],
+                "next_offset": None,
+            },
+        ),
+
+        # Paginated results.
+        (
+            {
+                "token": "cca8568a441e4f082527908791ec3bea",
+                "query": "sword",
+                "limit": 2,
+            },
+            {
+                "items": [
+                    {"id": 2, "name": "Sword"},
+                    {"id": 3, "name": "Sword of fire"},
+                ],
+                "next_offset": 2,
+            },
+        ),
+
+        # LIKE wildcards are matched literally.
+        (
+            {"token": "cca8568a441e4f082527908791ec3bea", "query": "%"},
+            {"items": [{"id": 5, "name": "100% shield"}], "next_offset": None},
+        ),
+    ]
+    # fmt: on
+)
+@pytest.mark.asyncio
+async def test_search_items(
+    search_items_request: JSON,
+    expected_response: JSON,
+    database: Database,
+) -> None:
+    user = {
+        "id": 1,
+        "login": "sample_login",
+        "password": "sample_password",
+        "token": "cca8568a441e4f082527908791ec3bea",
+        "token_expiration_time": datetime.now() + timedelta(hours=1),
+    }
+    other_user = {"id": 2, "login": "other_login", "password": "sample_password"}
+    items_ = [
+        {"id": 1, "user_id": 1, "name": "Long sword"},
+        {"id": 2, "user_id": 1, "name": "Sword"},
+        {"id": 3, "user_id": 1, "name": "Sword of fire"},
+        {"id": 4, "user_id": 2, "name": "Sword"},
+        {"id": 5, "user_id": 1, "name": "100% shield"},
+    ]
+    try:
+        await database.execute(users.insert().values(**user))
+        await database.execute(users.insert().values(**other_user))
+        await database.execute_many(items.insert(), values=items_)
+
+        async with TestClient(app) as client:
+            response = await client.get(
+                "/items/search", query_string=search_items_request
+            )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == expected_response
+
+    finally:
+        await database.execute("TRUNCATE users CASCADE")
+
+
+@pytest.mark.asyncio
+async def test_list_item_changes(database: Database) -> None:
+    user_a = {
+        "id": 1,
+        "login": "Alex",
+        "password": "sample_password",
+        "token": "cca8568a441e4f082527908791ec3bea",
+        "token_expiration_time": datetime.now() + timedelta(hours=1),
+    }
+    user_b = {
+        "id": 2,
+        "login": "Ben",
+        "password": "sample_password",
+        "token": "b5a1e0d6c3f24a9e8d7c6b5a4f3e2d1c",
+        "token_expiration_time": datetime.now() + timedelta(hours=1),
+    }
+    token_a = {"token": user_a["token"]}
+    token_b = {"token": user_b["token"]}
+    try:
+        await database.execute(users.insert().values(**user_a))
+        await database.execute(users.insert().values(**user_b))
+
+        async with TestClient(app) as client:
+            cursor = await client.get("/items/changes", query_string=token_a)
+            first_item = await client.post(
+                "/items/new", json={"name": "item_1", **token_a}
+            )
+            second_item = await client.post(
+                "/items/new", json={"name": "item_2", **token_a}
+            )
+            first_item_id = first_item.json()["id"]
+            second_item_id = second_item.json()["id"]
+            sending = await client.post(
+                "/send", json={"id": first_item_id, "recipient": "Ben", **token_a}
+            )
+            await client.get(
+                f"/get/{sending.json()['confirmation_url']}",
+                query_string={"id": first_item_id, **token_b},
+            )
+            await client.delete(
+                f"/items/{second_item_id}", json={"id": second_item_id, **token_a}
+            )
+            changes_a = await client.get(
+                "/items/changes",
+                query_string={"since": cursor.json()["last_seq"], **token_a},
+            )
+            changes_b = await client.get(
+                "/items/changes", query_string={"since": 0, **token_b}
+            )
+
+            await database.execute("DELETE FROM item_changes WHERE seq = 1")
+            compacted_changes_a = await client.get(
+                "/items/changes", query_string={"since": 0, **token_a}
+            )
+
+        assert cursor.json() == {"changes": [], "last_seq": 0, "has_more": False}
+        assert changes_a.json() == {
+            "changes": [
+                {
+                    "seq": 1,
+                    "operation": "upsert",
+                    "item_id": first_item_id,
+                    "name": "item_1",
+                },
+                {
+                    "seq": 2,
+                    "operation": "upsert",
+                    "item_id": second_item_id,
+                    "name": "item_2",
+                },
+                {
+                    "seq": 3,
+                    "operation": "delete",
+                    "item_id": first_item_id,
+                    "name": None,
+                },
+                {
+                    "seq": 4,
+                    "operation": "delete",
+                    "item_id": second_item_id,
+                    "name": None,
+                },
+            ],
+            "last_seq": 4,
+            "has_more": False,
+        }
+        assert changes_b.json() == {
+            "changes": [
+                {
+                    "seq": 1,
+                    "operation": "upsert",
+                    "item_id": first_item_id,
+                    "name": "item_1",
+                },
+            ],
+            "last_seq": 1,
+            "has_more": False,
+        }
+        assert compacted_changes_a.status_code == status.HTTP_410_GONE
+
+    finally:
+        await database.execute("TRUNCATE users CASCADE")
+
+
+@pytest.mark.asyncio
+async def test_sending_events(database: Database) -> None:
+    user_a = {"id": 1, "login": "Alex", "password": "sample_password"}
+    user_b = {
+        "id": 2,
+        "login": "Ben",
+        "password": "sample_password",
+        "token": "cca8568a441e4f082527908791ec3bea",
+        "token_expiration_time": datetime.now() + timedelta(hours=1),
+    }
+    try:
+        await database.execute(users.insert().values(**user_a))
+        await database.execute(users.insert().values(**user_b))
+        await database.execute(items.insert().values(id=1, user_id=1, name="item"))
+
+        async with TestClient(app) as client:
+            with sending_events.subscribe(2) as queue:
+                confirmation_url = await SendingModel.initiate_sending(
+                    from_user_id=1, to_user_id=2, item_id=1
+                )
+                created_event = await asyncio.wait_for(queue.get(), timeout=5)
+
+                await client.get(
+                    f"/get/{confirmation_url}",
+                    query_string={"id": 1, "token": user_b["token"]},
+                )
+                completed_event = await asyncio.wait_for(queue.get(), timeout=5)
+
+        assert created_event == {
+            "event": "sending_created",
+            "user_ids": [2],
+            "item_id": 1,
+            "from_user_id": 1,
+            "to_user_id": 2,
+            "confirmation_url": confirmation_url,
+        }
+        assert completed_event["event"] == "sending_completed"
+        assert completed_event["user_ids"] == [1, 2]
+
+    finally:
+        await database.execute("TRUNCATE users CASCADE")
+
+
+@pytest.mark.parametrize(
+    "route, list_sendings_request, expected_response",
+    # fmt: off
+    [
+        # Incoming sendings, first page.
+        (
+            "/sendings/incoming",
+            {"token": "cca8568a441e4f082527908791ec3bea", "limit": 1},
+            {
+                "sendings": [
+                    {
+                        "id": 1,
+                        "item_id": 1,
+                        "item_name": "item_name_1",
+                        "from_user_id": 1,
+                        "to_user_id": 2,
+                        "confirmation_url": "3ciaK7RvNsBgY-ehrkqZtg",
+                    },
+                ],
+                "next_after_id": 1,
+            },
+        ),
+
+        # Incoming sendings, last page.
+        (
+            "/sendings/incoming",
+            {"token": "cca8568a441e4f082527908791ec3bea", "after_id": 1},
+            {
+                "sendings": [
+                    {
+                        "id": 3,
+                        "item_id": 3,
+                        "item_name": "item_name_3",
+                        "from_user_id": 1,
+                        "to_user_id": 2,
+                        "confirmation_url": "Qx2mVJ8s0Hc5d-Uq1bGm8A",
+                    },
+                ],
+                "next_after_id": None,
+            },
+        ),
+
+        # Outgoing sendings.
+        (
+            "/sendings/outgoing",
+            {"token": "cca8568a441e4f082527908791ec3bea"},
+            {
+                "sendings": [
+                    {
+                        "id": 2,
+                        "item_id": 2,
+                        "item_name": "item_name_2",
+                        "from_user_id": 2,
+                        "to_user_id": 1,
+                        "confirmation_url": "b7Yk3pLq9XwZt-2cRs4uVw",
+                    },
+                ],
+                "next_after_id": None,
+            },
+        ),
+    ]
+    # fmt: on
+)
+@pytest.mark.asyncio
+async def test_list_sendings(
+    route: str,
+    list_sendings_request: JSON,
+    expected_response: JSON,
+    database: Database,
+) -> None:
+    user_a = {"id": 1, "login": "Alex", "password": "sample_password"}
+    user_b = {
+        "id": 2,
+        "login": "Ben",
+        "password": "sample_password",
+        "token": "cca8568a441e4f082527908791ec3bea",
+        "token_expiration_time": datetime.now() + timedelta(hours=1),
+    }
+    items_ = [
+        {"id": 1, "user_id": 1, "name": "item_name_1"},
+        {"id": 2, "user_id": 2, "name": "item_name_2"},
+        {"id": 3, "user_id": 1, "name": "item_name_3"},
+    ]
+    sendings_ = [
+        {
+            "id": 1,
+            "item_id": 1,
+            "from_user_id": 1,
+            "to_user_id": 2,
+            "confirmation_url": "3ciaK7RvNsBgY-ehrkqZtg",
+        },
+        {
+            "id": 2,
+            "item_id": 2,
+            "from_user_id": 2,
+            "to_user_id": 1,
+            "confirmation_url": "b7Yk3pLq9XwZt-2cRs4uVw",
+        },
+        {
+            "id": 3,
+            "item_id": 3,
+            "from_user_id": 1,
+            "to_user_id": 2,
+            "confirmation_url": "Qx2mVJ8s0Hc5d-Uq1bGm8A",
+        },
+    ]
+    try:
+        await database.execute(users.insert().values(**user_a))
+        await database.execute(users.insert().values(**user_b))
+        await database.execute_many(items.insert(), values=items_)
+        await database.execute_many(sendings.insert(), values=sendings_)
+
+        async with TestClient(app) as client:
+            response = await client.get(route, query_string=list_sendings_request)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == expected_response
+
+    finally:
+        await database.execute("TRUNCATE users CASCADE")
+
+
+@pytest.mark.asyncio
+async def test_batch(monkeypatch, database: Database) -> None:
+    items_module = sys.modules["openweather_task.database.models.items"]
+    # Inside transaction inserts must bypass coalescer to be rolled back.
+    monkeypatch.setattr(items_module, "ITEM_CREATE_BATCHING", True)
+    token = "cca8568a441e4f082527908791ec3bea"
+    await database.execute(
+        users.insert().values(
+            id=1,
+            login="Alex",
+            password="sample_password",
+            token=token,
+            token_expiration_time=datetime.now() + timedelta(hours=1),
+        )
+    )
+    await database.execute(users.insert().values(id=2, login="Bob", password="-"))
+    try:
+        async with TestClient(app) as client:
+            response = await client.post(
+                "/batch",
+                json={
+                    "token": token,
+                    "operations": [
+                        {"op": "create_item", "args": {"name": "item"}},
+                        {
+                            "op": "send_item",
+                            "args": {"id": "$0.id", "recipient": "Bob"},
+                        },
+                        {"op": "get_user_item", "args": {"id": 404}},
+                        {"op": "list_items"},
+                    ],
+                },
+            )
+            rolled_back_response = await client.post(
+                "/batch",
+                json={
+                    "token": token,
+                    "transaction": True,
+                    "operations": [
+                        {"op": "create_item", "args": {"name": "rolled back"}},
+                        {"op": "get_user_item", "args": {"id": 404}},
+                        {"op": "list_items"},
+                    ],
+                },
+            )
+
+        created, sent, missing, listed = response.json()["results"]
+        assert created["status"] == status.HTTP_201_CREATED
+        assert created["headers"] == {"ETag": '"1"'}
+        assert sent["status"] == status.HTTP_201_CREATED
+        assert "confirmation_url" in sent["body"]
+        assert missing == {
+            "status": status.HTTP_404_NOT_FOUND,
+            "body": {"detail": "No such item"},
+            "headers": {},
+        }
+        assert listed["body"] == [{"id": created["body"]["id"], "name": "item"}]
+
+        assert [
+            result["status"] for result in rolled_back_response.json()["results"]
+        ] == [
+            status.HTTP_424_FAILED_DEPENDENCY,
+            status.HTTP_404_NOT_FOUND,
+            status.HTTP_424_FAILED_DEPENDENCY,
+        ]
+        assert await database.fetch_val(select([func.count()]).select_from(items)) == 1
+
+    finally:
+        await database.execute("TRUNCATE users CASCADE")
+
+
+@pytest.mark.asyncio
+async def test_sliding_token_expiration(monkeypatch, database: Database) -> None:
+    users_module = sys.modules["openweather_task.database.models.users"]
+    monkeypatch.setattr(users_module, "TOKEN_SLIDING_EXPIRATION", True)
+    now = datetime.now()
+    stale_token = "cca8568a441e4f082527908791ec3bea"
+    fresh_token = "f3a8568a441e4f082527908791ec3bea"
+    # Refreshed within refresh interval, so left as is.
+    fresh_expiration_time = now + timedelta(hours=24, minutes=-1)
+    await database.execute_many(
+        users.insert(),
+        values=[
+            {
+                "id": 1,
+                "login": "Alex",
+                "password": "-",
+                "token": stale_token,
+                "token_expiration_time": now + timedelta(hours=1),
+            },
+            {
+                "id": 2,
+                "login": "Bob",
+                "password": "-",
+                "token": fresh_token,
+                "token_expiration_time": fresh_expiration_time,
+            },
+        ],
+    )
+    try:
+        async with TestClient(app) as client:
+            for token in (stale_token, stale_token, fresh_token):
+                response = await client.get("/items", query_string={"token": token})
+                assert response.status_code == status.HTTP_200_OK
+            # Buffered refreshes are flushed on shutdown.
+
+        expiration_times = {
+            user["login"]: user["token_expiration_time"]
+            for user in await database.fetch_all(users.select())
+        }
+        assert expiration_times["Alex"] >= now + timedelta(hours=24)
+        assert expiration_times["Bob"] == fresh_expiration_time
+
+    finally:
+        await database.execute("TRUNCATE users CASCADE")
+
+
+async def probe_health_while_shutting_down() -> List[Any]:
+    client = TestClient(app)
+    await client.__aenter__()
+    await health_checker.check()
+    responses = [await client.get("/healthz"), await client.get("/readyz")]
+    shutdown = asyncio.ensure_future(client.__aexit__(None, None, None))
+    await asyncio.sleep(0.05)
+    responses.append(await client.get("/readyz"))
+    responses.append(shutdown.done())
+    await shutdown
+    return responses
+
+
+@pytest.mark.asyncio
+async def test_health_probes(monkeypatch) -> None:
+    monkeypatch.setattr(main, "SHUTDOWN_DRAIN_SECONDS", 0.2)
+    (
+        liveness,
+        readiness,
+        draining_readiness,
+        shut_down_while_draining,
+    ) = await probe_health_while_shutting_down()
+
+    assert liveness.json() == {"status": "ok"}
+    assert readiness.status_code == status.HTTP_200_OK
+    assert readiness.json()["shards"][0]["up"] is True
+    assert "idle" in readiness.json()["pool"]
+    assert draining_readiness.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert draining_readiness.json()["draining"] is True
+    assert shut_down_while_draining is False
+
+
+def test_health_probes_under_uvloop(monkeypatch) -> None:
+    # Server workers run uvloop, so startup and shutdown must not rely on
+    # internals of asyncio's loop.
+    monkeypatch.setattr(main, "SHUTDOWN_DRAIN_SECONDS", 0.2)
+    loop = uvloop.new_event_loop()
+    try:
+        _, readiness, draining_readiness, _ = loop.run_until_complete(
+            probe_health_while_shutting_down()
+        )
+    finally:
+        loop.close()
+
+    assert readiness.status_code == status.HTTP_200_OK
+    assert draining_readiness.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
@@ -0,0 +1,83 @@
+from datetime import datetime
+from typing import Dict, List
+
+import pytest
+from async_asgi_testclient import TestClient
+from databases import Database
+from sqlalchemy import func, select
+from starlette import status
+
+from openweather_task.database.models import items, sendings, users
+from openweather_task.main import app
+from openweather_task.seeding import DatasetGenerator, DatasetSpec, ShardRows, seed
+
+NOW = datetime(2020, 1, 1)
+
+
+def generate(spec: DatasetSpec) -> List[Dict[int, ShardRows]]:
+    return list(DatasetGenerator(spec, [0], [0], [0]).blocks())
+
+
+def rows(blocks: List[Dict[int, ShardRows]], table: str) -> list:
+    return [
+        row
+        for block in blocks
+        for shard in block.values()
+        for row in getattr(shard, table)
+    ]
+
+
+def test_same_seed_same_dataset() -> None:
+    spec = DatasetSpec(users=300, seed=7, pending_sendings=0.5, block_size=100, now=NOW)
+    first, second = generate(spec), generate(spec)
+    other = generate(
+        DatasetSpec(users=300, seed=8, pending_sendings=0.5, block_size=100, now=NOW)
+    )
+
+    for table in ("users", "items", "sendings"):
+        assert rows(first, table) == rows(second, table)
+    assert rows(first, "items") != rows(other, "items")
+
+
+def test_sendings_between_different_users() -> None:
+    blocks = generate(
+        DatasetSpec(users=200, seed=1, pending_sendings=1, block_size=50, now=NOW)
+    )
+    owners = {item_id: user_id for item_id, user_id, _ in rows(blocks, "items")}
+
+    assert len(rows(blocks, "sendings")) == len(owners)
+    for _, item_id, from_user_id, to_user_id, _ in rows(blocks, "sendings"):
+        assert owners[item_id] == from_user_id
+        assert to_user_id != from_user_id
+
+
+@pytest.mark.asyncio
+async def test_seeded_user_authorized(database: Database) -> None:
+    spec = DatasetSpec(users=50, seed=3, token_share=1, expired_token_share=0, now=NOW)
+    try:
+        async with TestClient(app) as client:
+            assert await seed(spec) > 50
+
+            response = await client.post(
+                "/login", json={"login": "user0", "password": "password"}
+            )
+            token = response.json()["token"]
+            listing = await client.get("/items", query_string={"token": token})
+
+        user_id = await database.fetch_val(
+            select([users.c.id]).where(users.c.login == "user0")
+        )
+        user_items = await database.fetch_val(
+            select([func.count()]).where(items.c.user_id == user_id)
+        )
+        next_item_id = await database.fetch_val("SELECT nextval('items_id_seq')")
+        max_item_id = await database.fetch_val(select([func.max(items.c.id)]))
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert listing.status_code == status.HTTP_200_OK
+        assert len(listing.json()) == user_items
+        assert next_item_id == max_item_id + 1
+        assert await database.fetch_val(select([func.count()]).select_from(sendings))
+
+    finally:
+        await database.execute("TRUNCATE users RESTART IDENTITY CASCADE")
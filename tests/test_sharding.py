@@ -0,0 +1,131 @@
+import pytest
+from databases import Database
+from sqlalchemy import select
+
+from openweather_task.database import shards
+from openweather_task.database.models import (
+    ItemModel,
+    OutboxModel,
+    SendingModel,
+    SendingStatus,
+    inbox_messages,
+    item_changes,
+    items,
+    outbox_messages,
+    sendings,
+    users,
+)
+from openweather_task.database.sharding import ShardRouter
+
+from .conftest import POSTGRES_TEST_SERVER_URI
+
+
+@pytest.fixture
+async def two_shards(database: Database, monkeypatch) -> Database:
+    # Both shards point to the test database, so cross-shard protocol runs
+    # against one schema. User 2 is routed to the first shard, user 1 to other.
+    other_shard = Database(POSTGRES_TEST_SERVER_URI)
+    await other_shard.connect()
+    monkeypatch.setattr(shards, "databases", [database, other_shard])
+    yield other_shard
+    await other_shard.disconnect()
+
+
+def make_router(count: int) -> ShardRouter:
+    return ShardRouter(
+        [Database(f"postgresql://localhost/shard_{index}") for index in range(count)]
+    )
+
+
+def test_login_and_id_resolve_to_same_shard() -> None:
+    router = make_router(4)
+    user_id = 10 * router.count + router.index_for_login("Alex")
+
+    assert router.for_user(user_id) is router.for_login("Alex")
+
+
+def test_token_carries_shard() -> None:
+    router = make_router(4)
+    token = router.tag_token(user_id=6, token="cca8568a441e4f08")
+
+    assert token == "2-cca8568a441e4f08"
+    assert router.for_token(token) is router.databases[2]
+    assert router.for_token("cca8568a441e4f08") is None
+    assert router.for_token("7-cca8568a441e4f08") is None
+
+
+def test_single_shard_token_untagged() -> None:
+    router = make_router(1)
+
+    assert router.tag_token(user_id=6, token="cca8568a441e4f08") == "cca8568a441e4f08"
+    assert router.for_token("cca8568a441e4f08") is router.databases[0]
+
+
+@pytest.mark.asyncio
+async def test_cross_shard_sending(database: Database, two_shards: Database) -> None:
+    try:
+        await database.execute(users.insert().values(id=1, login="A", password="-"))
+        await database.execute(users.insert().values(id=2, login="B", password="-"))
+        await database.execute(items.insert().values(id=1, user_id=1, name="item"))
+        await database.execute(
+            sendings.insert().values(
+                id=1, item_id=1, from_user_id=1, to_user_id=2, confirmation_url="url"
+            )
+        )
+
+        sending_status = await SendingModel.complete_sending(
+            to_user_id=2, item_id=1, confirmation_url="url"
+        )
+
+        assert sending_status == SendingStatus.COMPLETED
+        assert await ItemModel.get(1, user_id=1) is None
+        assert dict(await ItemModel.get(1, user_id=2)) == {
+            "user_id": 2,
+            "id": 1,
+            "name": "item",
+            "version": 2,
+        }
+        assert await database.fetch_all(outbox_messages.select()) == []
+        assert await database.fetch_all(inbox_messages.select()) == []
+        changes = await database.fetch_all(
+            select([item_changes.c.user_id, item_changes.c.operation]).order_by(
+                item_changes.c.user_id
+            )
+        )
+        assert [(change["user_id"], change["operation"]) for change in changes] == [
+            (1, "delete"),
+            (2, "upsert"),
+        ]
+
+    finally:
+        await database.execute(
+            "TRUNCATE users, outbox_messages, inbox_messages CASCADE"
+        )
+
+
+@pytest.mark.asyncio
+async def test_redelivered_message_skipped(
+    database: Database, two_shards: Database
+) -> None:
+    try:
+        await database.execute(users.insert().values(id=2, login="B", password="-"))
+        await OutboxModel.enqueue(
+            two_shards,
+            target_shard=0,
+            kind="item_transfer",
+            payload=dict(item_id=1, name="item", from_user_id=1, to_user_id=2),
+        )
+        message_id = await database.fetch_val(select([outbox_messages.c.id]))
+        # Applied before relay crashed, outbox message wasn't deleted.
+        await database.execute(
+            inbox_messages.insert().values(source_shard=1, message_id=message_id)
+        )
+
+        assert await OutboxModel.relay(shard_index=1) == 1
+        assert await database.fetch_all(items.select()) == []
+        assert await database.fetch_all(outbox_messages.select()) == []
+
+    finally:
+        await database.execute(
+            "TRUNCATE users, outbox_messages, inbox_messages CASCADE"
+        )
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+from async_asgi_testclient import TestClient
+from asyncpg.exceptions import QueryCanceledError
+from fastapi import APIRouter, FastAPI
+
+from openweather_task.database.timeouts import DeadlineDatabase, statement_deadline
+from openweather_task.middleware import CancelOnDisconnectMiddleware
+from openweather_task.routers import timeouts
+from openweather_task.routers.timeouts import (
+    TimedRoute,
+    parse_route_timeouts,
+    route_timeout,
+)
+
+from .conftest import POSTGRES_TEST_SERVER_URI
+
+
+@pytest.fixture
+async def deadline_database():
+    database = DeadlineDatabase(POSTGRES_TEST_SERVER_URI, min_size=1, max_size=1)
+    await database.connect()
+    yield database
+    await database.disconnect()
+
+
+def make_app(database: DeadlineDatabase) -> FastAPI:
+    router = APIRouter(route_class=TimedRoute)
+
+    @router.get("/sleep")
+    async def sleep() -> int:
+        return await database.fetch_val("SELECT pg_sleep(1)::text IS NULL")
+
+    app = FastAPI()
+    app.include_router(router)
+    return app
+
+
+async def assert_pool_released(database: DeadlineDatabase) -> None:
+    pool = database._backend._pool
+    assert pool.get_idle_size() == pool.get_size()
+    # The only connection is reusable, without timeout of previous request.
+    assert await database.fetch_val("SHOW statement_timeout") == "0"
+
+
+def test_route_timeouts() -> None:
+    spec = "GET /items/{id}=0.5; POST /send=2;*=10"
+    parsed = parse_route_timeouts(spec)
+
+    assert route_timeout(parsed, "GET", "/items/{id}") == 0.5
+    assert route_timeout(parsed, "POST", "/send") == 2
+    assert route_timeout(parsed, "DELETE", "/items/{id}") == 10
+    assert route_timeout(parse_route_timeouts(""), "GET", "/items") is None
+
+
+@pytest.mark.asyncio
+async def test_statement_deadline(deadline_database: DeadlineDatabase) -> None:
+    with statement_deadline(0.05):
+        with pytest.raises(QueryCanceledError):
+            await deadline_database.fetch_val("SELECT pg_sleep(1)")
+
+    await assert_pool_released(deadline_database)
+
+
+@pytest.mark.asyncio
+async def test_route_statement_timeout(
+    deadline_database: DeadlineDatabase, monkeypatch
+) -> None:
+    monkeypatch.setattr(timeouts, "route_timeouts", parse_route_timeouts("*=0.05"))
+
+    async with TestClient(make_app(deadline_database)) as client:
+        response = await client.get("/sleep")
+
+    assert response.status_code == 503
+    await assert_pool_released(deadline_database)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_request_releases_connection(
+    deadline_database: DeadlineDatabase,
+) -> None:
+    app = CancelOnDisconnectMiddleware(make_app(deadline_database))
+    messages = [{"type": "http.request", "body": b""}, {"type": "http.disconnect"}]
+    sent = []
+
+    async def receive():  # type: ignore
+        message = messages.pop(0)
+        if message["type"] == "http.disconnect":
+            await asyncio.sleep(0.1)
+        return message
+
+    async def send(message):  # type: ignore
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/sleep",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+    }
+    await asyncio.wait_for(app(scope, receive, send), 0.5)
+
+    assert sent == []
+    await assert_pool_released(deadline_database)
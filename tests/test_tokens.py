@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from openweather_task.security import tokens
+from openweather_task.security.tokens import (
+    TokenRevocations,
+    is_signed_token,
+    sign_confirmation_url,
+    sign_token,
+    verify_confirmation_url,
+    verify_token,
+)
+
+
+@pytest.fixture(autouse=True)
+def secret_key(monkeypatch) -> None:
+    monkeypatch.setattr(tokens, "TOKEN_SECRET_KEY", "sample_secret")
+    monkeypatch.setattr(tokens, "token_revocations", TokenRevocations(ttl_seconds=60))
+
+
+def test_signed_token_verified() -> None:
+    token = sign_token(user_id=1, login="Alex", generation=0, ttl_seconds=60)
+
+    assert is_signed_token(token)
+    assert verify_token(token) == {"id": 1, "login": "Alex"}
+
+
+def test_expired_token_rejected() -> None:
+    token = sign_token(user_id=1, login="Alex", generation=0, ttl_seconds=-1)
+
+    assert verify_token(token) is None
+
+
+def test_tampered_token_rejected() -> None:
+    token = sign_token(user_id=1, login="Alex", generation=0, ttl_seconds=60)
+    forged = sign_token(user_id=2, login="Ben", generation=0, ttl_seconds=60)
+    _, _, signature = token.partition(".")
+    forged_payload, _, _ = forged.partition(".")
+
+    assert verify_token(f"{forged_payload}.{signature}") is None
+
+
+def test_non_ascii_token_rejected() -> None:
+    token = sign_token(user_id=1, login="Alex", generation=0, ttl_seconds=60)
+    payload, _, _ = token.partition(".")
+
+    assert verify_token(f"{payload}.подпись") is None
+    assert verify_token("токен.подпись") is None
+    assert verify_confirmation_url("ссылка.подпись") is None
+
+
+def test_revoked_token_rejected() -> None:
+    token = sign_token(user_id=1, login="Alex", generation=0, ttl_seconds=60)
+    tokens.token_revocations.revoke(
+        user_id=1, generation=1, revoked_at=datetime.now()
+    )
+
+    assert verify_token(token) is None
+    assert verify_token(
+        sign_token(user_id=1, login="Alex", generation=1, ttl_seconds=60)
+    ) == {"id": 1, "login": "Alex"}
+
+
+def test_token_revocations_merged() -> None:
+    revocations = TokenRevocations(ttl_seconds=60)
+    now = datetime.now()
+    revocations.revoke(user_id=1, generation=2, revoked_at=now)
+    # Loaded before the revocation above, older ones have expired tokens.
+    revocations.update(
+        [
+            (1, 1, now - timedelta(seconds=10)),
+            (2, 1, now - timedelta(seconds=10)),
+            (3, 1, now - timedelta(seconds=61)),
+        ]
+    )
+
+    assert revocations.is_revoked(user_id=1, generation=1)
+    assert revocations.is_revoked(user_id=2, generation=0)
+    assert not revocations.is_revoked(user_id=3, generation=0)
+
+
+def test_opaque_token_is_not_signed() -> None:
+    assert not is_signed_token("cca8568a441e4f082527908791ec3bea")
+
+
+def test_confirmation_url_verified() -> None:
+    url = sign_confirmation_url(
+        item_id=3, version=2, from_user_id=1, to_user_id=2, ttl_seconds=60
+    )
+
+    assert is_signed_token(url)
+    assert verify_confirmation_url(url) == {
+        "item_id": 3,
+        "version": 2,
+        "from_user_id": 1,
+        "to_user_id": 2,
+    }
+
+
+def test_confirmation_url_and_token_not_interchangeable() -> None:
+    url = sign_confirmation_url(
+        item_id=3, version=2, from_user_id=1, to_user_id=2, ttl_seconds=60
+    )
+    token = sign_token(user_id=1, login="Alex", generation=0, ttl_seconds=60)
+
+    assert verify_token(url) is None
+    assert verify_confirmation_url(token) is None
@@ -0,0 +1,123 @@
+import json
+from datetime import datetime, timedelta
+from typing import List
+
+import pytest
+from async_asgi_testclient import TestClient
+from databases import Database
+
+from openweather_task.database.models import items, users
+from openweather_task.main import app
+from openweather_task.middleware import TracingMiddleware
+from openweather_task.tracing import JsonLinesExporter, Span, SpanExporter, Tracer
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+TRACEPARENT = f"00-{TRACE_ID}-00f067aa0ba902b7-01"
+
+
+class ListExporter(SpanExporter):
+    def __init__(self) -> None:
+        self.spans: List[Span] = []
+
+    def export(self, spans: List[Span]) -> None:
+        self.spans.extend(spans)
+
+
+def make_tracer(sample_rate: float) -> Tracer:
+    return Tracer(ListExporter(), sample_rate=sample_rate, max_pending_spans=100)
+
+
+@pytest.mark.asyncio
+async def test_unsampled_trace_not_recorded() -> None:
+    tracer = make_tracer(sample_rate=0)
+    with tracer.trace("GET /items") as span:
+        with tracer.span("child") as child:
+            pass
+    with tracer.trace("GET /items", traceparent=TRACEPARENT[:-2] + "00") as parent:
+        pass
+    await tracer.flush()
+
+    assert span is None and child is None and parent is None
+    assert tracer.exporter.spans == []
+
+
+@pytest.mark.asyncio
+async def test_failed_request_traced() -> None:
+    tracer = make_tracer(sample_rate=1)
+
+    async def failing_app(scope, receive, send):  # type: ignore
+        with tracer.span("child"):
+            raise ValueError("failed")
+
+    scope = {"type": "http", "method": "GET", "path": "/items", "headers": []}
+    with pytest.raises(ValueError):
+        await TracingMiddleware(failing_app, tracer=tracer)(scope, None, None)
+    await tracer.flush()
+
+    root, child = sorted(tracer.exporter.spans, key=lambda span: span.name)
+    assert root.name == "GET /items" and child.name == "child"
+    assert root.error == child.error == "ValueError('failed')"
+    assert root.attributes["http.status_code"] == 500
+    assert child.parent_id == root.span_id
+
+
+@pytest.mark.asyncio
+async def test_remote_parent_continued(tmp_path) -> None:
+    tracer = Tracer(
+        JsonLinesExporter(str(tmp_path / "traces.jsonl")),
+        sample_rate=0,
+        max_pending_spans=100,
+    )
+    with tracer.trace("GET /items", traceparent=TRACEPARENT):
+        with tracer.span("child", answer=42):
+            pass
+    await tracer.flush()
+
+    with open(tmp_path / "traces.jsonl") as file:
+        root, child = sorted(
+            (json.loads(line) for line in file), key=lambda span: span["name"]
+        )
+    assert root["trace_id"] == child["trace_id"] == TRACE_ID
+    assert root["parent_id"] == "00f067aa0ba902b7"
+    assert child["parent_id"] == root["span_id"]
+    assert child["attributes"] == {"answer": 42}
+
+
+@pytest.mark.asyncio
+async def test_request_traced(database: Database) -> None:
+    tracer = make_tracer(sample_rate=1)
+    token = "cca8568a441e4f082527908791ec3bea"
+    user = {
+        "id": 1,
+        "login": "Alex",
+        "password": "sample_password",
+        "token": token,
+        "token_expiration_time": datetime.now() + timedelta(hours=1),
+    }
+    try:
+        await database.execute(users.insert().values(**user))
+        await database.execute(items.insert().values(id=1, user_id=1, name="item"))
+
+        async with TestClient(TracingMiddleware(app, tracer=tracer)) as client:
+            response = await client.get(
+                "/items/1",
+                query_string={"token": token},
+                headers={"traceparent": TRACEPARENT},
+            )
+        await tracer.flush()
+
+        spans = {span.name: span for span in tracer.exporter.spans}
+        root = spans["GET /items/{id}"]
+
+        assert response.headers["traceresponse"] == root.traceparent
+        assert root.attributes["http.status_code"] == 200
+        assert {span.trace_id for span in spans.values()} == {TRACE_ID}
+        assert spans["handler get_user_item"].parent_id == root.span_id
+        assert (
+            spans["ItemModel.get"].parent_id
+            == spans["handler get_user_item"].span_id
+        )
+        assert {"UserModel.get_authorized", "db.acquire", "db.query"} <= set(spans)
+
+    finally:
+        await database.execute("TRUNCATE users CASCADE")